@@ -1,11 +1,48 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import pandas as pd
+import numpy as np
 import os
-from datetime import datetime
-from zoneinfo import ZoneInfo  # Python 3.9+
-import threading
+import queue
+import time
 from tkinter import font
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from comment_core import (
+    DISPLAY_TIMEZONE, LOAD_COLUMNS, detect_encoding, iter_csv_chunks, read_comments_csv, complete_lines_end,
+    read_anchor, read_appended_rows, sort_orders, format_timestamp, TIMEZONES
+)
+from comment_cache import DEFAULT_MAX_BYTES, file_signature, load_dataset, store_dataset
+from comment_db import CommentDatabase, DbQueryEngine, import_csv, open_database
+from comment_export import save_txt, save_table
+from comment_jobs import Job, JobScheduler, PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NAMES, PRIORITY_NORMAL, QUEUED, RUNNING
+from comment_parallel import build_store_parallel
+from comment_profile import Profiler, activate, stage
+from comment_query import Query, QueryEngine, parse_int, parse_time
+from comment_search import SearchIndex
+from comment_store import CommentStore, build_store, walk
+
+class UiJob(Job):
+    # 一次加载/刷新/重绘任务；界面更新按任务编号过滤，取消后剩余更新将被丢弃
+    def __init__(self, job_id, lazy, run_id=None, label=""):
+        super().__init__(label)
+        self.id = job_id
+        self.lazy = lazy
+        self.run_id = run_id  # 计时记录所属的运行
+        # 处理选项在开始任务时从界面读取，后台线程不访问Tk变量
+        self.parallel = False
+        self.per_video_host = False
+        self.engine = None
+
+
+def source_position(file_path, stat):
+    """读取前的文件状态 stat 对应的读取位置 (已读取到的完整行末尾, 其之前的内容, 文件大小与修改时间)。
+
+    在后台线程中读取，由主线程随换上的存储一起记下（见 CommentApp.set_source）。
+    """
+    offset = complete_lines_end(file_path, stat.st_size)
+    return offset, read_anchor(file_path, offset), (stat.st_size, stat.st_mtime_ns)
+
 
 class CommentApp:
     def __init__(self, root):
@@ -38,6 +75,21 @@ class CommentApp:
             "D": 9
         }
 
+        # 列标题对应的排序键（见 sort_orders）
+        self.sort_keys = {
+            "User": "nickname",
+            "Content": "content",
+            "Time": "create_time",
+            "Replyer_Number": "reply_count",
+            "Rating": "rating"
+        }
+
+        # 显示时区，时间字符串在显示与导出时按该时区生成
+        self.display_timezone = DISPLAY_TIMEZONE
+
+        # 评级阈值（二级/三级回复数的分档）
+        self.rating_thresholds = (10, 100)
+
         # 创建顶部框架用于按钮和搜索
         top_frame = tk.Frame(root)
         top_frame.pack(side=tk.TOP, fill=tk.X, padx=10, pady=10)
@@ -54,6 +106,15 @@ class CommentApp:
         refresh_button = tk.Button(top_frame, text="刷新", command=self.refresh_tree)
         refresh_button.pack(side=tk.LEFT, padx=5)
 
+        cancel_button = tk.Button(top_frame, text="取消", command=self.cancel_job)
+        cancel_button.pack(side=tk.LEFT, padx=5)
+
+        profile_button = tk.Button(top_frame, text="性能", command=self.toggle_profile_panel)
+        profile_button.pack(side=tk.LEFT, padx=5)
+
+        jobs_button = tk.Button(top_frame, text="任务", command=self.toggle_jobs_panel)
+        jobs_button.pack(side=tk.LEFT, padx=5)
+
         exit_button = tk.Button(top_frame, text="退出", command=root.quit)
         exit_button.pack(side=tk.RIGHT)
 
@@ -67,16 +128,141 @@ class CommentApp:
         search_button = tk.Button(top_frame, text="搜索", command=self.search_comments)
         search_button.pack(side=tk.LEFT, padx=5)
 
+        # 实时搜索：输入停止 search_delay 毫秒后自动搜索
+        self.live_search = tk.BooleanVar(value=False)
+        live_check = tk.Checkbutton(top_frame, text="实时搜索", variable=self.live_search)
+        live_check.pack(side=tk.LEFT, padx=5)
+        self.search_entry.bind("<KeyRelease>", self.on_search_key)
+        self.search_entry.bind("<Return>", lambda event: self.search_comments())
+
+        # 筛选栏：与搜索框的文本一起组成查询，各条件同时满足，留空表示不限
+        filter_frame = tk.Frame(root)
+        filter_frame.pack(side=tk.TOP, fill=tk.X, padx=10, pady=(0, 10))
+        self.filter_entries = {}
+        for name, label, width in (
+                ("ratings", "评级(逗号分隔):", 12), ("start", "时间从:", 16), ("end", "到:", 16),
+                ("user_id", "user_id:", 14), ("video_id", "video_id:", 14),
+                ("min_replies", "回复数≥", 6), ("max_replies", "≤", 6)):
+            tk.Label(filter_frame, text=label).pack(side=tk.LEFT, padx=(5, 2))
+            entry = tk.Entry(filter_frame, width=width)
+            entry.pack(side=tk.LEFT)
+            entry.bind("<Return>", lambda event: self.search_comments())
+            self.filter_entries[name] = entry
+        clear_filter_button = tk.Button(filter_frame, text="清除筛选", command=self.clear_filters)
+        clear_filter_button.pack(side=tk.LEFT, padx=10)
+
+        # 显示时区：可从列表中选择或输入IANA时区名，回车或选中后按新时区重绘（时间筛选也按该时区解析）
+        tk.Label(filter_frame, text="时区:").pack(side=tk.LEFT, padx=(5, 2))
+        self.timezone_box = ttk.Combobox(filter_frame, values=TIMEZONES, width=16)
+        self.timezone_box.set(self.display_timezone)
+        self.timezone_box.pack(side=tk.LEFT)
+        self.timezone_box.bind("<<ComboboxSelected>>", self.on_timezone_selected)
+        self.timezone_box.bind("<Return>", self.on_timezone_selected)
+
+        # 延迟加载：只插入顶级评论并分页，展开节点时再加载回复
+        self.lazy_tree = tk.BooleanVar(value=True)
+        lazy_check = tk.Checkbutton(top_frame, text="延迟加载", variable=self.lazy_tree)
+        lazy_check.pack(side=tk.LEFT, padx=5)
+
+        # 流式加载：分块读取CSV，边读边显示（需配合延迟加载）
+        self.stream_load = tk.BooleanVar(value=False)
+        stream_check = tk.Checkbutton(top_frame, text="流式加载", variable=self.stream_load)
+        stream_check.pack(side=tk.LEFT, padx=5)
+
+        # 数据集缓存：源文件未变化时直接读取处理结果，取消勾选则绕过缓存
+        self.use_cache = tk.BooleanVar(value=True)
+        cache_check = tk.Checkbutton(top_frame, text="使用缓存", variable=self.use_cache)
+        cache_check.pack(side=tk.LEFT, padx=5)
+
+        # 排序回复：点击列标题排序时各级回复也按该列排序
+        self.sort_replies = tk.BooleanVar(value=False)
+        sort_replies_check = tk.Checkbutton(top_frame, text="排序回复", variable=self.sort_replies)
+        sort_replies_check.pack(side=tk.LEFT, padx=5)
+
+        # 监视文件：源文件有追加或修改时自动增量刷新
+        self.watch_file = tk.BooleanVar(value=False)
+        watch_check = tk.Checkbutton(top_frame, text="监视文件", variable=self.watch_file)
+        watch_check.pack(side=tk.LEFT, padx=5)
+
+        # 数据库模式：把CSV导入本地SQLite数据库，显示、搜索、排序与导出都按需分页读取，
+        # 适合内存放不下的存档；数据库保存在缓存目录中，源文件未变化时直接打开
+        self.database_mode = tk.BooleanVar(value=False)
+        database_check = tk.Checkbutton(top_frame, text="数据库模式", variable=self.database_mode)
+        database_check.pack(side=tk.LEFT, padx=5)
+
+        # 多核处理：按视频把评论分区，在多个进程中并行构建评论串与评级，结果与单进程相同
+        self.parallel_process = tk.BooleanVar(value=False)
+        parallel_check = tk.Checkbutton(top_frame, text="多核处理", variable=self.parallel_process)
+        parallel_check.pack(side=tk.LEFT, padx=5)
+
+        # 按视频识别Up主：每个视频分别以其第一个顶级评论的用户为Up主（多个视频的存档）
+        self.per_video_host = tk.BooleanVar(value=False)
+        per_video_host_check = tk.Checkbutton(top_frame, text="按视频识别Up主", variable=self.per_video_host)
+        per_video_host_check.pack(side=tk.LEFT, padx=5)
+
+        # 快速解析：用pyarrow的多线程解析器读取整个文件（需安装pyarrow，不支持的文件自动退回默认解析器）
+        self.fast_parser = tk.BooleanVar(value=False)
+        fast_parser_check = tk.Checkbutton(top_frame, text="快速解析", variable=self.fast_parser)
+        fast_parser_check.pack(side=tk.LEFT, padx=5)
+
         # 创建进度条框架
         progress_frame = tk.Frame(root)
         progress_frame.pack(side=tk.TOP, fill=tk.X, padx=10, pady=(0, 10))
 
-        self.progress = ttk.Progressbar(progress_frame, mode='indeterminate')
+        self.progress = ttk.Progressbar(progress_frame, mode='determinate')
         self.progress.pack(fill=tk.X)
-        self.progress.stop()  # 初始时停止进度条
+        self.progress.pack_forget()  # 初始时隐藏进度条
+
+        # 底部状态栏：显示最近一次任务的耗时与内存
+        self.status_text = tk.StringVar(value="就绪")
+        status_bar = tk.Label(root, textvariable=self.status_text, anchor='w', relief=tk.SUNKEN)
+        status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+
+        # 性能面板：最近一次任务各阶段的明细，停靠在状态栏上方，点击“性能”按钮显示或隐藏
+        self.profile_frame = tk.Frame(root)
+        profile_bar = tk.Frame(self.profile_frame)
+        profile_bar.pack(side=tk.TOP, fill=tk.X)
+        self.profile_title = tk.Label(profile_bar, anchor='w')
+        self.profile_title.pack(side=tk.LEFT)
+        dump_button = tk.Button(profile_bar, text="导出追踪", command=self.export_trace)
+        dump_button.pack(side=tk.RIGHT, padx=5)
+        self.trace_memory = tk.BooleanVar(value=False)
+        trace_memory_check = tk.Checkbutton(profile_bar, text="记录分配峰值（较慢）", variable=self.trace_memory,
+                                            command=lambda: self.profiler.set_trace_memory(self.trace_memory.get()))
+        trace_memory_check.pack(side=tk.RIGHT, padx=5)
+
+        profile_columns = ("Thread", "Wall", "Rows", "Rate", "RSS", "PeakRSS", "Traced")
+        self.profile_tree = ttk.Treeview(self.profile_frame, columns=profile_columns, show='tree headings', height=8)
+        self.profile_tree.heading("#0", text="阶段")
+        for column, heading, width in zip(profile_columns, (
+                "线程", "耗时(秒)", "行数", "行/秒", "内存(MB)", "进程峰值(MB)", "分配峰值(MB)"
+        ), (200, 90, 90, 100, 90, 100, 100)):
+            self.profile_tree.heading(column, text=heading)
+            self.profile_tree.column(column, width=width, anchor='e')
+        self.profile_tree.column("#0", width=200, anchor='w')
+        self.profile_tree.pack(fill=tk.X)
+
+        # 任务面板：排队中、运行中与最近结束的后台任务及其耗时，点击“任务”按钮显示或隐藏
+        self.jobs_frame = tk.Frame(root)
+        jobs_bar = tk.Frame(self.jobs_frame)
+        jobs_bar.pack(side=tk.TOP, fill=tk.X)
+        cancel_selected_button = tk.Button(jobs_bar, text="取消所选任务", command=self.cancel_selected_jobs)
+        cancel_selected_button.pack(side=tk.RIGHT, padx=5)
+        jobs_columns = ("State", "Priority", "Elapsed")
+        self.jobs_tree = ttk.Treeview(self.jobs_frame, columns=jobs_columns, show='tree headings', height=6)
+        self.jobs_tree.heading("#0", text="任务")
+        for column, heading, width in zip(jobs_columns, ("状态", "优先级", "耗时(秒)"), (90, 70, 90)):
+            self.jobs_tree.heading(column, text=heading)
+            self.jobs_tree.column(column, width=width, anchor='e')
+        self.jobs_tree.column("#0", width=300, anchor='w')
+        self.jobs_tree.pack(fill=tk.X)
+        self.jobs_interval = 500  # 面板显示时刷新的间隔（毫秒）
+        self.panel_jobs = {}  # 面板中的行 -> 任务
+        self.jobs_after_id = None
 
         # 创建Treeview和滚动条
         tree_frame = tk.Frame(root)
+        self.tree_frame = tree_frame
         tree_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
         self.tree = ttk.Treeview(tree_frame, columns=("User", "Content", "Time", "Replyer_Number", "Rating"), show='tree headings')
@@ -95,9 +281,9 @@ class CommentApp:
         self.tree.column("Rating", width=100, anchor='center')
 
         # 添加垂直滚动条
-        vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=vsb.set)
-        vsb.pack(side='right', fill='y')
+        self.vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_tree_scroll)
+        self.vsb.pack(side='right', fill='y')
 
         # 添加水平滚动条
         hsb = ttk.Scrollbar(tree_frame, orient="horizontal", command=self.tree.xview)
@@ -105,274 +291,884 @@ class CommentApp:
         hsb.pack(side='bottom', fill='x')
 
         self.tree.pack(fill=tk.BOTH, expand=True)
+        # 搜索结果中本身未命中、只为显示评论串上下文的父评论
+        self.tree.tag_configure("context", foreground="gray")
+
+        # 展开节点时加载其回复
+        self.tree.bind("<<TreeviewOpen>>", self.on_tree_open)
 
         # 绑定列标题点击事件用于排序
         for col in ("User", "Content", "Time", "Replyer_Number", "Rating"):
             self.tree.heading(col, text=col, command=lambda _col=col: self.sort_column(_col))
 
-        # 初始化数据结构
-        self.comments = {}
-        self.replies = {}
-        self.df = None
-        self.filtered_comments = {}
-        self.filtered_replies = {}
-        self.up_host_id = None  # 用于标识Up主的user_id
+        # 初始化数据结构：评论按行位置保存在 CommentStore 中，树节点与索引都以行位置引用评论
+        self.store = None
+        self.search_index = None
+        self.query_engine = None  # 组合查询，存储或搜索索引变化后重新创建
+        # 后台任务在有界线程池中按优先级运行；加载与刷新共用一个键，新的取代旧的
+        self.jobs = JobScheduler()
+        # 各阶段的耗时、吞吐量与内存，显示在状态栏与性能面板中，可导出为Chrome追踪格式
+        self.profiler = Profiler()
+        activate(self.profiler)
+        self.search_after_id = None
+        self.search_delay = 300
+        self.filtered_children = None  # 搜索结果的子评论表（只含显示的回复）
+
+        # 延迟加载状态
+        self.page_size = 500  # 每页插入的顶级评论数
+        self.pending_top = np.empty(0, dtype=np.int64)  # 待插入的顶级评论（行位置）
+        self.pending_pos = 0
+        self.pending_filtered = False
+        self.page_scheduled = False
+        self.lazy_nodes = {}  # 尚未加载回复的节点 -> (行位置, filtered)
+
+        # 排序状态
+        self.sort_index = None  # 各排序键的升序行位置数组，加载时计算
+        self.filtered_mask = None  # 搜索结果中显示的行（命中的行及其各级父评论）
+        self.context_mask = None  # 其中只作为上下文显示的父评论
+        self.sorted_replies = None  # 按当前排序列排好的子评论表，None表示按时间顺序
+        self.tree_replies_sorted = False  # 树中的回复是否已按排序列调整过顺序
+        self.sort_column_name = None  # 顶级评论当前的排序列，None表示按时间排序
+        self.tree_lazy = False  # 当前的树是否为延迟加载生成
+
+        # 增量刷新状态：源文件、已读取到的偏移及其之前的内容、读取时的文件状态
+        self.source_path = None
+        self.source_offset = 0
+        self.source_anchor = b""
+        self.source_stat = None
+        self.watch_interval = 2000  # 监视文件时检查的间隔（毫秒）
+
+        # 界面更新队列：后台线程生成待插入的行，主线程分时间片取出并插入
+        self.ui_queue = queue.Queue()
+        self.job = None  # 当前任务，None表示空闲
+        self.job_counter = 0
+        self.ui_rows = []  # 正在插入的一批行
+        self.ui_row_pos = 0
+        self.rows_inserted = 0
+        self.batch_size = 1000  # 每批放入队列的行数
+        self.tick_ms = 30  # 每次主循环最多用于插入的毫秒数
+        self.drain_interval = 15  # 两次取队列之间的间隔（毫秒）
+        self.stream_chunk_rows = 100000  # 流式加载时每块的行数
+        self.cache_max_bytes = DEFAULT_MAX_BYTES  # 每个缓存目录的容量上限
+        self.root.after(self.drain_interval, self.drain_ui_queue)
+        self.root.after(self.watch_interval, self.poll_source)
 
     def load_csv(self):
         file_path = filedialog.askopenfilename(
             title="选择CSV文件",
-            filetypes=(("CSV Files", "*.csv"), ("All Files", "*.*"))
+            filetypes=(("CSV Files", "*.csv *.csv.gz *.csv.zst"), ("All Files", "*.*"))
         )
 
         if not file_path:
             return
 
-        # 启动进度条
-        self.start_progress()
+        # 启动一个新任务和线程加载和处理CSV
+        job = self.begin_job(f"加载 {os.path.basename(file_path)}")
+        if self.database_mode.get():
+            target = self.load_database_thread
+        elif self.stream_load.get():
+            target = self.load_csv_stream_thread
+        else:
+            target = self.load_csv_thread
+        self.submit_job(job, job.run_id, target, file_path, job, self.use_cache.get(),
+                        key="dataset", priority=PRIORITY_HIGH)
+
+    def submit_job(self, job, run_id, func, *args, key=None, priority=PRIORITY_NORMAL):
+        # 交给任务调度器在后台运行，任务线程中的计时记入 run_id
+        def run():
+            with self.profiler.bind_run(run_id):
+                func(*args)
+        self.jobs.submit(job, run, key=key, priority=priority)
+
+    def load_csv_thread(self, file_path, job, use_cache=True):
+        try:
+            # 读取前的文件状态与签名，之后追加的行由增量刷新读取
+            stat = os.stat(file_path)
+            signature = file_signature(file_path)
+            if use_cache and self.load_cached(file_path, job, stat):
+                return
+            with stage("检测编码与读取") as info:
+                start = time.perf_counter()
+                # 只读取界面与评级用到的列，头像等在导出时才读取
+                df, encoding, bad_offset = read_comments_csv(file_path, LOAD_COLUMNS, job.engine)
+                info["rows"] = len(df)
+                info["encoding"] = encoding
+                if bad_offset is not None:
+                    # 以前先按UTF-8解析到出错位置再重来，按出错位置占文件的比例估算省下的时间
+                    read_time = time.perf_counter() - start
+                    info["saved_s"] = read_time * bad_offset / max(os.path.getsize(file_path), 1)
+            if job.cancel.is_set():
+                return
+
+            with stage("处理", rows=len(df)):
+                store = self.process_data(df, job)
+                del df
+            store.defer(file_path)
+            if job.cancel.is_set():
+                return
+
+            self.build_indexes(store, job)
+            if use_cache:
+                self.store_cache(store, file_path, signature)
+            # 所有行插入后记下读取位置、停止进度条并显示成功消息（通过主线程）
+            self.post(job, "call", (self.load_success, file_path, job, source_position(file_path, stat)))
+        except Exception as e:
+            self.post(job, "call", (self.load_error, e, job))
 
-        # 启动一个新线程加载和处理CSV
-        threading.Thread(target=self.load_csv_thread, args=(file_path,)).start()
+    def load_csv_stream_thread(self, file_path, job, use_cache=True):
+        try:
+            stat = os.stat(file_path)
+            signature = file_signature(file_path)
+            if use_cache and self.load_cached(file_path, job, stat):
+                return
+            self.post(job, "total", os.path.getsize(file_path))
+            with stage("检测编码"):
+                encoding, _ = detect_encoding(file_path)
+
+            with stage("流式读取与处理") as info:
+                try:
+                    result = self.stream_csv(file_path, encoding, job)
+                except UnicodeDecodeError:
+                    if encoding == 'gbk':
+                        raise
+                    # 非UTF-8字节出现在取样范围之后，退回GBK重新读取
+                    result = self.stream_csv(file_path, 'gbk', job)
+                if result is None or job.cancel.is_set():
+                    return
+                store, missing_video_id = result
+                self.warn_missing_video_id(missing_video_id, job)
+                info["rows"] = len(store)
+            store.defer(file_path)
+
+            self.build_indexes(store, job)
+            if use_cache:
+                self.store_cache(store, file_path, signature)
+            self.post(job, "call", (self.load_success, file_path, job, source_position(file_path, stat)))
+        except Exception as e:
+            self.post(job, "call", (self.load_error, e, job))
 
-    def load_csv_thread(self, file_path):
+    def load_database_thread(self, file_path, job, use_cache=True):
         try:
-            encoding = 'utf-8'  # 默认编码
-            self.df = pd.read_csv(file_path, dtype=str, encoding=encoding)
-            self.process_data()
-            self.populate_tree()
-            # 停止进度条并显示成功消息（通过主线程）
-            self.root.after(0, self.load_success, file_path)
-        except UnicodeDecodeError:
-            try:
-                encoding = 'gbk'  # 尝试其他常用编码
-                self.df = pd.read_csv(file_path, dtype=str, encoding=encoding)
-                self.process_data()
-                self.populate_tree()
-                self.root.after(0, self.load_success, file_path)
-            except Exception as e:
-                self.root.after(0, self.load_error, e)
+            stat = os.stat(file_path)
+            low, high = self.rating_thresholds
+            with stage("打开数据库") as info:
+                db = open_database(file_path, self.display_timezone, low, high, job.per_video_host) if use_cache else None
+                info["hit"] = db is not None
+            if db is None:
+                self.post(job, "total", stat.st_size)
+                with stage("导入数据库") as info:
+                    result = import_csv(
+                        file_path, self.display_timezone, low, high, self.stream_chunk_rows,
+                        progress=lambda offset: self.post(job, "progress", offset), cancel=job.cancel,
+                        per_video_host=job.per_video_host, max_bytes=self.cache_max_bytes
+                    )
+                    if result is None:
+                        return
+                    db, missing_video_id = result
+                    info["rows"] = len(db)
+                self.warn_missing_video_id(missing_video_id, job)
+            if job.cancel.is_set():
+                db.close()
+                return
+            self.show_store(db, job)
+            self.post(job, "call", (self.load_success, file_path, job, source_position(file_path, stat)))
         except Exception as e:
-            self.root.after(0, self.load_error, e)
+            self.post(job, "call", (self.load_error, e, job))
+
+    def set_store(self, store):
+        # 在主线程中换用新的评论存储（后台线程经界面队列换上）；换下的数据库关闭连接（界面此后只读取新的存储）
+        old = self.store
+        self.store = store
+        # 加载或刷新期间切换过时区时，新的存储也按当前时区显示
+        store.tz_name = self.display_timezone
+        self.search_index = None
+        self.sort_index = None
+        self.query_engine = None
+        if isinstance(old, CommentDatabase) and old is not store:
+            old.close()
+
+    def paged(self):
+        # 当前的评论在数据库中，只能按需分页读取
+        return isinstance(self.store, CommentDatabase)
+
+    def stream_csv(self, file_path, encoding, job):
+        """分块读取并追加到新的评论存储，进度按已读取的（压缩文件为压缩后的）字节数计算。
+
+        返回 (评论存储, 缺失video_id的评论ID列表)，被取消时返回None。
+        """
+        store = CommentStore(self.display_timezone)
+        store.per_video_host = job.per_video_host
+        missing_video_id = []
+        for chunk, offset in iter_csv_chunks(file_path, encoding, self.stream_chunk_rows, LOAD_COLUMNS, integers=True):
+            if job.cancel.is_set():
+                return None
+            missing_video_id.extend(store.add_rows(chunk))
+            # 只重新评级新加入的行及受其影响的父评论、祖父评论
+            store.update_ratings(*self.rating_thresholds)
+            self.post(job, "progress", offset)
+            if job.lazy:
+                # 延迟加载模式下以快照重绘第一页，已读到的评论串立即可见，之后的追加不影响界面读取
+                self.show_store(store.snapshot(), job)
+        return store, missing_video_id
+
+    def cache_params(self, per_video_host):
+        # 影响处理结果的参数，变化后旧缓存失效（时间字符串不写入缓存，与时区无关）
+        return {"rating_thresholds": list(self.rating_thresholds), "per_video_host": per_video_host}
+
+    def load_cached(self, file_path, job, stat):
+        # 缓存命中时跳过解析与处理，直接显示；返回是否命中
+        with stage("读取缓存") as info:
+            cached = load_dataset(file_path, self.cache_params(job.per_video_host), self.display_timezone)
+            info["hit"] = cached is not None
+            if cached is None:
+                return False
+            info["rows"] = len(cached)
+        if job.cancel.is_set():
+            return True
+
+        self.build_indexes(cached, job)
+        self.post(job, "call", (self.load_success, file_path, job, source_position(file_path, stat)))
+        return True
+
+    def build_indexes(self, store, job):
+        # 换用新的存储并生成树行放入界面队列，界面插入行的同时在后台构建搜索与排序索引
+        with stage("生成树行", rows=len(store)):
+            self.show_store(store, job)
+        self.post_indexes(store, job)
+
+    def post_indexes(self, store, job):
+        # 在后台构建搜索与排序索引，交给主线程换上；构建完成前搜索退回线性扫描，校验时直接读取存储中的列
+        with stage("搜索索引", rows=len(store)):
+            search_index = SearchIndex(store.columns["nickname"], store.columns["content"])
+        with stage("排序索引", rows=len(store)):
+            # 各列的排序结果在加载时算好，点击列标题时只需按方向取正序或倒序
+            sort_index = sort_orders(store, self.rating_order, store.parent_pos)
+        self.post(job, "call", (self.set_indexes, store, search_index, sort_index))
+
+    def set_indexes(self, store, search_index, sort_index):
+        # 其间已换用别的存储时丢弃
+        if self.store is store:
+            self.search_index = search_index
+            self.sort_index = sort_index
+            self.query_engine = None
+
+    def store_cache(self, store, file_path, signature):
+        # signature 为读取前的文件签名，缓存只对应读取时的内容
+        with stage("写入缓存", rows=len(store)) as info:
+            try:
+                store_dataset(file_path, store, self.cache_params(store.per_video_host), signature,
+                              self.cache_max_bytes)
+            except OSError:
+                # 源文件目录不可写等情况下不使用缓存，不影响加载
+                info["skipped"] = True
 
-    def load_success(self, file_path):
-        self.stop_progress()
-        messagebox.showinfo("成功", f"成功加载文件: {os.path.basename(file_path)}")
 
-    def load_error(self, error):
-        self.stop_progress()
+    def toggle_profile_panel(self):
+        if self.profile_frame.winfo_ismapped():
+            self.profile_frame.pack_forget()
+        else:
+            self.profile_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=10, before=self.tree_frame)
+            self.show_profile()
+
+    def show_profile(self, run_id=None):
+        """在状态栏与性能面板中显示一次运行（默认为最近一次）的阶段汇总。"""
+        run_id = self.profiler.run_id if run_id is None else run_id
+        summaries = self.profiler.summary(run_id)
+        if not summaries:
+            return
+        label = self.profiler.run_labels.get(run_id, "")
+        slowest = max(summaries, key=lambda summary: summary["wall_s"])
+        status = f"{label}：用时 {self.profiler.run_wall(run_id):.2f} 秒，最慢阶段 {slowest['name']} {slowest['wall_s']:.2f} 秒"
+        rss = max((summary["rss"] or 0) for summary in summaries)
+        if rss:
+            status += f"，内存 {rss / 2**20:.0f} MB"
+        self.status_text.set(status)
+
+        self.profile_title.configure(text=label)
+        self.profile_tree.delete(*self.profile_tree.get_children())
+        megabytes = lambda value: f"{value / 2**20:.1f}" if value else ""
+        for summary in summaries:
+            self.profile_tree.insert("", "end", text=summary["name"], values=(
+                summary["thread"],
+                f"{summary['wall_s']:.3f}",
+                summary["rows"] if summary["rows"] is not None else "",
+                f"{summary['rows_per_s']:,.0f}" if summary["rows_per_s"] else "",
+                megabytes(summary["rss"]),
+                megabytes(summary["peak_rss"]),
+                megabytes(summary["traced_peak"]),
+            ))
+
+    def toggle_jobs_panel(self):
+        if self.jobs_frame.winfo_ismapped():
+            self.jobs_frame.pack_forget()
+        else:
+            self.jobs_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=10, before=self.tree_frame)
+            if self.jobs_after_id is not None:
+                self.root.after_cancel(self.jobs_after_id)
+            self.show_jobs()
+
+    def show_jobs(self):
+        # 面板显示期间定时刷新任务列表与耗时，隐藏后停止
+        self.jobs_after_id = None
+        if not self.jobs_frame.winfo_ismapped():
+            return
+        selected = {self.panel_jobs[item] for item in self.jobs_tree.selection() if item in self.panel_jobs}
+        self.jobs_tree.delete(*self.jobs_tree.get_children())
+        self.panel_jobs = {}
+        for job in self.jobs.jobs():
+            item = self.jobs_tree.insert("", "end", text=job.label, values=(
+                job.state, PRIORITY_NAMES.get(job.priority, job.priority), f"{job.elapsed():.1f}"
+            ))
+            self.panel_jobs[item] = job
+            if job in selected:
+                self.jobs_tree.selection_add(item)
+        self.jobs_after_id = self.root.after(self.jobs_interval, self.show_jobs)
+
+    def cancel_selected_jobs(self):
+        for item in self.jobs_tree.selection():
+            job = self.panel_jobs.get(item)
+            if job is self.job:
+                # 界面正在等待的任务，同时停止进度条并丢弃剩余的界面更新
+                self.cancel_job()
+            elif job is not None and job.state in (QUEUED, RUNNING):
+                self.jobs.cancel(job)
+
+    def export_trace(self):
+        # 整个会话的阶段记录，Chrome追踪格式（可在 chrome://tracing 或 Perfetto 中打开）
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=(("Trace Files", "*.json"), ("All Files", "*.*")),
+            title="导出性能追踪"
+        )
+        if not file_path:
+            return
+        try:
+            self.profiler.dump(file_path)
+        except OSError as e:
+            messagebox.showerror("错误", f"导出追踪失败: {e}")
+            return
+        messagebox.showinfo("成功", f"成功导出追踪到: {file_path}")
+
+    def load_success(self, file_path, job, source):
+        # 与本任务的存储一起记下源文件的读取位置，刷新时从这里继续读取追加的行
+        self.source_path = file_path
+        self.set_source(source)
+        self.finish_job(job)
+        message = f"成功加载文件: {os.path.basename(file_path)}"
+        lines = []
+        for summary in self.profiler.summary(job.run_id):
+            line = f"{summary['name']}: {summary['wall_s']:.2f} 秒"
+            if summary["rows_per_s"]:
+                line += f"（{summary['rows_per_s']:,.0f} 行/秒）"
+            lines.append(line)
+            if "saved_s" in summary["args"]:
+                lines.append(f"单次解析节省(估算): {summary['args']['saved_s']:.2f} 秒")
+        if lines:
+            message += "\n\n" + "\n".join(lines)
+        messagebox.showinfo("成功", message)
+
+    def load_error(self, error, job):
+        self.finish_job(job)
         messagebox.showerror("错误", f"加载文件失败: {error}")
 
     def start_progress(self):
-        self.progress.start(10)  # 每10毫秒移动一次
-        self.progress.pack()  # 确保进度条可见
+        self.progress.configure(value=0, maximum=1)
+        self.progress.pack(fill=tk.X)  # 确保进度条可见
 
     def stop_progress(self):
-        self.progress.stop()
         self.progress.pack_forget()  # 隐藏进度条
 
-    def process_data(self):
-        if self.df is None:
-            return
-
-        # 确保必要的列存在
-        required_columns = [
-            "comment_id", "parent_comment_id", "create_time",
-            "video_id", "content", "user_id", "nickname",
-            "avatar", "sub_comment_count", "last_modify_ts"
-        ]
-        missing_columns = [col for col in required_columns if col not in self.df.columns]
-        if missing_columns:
-            raise ValueError(f"缺少必要的列: {', '.join(missing_columns)}")
-
-        # 转换create_time为整数
-        self.df["create_time"] = pd.to_numeric(self.df["create_time"], errors='coerce')
-        self.df = self.df.dropna(subset=["create_time"])
-        self.df["create_time"] = self.df["create_time"].astype(int)
-
-        # 构建评论和回复的字典
-        self.comments = {}
-        self.replies = {}
+    def begin_job(self, label=None):
+        # 在主线程开始新任务，正在进行的任务被取代；label 为空时计时记入当前运行
+        if self.job is not None:
+            self.jobs.cancel(self.job)
+        self.job_counter += 1
+        run_id = self.profiler.begin_run(label) if label else self.profiler.run_id
+        # 数据库中的评论只能按需读取，数据库模式下总是延迟加载
+        lazy = self.lazy_tree.get() or self.database_mode.get() or self.paged()
+        self.job = UiJob(self.job_counter, lazy, run_id, label or "")
+        self.job.parallel = self.parallel_process.get()
+        self.job.per_video_host = self.per_video_host.get()
+        self.job.engine = "pyarrow" if self.fast_parser.get() else None
+        self.ui_rows = []
+        self.ui_row_pos = 0
+        self.start_progress()
+        return self.job
 
-        missing_video_id = []
+    def finish_job(self, job):
+        if self.job is job:
+            self.job = None
+        self.stop_progress()
+        self.show_profile(job.run_id)
 
-        for idx, row in self.df.iterrows():
-            comment_id = row["comment_id"]
-            if comment_id in self.comments:
-                # 处理重复的comment_id
-                comment_id = f"{comment_id}_{idx}"
-            parent_id = row["parent_comment_id"]
-            video_id = row.get("video_id", "").strip()
-
-            if not video_id:
-                missing_video_id.append(comment_id)
-                # 可以选择跳过这条评论或设置一个默认值
-                # 这里我们设置为 "N/A"
-                video_id = "N/A"
-
-            comment = {
-                "comment_id": comment_id,
-                "parent_comment_id": parent_id,
-                "create_time": row["create_time"],
-                "content": row["content"],
-                "nickname": row["nickname"],
-                "user_id": row["user_id"],
-                "avatar": row["avatar"],
-                "sub_comment_count": row["sub_comment_count"],
-                "last_modify_ts": row["last_modify_ts"],
-                "rating": ""  # 初始化评级（小写）
-            }
-            # 添加video_id
-            comment["video_id"] = video_id
-
-            self.comments[comment_id] = comment
-            if parent_id not in self.replies:
-                self.replies[parent_id] = []
-            self.replies[parent_id].append(comment)
-
-        # 如果有缺失video_id的评论，提醒用户
+    def cancel_job(self):
+        if self.job is None:
+            return
+        self.jobs.cancel(self.job)
+        self.job = None
+        self.ui_rows = []
+        self.ui_row_pos = 0
+        self.stop_progress()
+        messagebox.showinfo("取消", "已取消当前任务。")
+
+    def post(self, job, kind, payload=None):
+        # 可在任意线程调用，由主线程的 drain_ui_queue 处理
+        self.ui_queue.put((job.id, kind, payload))
+
+    def call_soon(self, func, *args):
+        # 可在任意线程调用：不属于界面任务的回调（如导出完成），由主线程的 drain_ui_queue 调用
+        self.ui_queue.put((None, "call", (func, *args)))
+
+    def drain_ui_queue(self):
+        start = time.perf_counter()
+        deadline = start + self.tick_ms / 1000
+        job_id = self.job.id if self.job is not None else None
+        # 本时间片插入的行记入开始时的任务（任务可能在本时间片内结束）
+        run_id = self.job.run_id if self.job is not None else None
+        rows_before = self.rows_inserted
+        inserted = False
+        while time.perf_counter() < deadline:
+            if self.ui_row_pos < len(self.ui_rows):
+                # 小批量插入，每批之后检查时间片是否用完
+                end = min(self.ui_row_pos + 50, len(self.ui_rows))
+                for parent_iid, iid, text, values, tags in self.ui_rows[self.ui_row_pos:end]:
+                    self.tree.insert(parent_iid, "end", iid=iid, text=text, values=values, tags=tags)
+                self.rows_inserted += end - self.ui_row_pos
+                self.ui_row_pos = end
+                inserted = True
+                continue
+            try:
+                item_job_id, kind, payload = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item_job_id is not None and item_job_id != job_id:
+                # 已取消或被新任务取代；未换上的数据库关闭连接
+                if kind == "store":
+                    self.release_snapshot(payload)
+                continue
+            if kind == "store":
+                self.set_store(payload)
+                self.reset_view()
+            elif kind == "clear":
+                self.clear_tree()
+                self.rows_inserted = 0
+            elif kind == "top":
+                # 完整插入的树：全部顶级评论都会插入
+                self.pending_top = payload
+                self.pending_pos = len(payload)
+                self.tree_lazy = False
+            elif kind == "total":
+                self.progress.configure(maximum=max(payload, 1), value=0)
+            elif kind == "progress":
+                self.progress.configure(value=payload)
+            elif kind == "rows":
+                self.ui_rows = payload
+                self.ui_row_pos = 0
+            elif kind == "lazy":
+                self.pending_top, self.pending_filtered = payload
+                self.tree_lazy = True
+                self.load_next_page()
+            elif kind == "call":
+                func, *args = payload
+                func(*args)
+                job_id = self.job.id if self.job is not None else None
+        if inserted:
+            self.progress.configure(value=self.rows_inserted)
+            if run_id is not None:
+                self.profiler.record("界面插入", start, time.perf_counter(), "ui", run_id,
+                                     rows=self.rows_inserted - rows_before)
+        self.root.after(self.drain_interval, self.drain_ui_queue)
+
+    def process_data(self, df, job):
+        # 列式构建评论存储，按第一个顶级评论（或各视频的第一个顶级评论）确定Up主并批量计算评级；原始数据不再保留
+        low, high = self.rating_thresholds
+        build = build_store_parallel if job.parallel else build_store
+        store, missing_video_id = build(df, self.display_timezone, low, high, job.per_video_host)
+
+        self.warn_missing_video_id(missing_video_id, job)
+        return store
+
+    def warn_missing_video_id(self, missing_video_id, job):
+        # 如果有缺失video_id的评论，提醒用户（由主线程弹出）
         if missing_video_id:
             message = f"以下评论缺少 'video_id'，已设置为 'N/A':\n" + ", ".join(missing_video_id)
-            messagebox.showwarning("警告", message)
-
-        # 对每个回复列表按create_time排序
-        for parent_id in self.replies:
-            self.replies[parent_id].sort(key=lambda x: x["create_time"])
+            self.post(job, "call", (messagebox.showwarning, "警告", message))
 
-        # 确定Up主的user_id（假设第一个顶级评论来自Up主）
-        top_level_comments = [c for c in self.comments.values() if c["parent_comment_id"] not in self.comments]
-        if top_level_comments:
-            self.up_host_id = top_level_comments[0]["user_id"]
-        else:
-            self.up_host_id = None
-
-        # 计算评级
-        for comment in top_level_comments:
-            self.assign_rating(comment)
-
-        # 处理二级及更深层级的评论
-        for comment in self.comments.values():
-            if comment["parent_comment_id"] in self.comments:
-                self.assign_rating(comment)
-
-    def assign_rating(self, comment):
-        # 如果评论来自Up主
-        if comment["user_id"] == self.up_host_id:
-            # 判断是否为顶级评论
-            if comment["parent_comment_id"] not in self.comments:
-                comment["rating"] = "A1"
-            else:
-                comment["rating"] = "A2"
+    def populate_tree(self, filtered=False, job=None):
+        if self.store is None:
             return
+        self.reset_view(filtered)
 
-        # 获取二级回复
-        second_replies = self.replies.get(comment["comment_id"], [])
-        count_second = len(second_replies)
+        # 按create_time排序顶级评论
+        top_level = self.store.top_level(self.sort_order.get("Time", False), self.filtered_mask if filtered else None)
+
+        self.show_top_level(top_level, filtered, job)
+
+    def reset_view(self, filtered=False):
+        # 重新生成的树按时间排序，清除按列排序的回复顺序
+        self.sorted_replies = None
+        self.tree_replies_sorted = False
+        self.sort_column_name = None
+        if not filtered:
+            # 显示全部评论时清除上一次的搜索结果
+            self.filtered_children = None
+            self.filtered_mask = None
+            self.context_mask = None
+
+    def show_store(self, store, job):
+        """在后台线程中换用新的评论存储并显示全部评论。
+
+        存储与界面状态由主线程处理队列时换上（在本任务的树行之前），待插入的行在本线程由 store 生成，
+        不读取 self.store。
+        """
+        self.post(job, "store", store)
+        top_level = store.top_level(self.sort_order.get("Time", False))
+        self.show_top_level(top_level, job=job, store=store)
+
+    def show_top_level(self, top_level, filtered=False, job=None, store=None):
+        """生成待插入的行并放入界面更新队列。
+
+        加载线程调用时 store 为即将换上的存储；从主线程调用时（job 为None）开始新任务，
+        显示所需的存储、子评论表与上下文标记在主线程中取好，行交给任务调度器在后台生成。
+        """
+        if job is None:
+            job = self.begin_job()
+            job.label = "生成树行"
+            context = self.context_mask if filtered else None
+            self.submit_job(job, job.run_id, self.produce_tree_rows, top_level, filtered, job, self.store,
+                            self.get_children(filtered), context, True, key="tree", priority=PRIORITY_HIGH)
+            return
+        self.produce_tree_rows(top_level, filtered, job, store, store.children)
 
-        # 获取三级回复
-        count_third = sum(len(self.replies.get(reply["comment_id"], [])) for reply in second_replies)
+    def produce_tree_rows(self, top_level, filtered, job, store, children, context=None, finish=False):
+        # 在后台线程中生成行，只读取传入的存储与子评论表；finish 时生成完后由主线程结束任务
+        # 清空现有的Treeview
+        self.post(job, "clear")
 
-        # 根据评级标准分配评级
-        if count_second == 0:
-            comment["rating"] = "D"
-        elif 1 <= count_second < 10:
-            if count_third > 0:
-                comment["rating"] = "B1"
-            else:
-                comment["rating"] = "C1"
-        elif 10 <= count_second <= 100:
-            if count_third >= 10:
-                comment["rating"] = "B2"
-            else:
-                comment["rating"] = "C2"
-        elif count_second > 100:
-            if count_third >= 100:
-                comment["rating"] = "B3"
+        if job.lazy:
+            # 只插入第一页，其余在滚动到底部时继续插入
+            self.post(job, "lazy", (top_level, filtered))
+        else:
+            positions, parents, _, _ = walk(top_level, children)
+            self.post(job, "top", top_level)
+            self.post(job, "total", len(positions))
+            for batch in self.tree_row_batches(positions, parents, store, children, context):
+                if job.cancel.is_set():
+                    return
+                self.post(job, "rows", batch)
+        if finish:
+            self.post(job, "call", (self.finish_job, job))
+
+    def tree_row_batches(self, positions, parents, store=None, children=None, context=None):
+        """按 walk 的深度优先顺序生成 (父节点iid, iid, 文本, 列值, 标签) 的批次，父节点总是先于子节点。
+
+        每批按行位置一次取出各列，时间字符串也按批格式化；store 默认为当前的存储，children 默认为
+        store 的子评论表，context 为搜索结果中只作为上下文显示的行（None表示不是搜索结果）。
+        """
+        store = self.store if store is None else store
+        counts = (store.children if children is None else children).counts()
+        for start in range(0, len(positions), self.batch_size):
+            rows = positions[start:start + self.batch_size]
+            parent_iids = ["" if parent < 0 else self.tree_iid(parent) for parent in parents[start:start + self.batch_size].tolist()]
+            values = zip(
+                store.take("nickname", rows), store.take("content", rows), store.take("time_str", rows),
+                counts[rows].tolist(), store.take("rating", rows)
+            )
+            if context is None:
+                tags = [()] * len(rows)
             else:
-                comment["rating"] = "C3"
+                tags = [("context",) if flag else () for flag in context[rows].tolist()]
+            yield list(zip(parent_iids, map(self.tree_iid, rows.tolist()), store.take("comment_id", rows), values, tags))
 
-    def populate_tree(self, filtered=False):
-        # 清空现有的Treeview
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+    def tree_iid(self, pos):
+        # 节点iid由行位置决定（刷新只追加行，已有评论的位置不变），排序时据此找到已插入的节点
+        return f"c{pos}"
 
+    def row_tags(self, pos, filtered=False):
+        return ("context",) if filtered and self.context_mask[pos] else ()
+
+    def comment_row(self, pos, filtered=False):
+        store = self.store
+        values = (
+            store.value("nickname", pos), store.value("content", pos), store.value("time_str", pos),
+            self.get_children(filtered).count(pos), store.value("rating", pos)
+        )
+        return store.value("comment_id", pos), values
+
+    def clear_tree(self):
+        self.tree.delete(*self.tree.get_children())
+        self.lazy_nodes = {}
+        self.pending_top = np.empty(0, dtype=np.int64)
+        self.pending_pos = 0
+
+    def get_children(self, filtered=False):
+        # 当前显示所用的子评论表
+        if self.sorted_replies is not None:
+            return self.sorted_replies
         if filtered:
-            top_level_comments = [
-                comment for comment in self.filtered_comments.values()
-                if comment["parent_comment_id"] not in self.filtered_comments
-            ]
+            return self.filtered_children
+        return self.store.children
+
+    def get_replies(self, pos, filtered=False):
+        return self.get_children(filtered).of(pos).tolist()
+
+    def insert_comment_node(self, parent_node, pos, filtered=False, lazy=False, index="end"):
+        text, values = self.comment_row(pos, filtered)
+        node = self.tree.insert(parent_node, index, iid=self.tree_iid(pos), text=text, values=values,
+                                tags=self.row_tags(pos, filtered))
+        if lazy:
+            # 插入占位子节点以显示展开箭头，展开时再替换为真实回复
+            if values[3]:
+                self.tree.insert(node, "end", text="加载中...", tags=("placeholder",))
+                self.lazy_nodes[node] = (pos, filtered)
         else:
-            top_level_comments = [
-                comment for comment in self.comments.values()
-                if comment["parent_comment_id"] not in self.comments
-            ]
+            self.insert_replies(node, pos, filtered)
+        return node
 
-        # 按create_time排序顶级评论
-        top_level_comments.sort(key=lambda x: x["create_time"], reverse=self.sort_order.get("Time", False))
-
-        for comment in top_level_comments:
-            time_str = self.convert_timestamp(comment["create_time"])
-            replyer_number = len(self.replies.get(comment["comment_id"], [])) if not filtered else len(self.filtered_replies.get(comment["comment_id"], []))
-            node = self.tree.insert(
-                "",
-                "end",
-                text=comment["comment_id"],
-                values=(comment["nickname"], comment["content"], time_str, replyer_number, comment["rating"])
-            )
-            self.insert_replies(node, comment["comment_id"], filtered)
-
-    def insert_replies(self, parent_node, parent_id, filtered=False):
-        replies = self.replies.get(parent_id, []) if not filtered else self.filtered_replies.get(parent_id, [])
-        for idx, reply in enumerate(replies, start=1):
-            time_str = self.convert_timestamp(reply["create_time"])
-            replyer_number = len(self.replies.get(reply["comment_id"], [])) if not filtered else len(self.filtered_replies.get(reply["comment_id"], []))
-            node = self.tree.insert(
-                parent_node,
-                "end",
-                text=reply["comment_id"],
-                values=(reply["nickname"], reply["content"], time_str, replyer_number, reply["rating"])
-            )
+    def insert_replies(self, parent_node, pos, filtered=False):
+        for reply in self.get_replies(pos, filtered):
             # 递归插入更深层的回复
-            self.insert_replies(node, reply["comment_id"], filtered)
+            self.insert_comment_node(parent_node, reply, filtered)
+
+    def delete_node(self, node):
+        # 删除节点，并清除其子树中尚未加载回复的节点记录（只需遍历已展开的部分）
+        stack = [node]
+        while stack:
+            item = stack.pop()
+            if self.lazy_nodes.pop(item, None) is None:
+                stack.extend(self.tree.get_children(item))
+        self.tree.delete(node)
+
+    def load_next_page(self):
+        self.page_scheduled = False
+        end = self.pending_pos + self.page_size
+        page = self.pending_top[self.pending_pos:end]
+        with stage("界面插入", rows=len(page), category="ui"):
+            for pos in page.tolist():
+                self.insert_comment_node("", pos, self.pending_filtered, lazy=True)
+        self.pending_pos = min(end, len(self.pending_top))
+
+    def on_tree_scroll(self, first, last):
+        self.vsb.set(first, last)
+        # 接近底部且还有未插入的顶级评论时加载下一页
+        if float(last) >= 0.95 and self.pending_pos < len(self.pending_top) and not self.page_scheduled:
+            self.page_scheduled = True
+            self.root.after_idle(self.load_next_page)
+
+    def on_tree_open(self, event):
+        node = self.tree.focus()
+        entry = self.lazy_nodes.pop(node, None)
+        if entry is None:
+            return
+        pos, filtered = entry
+        self.tree.delete(*self.tree.get_children(node))
+        for reply in self.get_replies(pos, filtered):
+            self.insert_comment_node(node, reply, filtered, lazy=True)
 
     def convert_timestamp(self, ts):
+        return format_timestamp(ts, self.display_timezone)
+
+    def on_timezone_selected(self, event=None):
+        tz_name = self.timezone_box.get().strip()
+        if tz_name == self.display_timezone:
+            return
         try:
-            if ts < 0 or ts > 1e12:
-                return "无效时间"
-            if ts > 1e12:  # 毫秒级别
-                ts = ts / 1000
-            # 转换为北京时间
-            beijing_tz = ZoneInfo("Asia/Shanghai")
-            dt = datetime.fromtimestamp(ts, tz=beijing_tz)
-            return dt.strftime('%Y-%m-%d %H:%M:%S')
-        except Exception as e:
-            return f"未知时间 ({e})"
-
-    def refresh_tree(self):
-        if self.df is not None:
-            # 启动进度条
-            self.start_progress()
-            # 启动一个新线程处理刷新
-            threading.Thread(target=self.refresh_tree_thread).start()
-        else:
+            ZoneInfo(tz_name)
+        except (ValueError, ZoneInfoNotFoundError):
+            messagebox.showwarning("警告", f"未知的时区：{tz_name}")
+            self.timezone_box.set(self.display_timezone)
+            return
+        self.set_display_timezone(tz_name)
+
+    def set_display_timezone(self, tz_name):
+        # 时间字符串在显示时按时区生成，只需重绘，无需重新解析CSV
+        self.display_timezone = tz_name
+        if self.store is None:
+            return
+        self.profiler.begin_run("切换时区")
+        self.store.tz_name = tz_name
+        self.populate_tree()
+
+    def refresh_tree(self, quiet=False):
+        if self.store is not None:
+            # 启动一个新任务和线程处理刷新；quiet 为监视文件时的自动刷新，不弹出提示
+            job = self.begin_job("刷新")
+            # 源文件的读取位置与要更新的存储在主线程中取得：数据库原地更新，内存中的存储在快照上更新
+            source = (self.source_path, self.source_offset, self.source_anchor)
+            store = self.store if self.paged() else self.store.snapshot()
+            self.submit_job(job, job.run_id, self.refresh_tree_thread, job, store, source, self.use_cache.get(), quiet,
+                            key="dataset", priority=PRIORITY_HIGH)
+        elif not quiet:
             messagebox.showwarning("警告", "没有加载任何CSV文件。")
 
-    def refresh_tree_thread(self):
+    def refresh_tree_thread(self, job, store, source, use_cache=True, quiet=False):
+        # 新的读取位置只随结果交给主线程，任务被取消或取代时不记下，追加的行留到下次刷新
+        file_path, offset, anchor = source
+        paged = isinstance(store, CommentDatabase)
         try:
-            self.process_data()
-            self.populate_tree()
-            self.root.after(0, self.refresh_success)
+            stat = os.stat(file_path)
+            signature = file_signature(file_path)
+            with stage("读取追加数据") as info:
+                appended = read_appended_rows(file_path, offset, anchor)
+                info["reload"] = appended is None
+            if appended is None:
+                # 已读取的内容被改写或截断，整体重新加载
+                reload = self.load_database_thread if paged else self.load_csv_thread
+                reload(file_path, job, use_cache)
+                return
+            chunk, offset, anchor = appended
+            source = (offset, anchor, (stat.st_size, stat.st_mtime_ns))
+            if job.cancel.is_set():
+                self.post(job, "call", (self.refresh_success, job, None, quiet))
+                return
+            if chunk is None:
+                self.post(job, "call", (self.refresh_success, job, None, quiet, source))
+                return
+
+            # 数据库原地更新（读写由连接的锁串行化）；内存中的存储在快照上更新，由主线程换上
+            with stage("增量更新", rows=len(chunk)):
+                changes = self.apply_changes(store, chunk, job)
+            # 读到了读取前的整个文件时，数据才与该签名对应（末尾有未写完的行或读取期间又有追加时不对应）
+            complete = offset == signature["size"]
+            if paged:
+                # 数据库原地更新，记下新的文件签名，下次打开时无需重新导入；树由 refresh_success 重绘
+                if complete:
+                    store.set_meta("signature", signature)
+                self.post(job, "call", (self.refresh_success, job, changes, quiet, source))
+                return
+            self.post(job, "call", (self.refresh_store, store, changes, source))
+
+            self.post_indexes(store, job)
+            if use_cache and complete:
+                self.store_cache(store, file_path, signature)
+            self.post(job, "call", (self.refresh_success, job, changes, quiet))
         except Exception as e:
-            self.root.after(0, self.refresh_error, e)
-
-    def refresh_success(self):
-        self.stop_progress()
-        messagebox.showinfo("刷新", "评论数据已刷新。")
+            self.post(job, "call", (self.refresh_error, e, job))
+
+    def apply_changes(self, store, chunk, job):
+        # 在评论存储中更新已有评论、追加新评论并重新评级
+        changes = store.apply_rows(chunk, *self.rating_thresholds)
+        self.warn_missing_video_id(changes["missing_video_id"], job)
+        return changes
+
+    def refresh_store(self, store, changes, source):
+        # 主线程中换上刷新后的存储并记下新的读取位置，再只更新受影响的节点
+        self.set_store(store)
+        self.set_source(source)
+        self.patch_tree(changes)
+
+    def set_source(self, source):
+        # source 为 (已读取到的完整行末尾, 其之前的内容, 读取前的文件大小与修改时间)，只在主线程中记下
+        self.source_offset, self.source_anchor, self.source_stat = source
+
+    def patch_tree(self, changes):
+        # 只更新受影响的节点，不重建整棵树；搜索结果和Up主变化时由 refresh_success 重新生成
+        if self.filtered_mask is not None or changes["rerated_all"]:
+            return
+        self.sorted_replies = None
+
+        # 先删除需要重新放置的节点：位置变化的评论，以及不再是顶级的评论
+        removed = np.concatenate((changes["moved"], changes["adopted"]))
+        for pos in removed.tolist():
+            if self.tree.exists(self.tree_iid(pos)):
+                self.delete_node(self.tree_iid(pos))
+        is_removed = np.isin(self.pending_top, removed)
+        self.pending_pos -= int(is_removed[:self.pending_pos].sum())
+        self.pending_top = self.pending_top[~is_removed]
+
+        # 插入新评论与移动过的评论；父评论也在其中的随父评论一起插入
+        placed = np.concatenate((changes["added"], changes["moved"])).tolist()
+        placed_set = set(placed)
+        parent_pos = self.store.parent_pos
+        parents = set()
+        for pos in placed:
+            parent = int(parent_pos[pos])
+            if parent in placed_set or self.tree.exists(self.tree_iid(pos)):
+                continue
+            if parent >= 0:
+                if self.insert_reply_node(pos):
+                    parents.add(parent)
+            else:
+                self.insert_top_level_node(pos)
+        for parent in parents:
+            self.tree.set_children(self.tree_iid(parent), *map(self.tree_iid, self.get_replies(parent)))
+
+        # 刷新其余受影响节点的列值（评级、回复数或内容有变化）
+        for pos in np.concatenate((changes["rated"], changes["modified"])).tolist():
+            iid = self.tree_iid(pos)
+            if pos not in placed_set and self.tree.exists(iid):
+                text, values = self.comment_row(pos)
+                self.tree.item(iid, text=text, values=values)
+
+    def insert_reply_node(self, pos):
+        """把回复插入到已显示的父节点下，返回是否需要调整该父节点下的顺序。"""
+        parent = int(self.store.parent_pos[pos])
+        parent_iid = self.tree_iid(parent)
+        if parent_iid in self.lazy_nodes or not self.tree.exists(parent_iid):
+            # 父节点尚未展开或未显示，展开时会加载
+            return False
+        if self.tree_lazy and not self.tree.get_children(parent_iid):
+            # 原本没有回复的节点：加上占位子节点，展开时再加载
+            self.tree.insert(parent_iid, "end", text="加载中...", tags=("placeholder",))
+            self.lazy_nodes[parent_iid] = (parent, False)
+            return False
+        self.insert_comment_node(parent_iid, pos, lazy=self.tree_lazy)
+        return True
+
+    def insert_top_level_node(self, pos):
+        # 顶级评论按时间排序时插入到对应位置，按其它列排序时放在最后
+        index = len(self.pending_top)
+        if self.sort_column_name in (None, "Time"):
+            sign = -1 if self.sort_order["Time"] else 1
+            keys = sign * self.store.create_time[self.pending_top]
+            key = sign * self.store.create_time[pos]
+            # 时间相同时按行位置排列，与 top_level 的稳定排序一致
+            index = int(np.searchsorted(keys, key, side="left"))
+            ties = self.pending_top[index:int(np.searchsorted(keys, key, side="right"))]
+            index += int(np.count_nonzero(ties < pos))
+        self.pending_top = np.insert(self.pending_top, index, pos)
+        # 插入位置已显示（或全部已显示）时立即插入节点，否则留待翻页
+        if index < self.pending_pos or self.pending_pos == len(self.pending_top) - 1:
+            self.insert_comment_node("", pos, lazy=self.tree_lazy, index=index)
+            self.pending_pos += 1
+
+    def refresh_success(self, job, changes, quiet=False, source=None):
+        self.finish_job(job)
+        if source is not None:
+            self.set_source(source)
+        if changes is not None:
+            # 数据库原地更新，上一次查询的命中已失效
+            self.query_engine = None
+        if changes is not None and self.filtered_mask is not None:
+            self.search_comments()
+        elif changes is not None and (self.paged() or changes["rerated_all"]):
+            self.populate_tree()
+        if quiet:
+            return
+        if changes is None:
+            messagebox.showinfo("刷新", "没有新的评论数据。")
+        else:
+            messagebox.showinfo(
+                "刷新", f"评论数据已刷新：新增 {len(changes['added'])} 条，更新 {len(changes['modified'])} 条。"
+            )
 
-    def refresh_error(self, error):
-        self.stop_progress()
+    def refresh_error(self, error, job):
+        self.finish_job(job)
         messagebox.showerror("错误", f"刷新失败: {error}")
 
+    def poll_source(self):
+        # 监视模式下，空闲且源文件大小或修改时间变化时自动增量刷新
+        if self.watch_file.get() and self.job is None and self.source_path is not None:
+            try:
+                stat = os.stat(self.source_path)
+                if (stat.st_size, stat.st_mtime_ns) != self.source_stat:
+                    self.refresh_tree(quiet=True)
+            except OSError:
+                pass
+        self.root.after(self.watch_interval, self.poll_source)
+
     def export_txt(self):
-        if self.df is None:
+        if self.store is None:
             messagebox.showwarning("警告", "没有加载任何CSV文件。")
             return
 
@@ -389,43 +1185,33 @@ class CommentApp:
         # 启动进度条
         self.start_progress()
 
-        # 启动一个新线程导出
-        threading.Thread(target=self.export_txt_thread, args=(file_path,)).start()
+        # 导出读取点击时的数据快照，可与之后的刷新或重新加载同时进行；同一文件的新导出取代旧的
+        run_id = self.profiler.begin_run("导出TXT")
+        job = Job(f"导出TXT {os.path.basename(file_path)}")
+        self.submit_job(job, run_id, self.export_txt_thread, file_path, self.store.snapshot(),
+                        self.sort_order.get("Time", False), run_id, key=("export", file_path), priority=PRIORITY_LOW)
 
-    def export_txt_thread(self, file_path):
+    def export_txt_thread(self, file_path, store, reverse, run_id):
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                # 找到顶级评论
-                top_level_comments = [
-                    comment for comment in self.comments.values()
-                    if comment["parent_comment_id"] not in self.comments
-                ]
-
-                # 按create_time排序顶级评论
-                top_level_comments.sort(key=lambda x: x["create_time"], reverse=self.sort_order.get("Time", False))
-
-                for comment in top_level_comments:
-                    f.write("{\n")
-                    f.write(f"    main_post: {comment['comment_id']}\n")
-                    f.write(f"    time: {self.convert_timestamp(comment['create_time'])}\n")
-                    f.write(f"    username: {comment['nickname']} ({comment['user_id']})\n")
-                    replyer_number = len(self.replies.get(comment["comment_id"], []))
-                    f.write(f"    replyer_number: {replyer_number}\n")
-                    f.write(f"    rating: {comment['rating']}\n")
-                    f.write(f"    content: {comment['content']}\n")
-
-                    # 插入回复
-                    self.write_replies(f, comment["comment_id"], indent_level=1, replyer_count=1)
-
-                    f.write("}\n\n")
+            # 顶级评论按create_time排序，方向与时间列当前的排序方向一致
+            with stage("导出TXT", rows=len(store)):
+                save_txt(file_path, store, reverse=reverse)
 
             # 停止进度条并显示成功消息（通过主线程）
-            self.root.after(0, self.export_success, file_path)
+            self.call_soon(self.export_success, file_path, run_id)
         except Exception as e:
-            self.root.after(0, self.export_error, e)
+            self.call_soon(self.export_error, e)
+        finally:
+            self.release_snapshot(store)
+
+    def release_snapshot(self, store):
+        # 数据库快照占用一个连接与读事务，用完即关闭
+        if isinstance(store, CommentDatabase):
+            store.close()
 
-    def export_success(self, file_path):
+    def export_success(self, file_path, run_id=None):
         self.stop_progress()
+        self.show_profile(run_id)
         messagebox.showinfo("成功", f"成功导出TXT文件到: {file_path}")
 
     def export_error(self, error):
@@ -433,14 +1219,17 @@ class CommentApp:
         messagebox.showerror("错误", f"导出TXT文件失败: {error}")
 
     def export_csv(self):
-        if self.df is None:
+        if self.store is None:
             messagebox.showwarning("警告", "没有加载任何CSV文件。")
             return
 
-        # 选择保存位置
+        # 选择保存位置，按扩展名决定导出格式（CSV、Parquet或JSON Lines）
         file_path = filedialog.asksaveasfilename(
             defaultextension=".csv",
-            filetypes=(("CSV Files", "*.csv"), ("All Files", "*.*")),
+            filetypes=(
+                ("CSV Files", "*.csv"), ("Parquet Files", "*.parquet"),
+                ("JSON Lines Files", "*.jsonl"), ("All Files", "*.*")
+            ),
             title="保存为CSV文件"
         )
 
@@ -450,80 +1239,104 @@ class CommentApp:
         # 启动进度条
         self.start_progress()
 
-        # 启动一个新线程导出
-        threading.Thread(target=self.export_csv_thread, args=(file_path,)).start()
+        run_id = self.profiler.begin_run("导出表格")
+        job = Job(f"导出表格 {os.path.basename(file_path)}")
+        self.submit_job(job, run_id, self.export_csv_thread, file_path, self.store.snapshot(), run_id,
+                        key=("export", file_path), priority=PRIORITY_LOW)
 
-    def export_csv_thread(self, file_path):
+    def export_csv_thread(self, file_path, store, run_id):
         try:
-            # 准备导出数据
-            data_to_export = []
-
-            for comment in self.comments.values():
-                data = {
-                    "comment_id": comment.get("comment_id", ""),
-                    "parent_comment_id": comment.get("parent_comment_id", ""),
-                    "create_time": self.convert_timestamp(comment.get("create_time", 0)),
-                    "video_id": comment.get("video_id", "N/A"),  # 使用get避免KeyError
-                    "content": comment.get("content", ""),
-                    "user_id": comment.get("user_id", ""),
-                    "nickname": comment.get("nickname", ""),
-                    "avatar": comment.get("avatar", ""),
-                    "sub_comment_count": comment.get("sub_comment_count", ""),
-                    "last_modify_ts": comment.get("last_modify_ts", ""),
-                    "rating": comment.get("rating", "")
-                }
-                data_to_export.append(data)
-
-            # 将数据转换为DataFrame
-            export_df = pd.DataFrame(data_to_export)
-
-            # 导出为CSV
-            export_df.to_csv(file_path, index=False, encoding='utf-8-sig')
+            # 直接由评论存储分块写出，不再逐条组装字典
+            with stage("导出表格", rows=len(store)):
+                save_table(file_path, store)
 
             # 停止进度条并显示成功消息（通过主线程）
-            self.root.after(0, self.export_csv_success, file_path)
+            self.call_soon(self.export_csv_success, file_path, run_id)
         except Exception as e:
-            self.root.after(0, self.export_csv_error, e)
+            self.call_soon(self.export_csv_error, e)
+        finally:
+            self.release_snapshot(store)
 
-    def export_csv_success(self, file_path):
+    def export_csv_success(self, file_path, run_id=None):
         self.stop_progress()
-        messagebox.showinfo("成功", f"成功导出CSV文件到: {file_path}")
+        self.show_profile(run_id)
+        messagebox.showinfo("成功", f"成功导出文件到: {file_path}")
 
     def export_csv_error(self, error):
         self.stop_progress()
-        messagebox.showerror("错误", f"导出CSV文件失败: {error}")
-
-    def write_replies(self, file, parent_id, indent_level, replyer_count):
-        replies = self.replies.get(parent_id, [])
-        for idx, reply in enumerate(replies, start=1):
-            indent = "    " * (indent_level + 1)
-            file.write(f"{indent}replyer{idx}:\n")
-            file.write(f"{indent}    time: {self.convert_timestamp(reply['create_time'])}\n")
-            file.write(f"{indent}    username: {reply['nickname']} ({reply['user_id']})\n")
-            replyer_number = len(self.replies.get(reply["comment_id"], []))
-            file.write(f"{indent}    replyer_number: {replyer_number}\n")
-            file.write(f"{indent}    rating: {reply['rating']}\n")
-            file.write(f"{indent}    content: {reply['content']}\n")
-            # 递归写入更深层的回复
-            self.write_replies(file, reply["comment_id"], indent_level + 1, replyer_count=1)
+        messagebox.showerror("错误", f"导出文件失败: {error}")
+
+    def build_query(self):
+        """由搜索框与筛选栏生成查询，输入有误时提示并返回None。"""
+        entries = {name: entry.get().strip() for name, entry in self.filter_entries.items()}
+        try:
+            return Query(
+                self.search_entry.get().strip(),
+                ratings=entries["ratings"].replace("，", ",").replace(",", " ").upper().split() or None,
+                start=parse_time(entries["start"], self.display_timezone),
+                end=parse_time(entries["end"], self.display_timezone, end=True),
+                user_id=entries["user_id"] or None,
+                video_id=entries["video_id"] or None,
+                min_replies=parse_int(entries["min_replies"]),
+                max_replies=parse_int(entries["max_replies"]),
+            )
+        except (ValueError, TypeError) as e:
+            messagebox.showerror("错误", f"筛选条件有误: {e}")
+            return None
+
+    def clear_filters(self):
+        for entry in self.filter_entries.values():
+            entry.delete(0, tk.END)
+        self.search_comments()
 
     def search_comments(self):
-        query = self.search_entry.get().strip().lower()
-        if not query:
+        if self.store is None:
+            return
+        query = self.build_query()
+        if query is None:
+            return
+        self.profiler.begin_run("搜索")
+        if query.is_empty():
             self.populate_tree()
             return
 
-        # 过滤符合条件的评论
-        self.filtered_comments = {cid: comment for cid, comment in self.comments.items()
-                                  if query in comment['nickname'].lower() or query in comment['content'].lower()}
-        self.filtered_replies = {}
-        for parent_id, replies in self.replies.items():
-            filtered = [reply for reply in replies if reply['comment_id'] in self.filtered_comments]
-            if filtered:
-                self.filtered_replies[parent_id] = filtered
+        # 命中的评论连同各级父评论一起显示（父评论未命中时以灰色显示），回复保持原有顺序
+        store = self.store
+        if self.query_engine is None:
+            self.query_engine = DbQueryEngine(store) if self.paged() else QueryEngine(store, self.search_index)
+        with stage("搜索", rows=len(store)) as info:
+            if self.paged():
+                # 显示的行保存在数据库的临时表中，按需查询
+                hits, shown = self.query_engine.run(query)
+                self.context_mask = shown.context
+            else:
+                rows, shown = self.query_engine.run(query)
+                hits = len(rows)
+                self.context_mask = shown.copy()
+                self.context_mask[rows] = False
+            self.filtered_mask = shown
+            self.filtered_children = store.build_children(mask=shown)
+            info["hits"] = hits
         self.populate_tree(filtered=True)
 
+    def on_search_key(self, event):
+        if not self.live_search.get() or event.keysym == "Return":
+            return
+        # 防抖：输入停顿后才执行搜索
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(self.search_delay, self.run_live_search)
+
+    def run_live_search(self):
+        self.search_after_id = None
+        self.search_comments()
+
     def sort_column(self, col):
+        if self.job is not None:
+            # 正在插入的树还不完整，等当前任务结束后再排序
+            messagebox.showinfo("提示", "当前任务完成后才能排序。")
+            return
+
         # 切换排序方向
         self.sort_order[col] = not self.sort_order[col]
 
@@ -535,39 +1348,89 @@ class CommentApp:
             else:
                 self.tree.heading(column, text=column, command=lambda _col=column: self.sort_column(_col))
 
-        # 获取所有顶级评论
-        top_level_comments = [c for c in self.comments.values() if c["parent_comment_id"] not in self.comments]
+        if self.paged():
+            self.sort_paged(col)
+            return
+        if self.sort_index is None:
+            return
+        run_id = self.profiler.begin_run(f"排序 {col}")
+        start = time.perf_counter()
+
+        # 取预先计算好的升序行位置，降序时直接反转
+        store = self.store
+        filtered = self.filtered_mask is not None
+        if col == "Replyer_Number" and filtered:
+            # 搜索结果中显示的是命中的回复数，按它排序
+            order = np.argsort(self.filtered_children.counts(), kind="stable")
+        else:
+            order = self.sort_index[self.sort_keys[col]]
+        if self.sort_order[col]:
+            order = order[::-1]
 
-        # 根据列类型进行排序
-        if col == "Time":
-            sorted_comments = sorted(top_level_comments, key=lambda x: x["create_time"], reverse=self.sort_order[col])
-        elif col == "Replyer_Number":
-            sorted_comments = sorted(top_level_comments, key=lambda x: int(x["Replyer_Number"]) if x["Replyer_Number"].isdigit() else 0, reverse=self.sort_order[col])
-        elif col == "Rating":
-            sorted_comments = sorted(top_level_comments, key=lambda x: self.rating_order.get(x["rating"], 100), reverse=self.sort_order[col])
+        # 顶级评论：父评论不在数据中（搜索时为父评论未命中）的评论
+        if filtered:
+            parent_matched = np.zeros(len(store), dtype=bool)
+            has_parent = store.parent_pos >= 0
+            parent_matched[has_parent] = self.filtered_mask[store.parent_pos[has_parent]]
+            is_top = self.filtered_mask & ~parent_matched
         else:
-            sorted_comments = sorted(top_level_comments, key=lambda x: x[col].lower() if isinstance(x[col], str) else x[col], reverse=self.sort_order[col])
-
-        # 清空Treeview
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        # 插入排序后的顶级评论
-        for comment in sorted_comments:
-            time_str = self.convert_timestamp(comment["create_time"])
-            replyer_number = len(self.replies.get(comment["comment_id"], [])) if not self.filtered_comments else len(self.filtered_replies.get(comment["comment_id"], []))
-            node = self.tree.insert(
-                "",
-                "end",
-                text=comment["comment_id"],
-                values=(comment["nickname"], comment["content"], time_str, replyer_number, comment["rating"])
-            )
-            self.insert_replies(node, comment["comment_id"], self.filtered_comments)
+            is_top = store.parent_pos < 0
+        top_level = order[is_top[order]]
+
+        # 需要时各级回复也按同一顺序排列（按父评论稳定分组，组内保持排序结果）
+        self.sorted_replies = None
+        if self.sort_replies.get():
+            self.sorted_replies = store.build_children(order, self.filtered_mask)
+
+        self.sort_column_name = col
+        self.reorder_tree(top_level, filtered)
+        self.profiler.record("排序", start, time.perf_counter(), rows=len(store))
+        self.show_profile(run_id)
+
+    def sort_paged(self, col):
+        # 数据库中按列排序：重新从第一页开始显示，各页由数据库按该列排好后读取
+        self.profiler.begin_run(f"排序 {col}")
+        key = self.sort_keys[col]
+        descending = self.sort_order[col]
+        filtered = self.filtered_mask is not None
+        top_level = self.store.top_level(descending, self.filtered_mask, key, reverse_ties=descending,
+                                         rating_order=self.rating_order)
+        self.sorted_replies = None
+        if self.sort_replies.get():
+            self.sorted_replies = self.store.build_children((key, descending, self.rating_order), self.filtered_mask)
+        self.sort_column_name = col
+        self.show_top_level(top_level, filtered)
+
+    def reorder_tree(self, top_level, filtered=False):
+        # 用 set_children（批量的 move）原地调整已插入节点的顺序，不重建树
+        iids = [self.tree_iid(pos) for pos in top_level.tolist()]
+        if self.tree_lazy:
+            # 延迟加载：已显示的顶级评论数不变，换成新顺序下的前几条
+            iids = iids[:self.pending_pos]
+            existing = set(self.tree.get_children())
+            for pos, iid in zip(top_level.tolist(), iids):
+                if iid not in existing:
+                    self.insert_comment_node("", pos, filtered, lazy=True)
+            for iid in existing.difference(iids):
+                self.delete_node(iid)
+        self.pending_top = top_level
+        self.tree.set_children("", *iids)
+
+        # 已插入回复的节点按新顺序排列；不再排序回复时恢复为时间顺序
+        if self.sorted_replies is None and not self.tree_replies_sorted:
+            return
+        children = self.get_children(filtered)
+        for parent in np.flatnonzero(children.counts() > 1).tolist():
+            parent_iid = self.tree_iid(parent)
+            if parent_iid not in self.lazy_nodes and self.tree.exists(parent_iid):
+                self.tree.set_children(parent_iid, *map(self.tree_iid, children.of(parent).tolist()))
+        self.tree_replies_sorted = self.sorted_replies is not None
 
 def main():
     root = tk.Tk()
     app = CommentApp(root)
     root.mainloop()
+    app.jobs.shutdown()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,574 @@
+import argparse
+import importlib.util
+import itertools
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from comment_db import DbQueryEngine, import_csv, open_database
+from comment_core import (
+    DISPLAY_TIMEZONE, LOAD_COLUMNS, REQUIRED_COLUMNS, build_comment_table, compression_of, detect_encoding,
+    open_source, read_comments_csv, sort_orders
+)
+from comment_export import save_txt, save_csv, save_csv_records, save_jsonl, save_parquet
+from comment_parallel import build_store_parallel
+from comment_query import Query, QueryEngine
+from comment_search import SearchIndex, scan_search
+from comment_store import TEXT_FIELDS, CommentStore, build_store, walk
+
+# 与界面一致的评级排序顺序（见 CommentApp.rating_order）
+RATING_ORDER = {
+    "A1": 1, "A2": 2,
+    "B1": 3, "B2": 4, "B3": 5,
+    "C1": 6, "C2": 7, "C3": 8,
+    "D": 9
+}
+# 模拟数据的起始时间（秒）与评论ID起点
+SYNTH_START_TIME = 1700000000
+SYNTH_ID_BASE = 200000000000
+# 评论串形状：顶级评论占比，以及回复挂在上一条附近评论下的概率
+THREAD_SHAPES = {
+    "wide": {"top_share": 0.3, "nested_share": 0.2},
+    "deep": {"top_share": 0.02, "nested_share": 0.95},
+}
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def gb2312_chars(count, rng):
+    # 常用汉字（GB2312一级字库），GBK与UTF-8都能编码
+    high = rng.integers(0xB0, 0xD8, count)
+    low = rng.integers(0xA1, 0xFF, count)
+    # 0xD7 区只到 0xF9
+    low = np.where((high == 0xD7) & (low > 0xF9), 0xA1, low)
+    data = np.column_stack((high, low)).astype(np.uint8).tobytes()
+    return data.decode("gb2312")
+
+
+def phrase_pool(rng, size=2000):
+    # 评论内容由短语拼接而成，短语长度2~12个字，少量夹带ASCII
+    text = gb2312_chars(size * 12, rng)
+    lengths = rng.integers(2, 13, size)
+    phrases = [text[i * 12:i * 12 + length] for i, length in enumerate(lengths)]
+    extras = ["哈哈哈", "2333", "awsl", "up主", "BV号", "？？？", "!!!", "yyds"]
+    return np.array(phrases + extras, dtype=object)
+
+
+def generate_comments(rows, shape="wide", duplicate_rate=0.0, missing_video_rate=0.0, seed=0):
+    """生成与爬虫导出格式一致的模拟评论表（所有列均为字符串）。
+
+    shape 为 wide（顶级评论多、回复大多直接挂在近期热门评论下）或 deep
+    （回复大多接在上一条评论下，形成很长的回复链）；duplicate_rate 为重复
+    comment_id 的行比例，missing_video_rate 为 video_id 为空的行比例。
+    """
+    rng = np.random.default_rng(seed)
+    params = THREAD_SHAPES[shape]
+    positions = np.arange(rows)
+
+    # 父评论：顶级评论的parent_comment_id为0；回复按近期偏好挂在之前的顶级评论
+    # 或附近的评论下，父评论总在子评论之前出现
+    is_top = rng.random(rows) < params["top_share"]
+    is_top[:1] = True
+    top_positions = np.flatnonzero(is_top)
+    tops_before = np.cumsum(is_top) - 1
+    back = np.minimum(rng.geometric(0.05, rows) - 1, tops_before)
+    parent = top_positions[tops_before - back]
+    nested = rng.random(rows) < params["nested_share"]
+    nearby = np.maximum(positions - rng.geometric(0.6, rows), 0)
+    parent = np.where(nested, nearby, parent)
+    parent = np.where(is_top, -1, parent)
+
+    comment_ids = SYNTH_ID_BASE + positions * 7
+    # 重复的comment_id取自之前的某一行（模拟重复抓取）
+    duplicate = rng.random(rows) < duplicate_rate
+    duplicate[:1] = False
+    comment_ids = np.where(duplicate, comment_ids[(rng.random(rows) * positions).astype(np.int64)], comment_ids)
+    parent_ids = np.where(is_top, 0, comment_ids[np.maximum(parent, 0)])
+
+    create_time = SYNTH_START_TIME + np.cumsum(rng.integers(0, 30, rows))
+    child_count = np.bincount(parent[parent >= 0], minlength=rows)
+
+    # 用户活跃度呈长尾分布，第一条顶级评论来自Up主（用户0）
+    users = max(rows // 5, 1)
+    user_ids = (rng.pareto(1.2, rows) * 100).astype(np.int64) % users
+    user_ids[0] = 0
+    user_ids += 10000
+
+    pool = phrase_pool(rng)
+    first = pool[rng.integers(0, len(pool), rows)]
+    second = pool[rng.integers(0, len(pool), rows)]
+    two_parts = rng.random(rows) < 0.7
+    content = pd.Series(first) + np.where(two_parts, "，", "") + np.where(two_parts, second, "")
+
+    videos = np.array([f"BV1{seed:02d}{i:07d}" for i in range(max(rows // 100000, 1))], dtype=object)
+    video_ids = videos[rng.integers(0, len(videos), rows)]
+    video_ids[rng.random(rows) < missing_video_rate] = ""
+
+    user_text = pd.Series(user_ids).astype(str)
+    return pd.DataFrame({
+        "comment_id": comment_ids.astype(str),
+        "parent_comment_id": parent_ids.astype(str),
+        "create_time": create_time.astype(str),
+        "video_id": video_ids,
+        "content": content.to_numpy(dtype=object),
+        "user_id": user_text.to_numpy(dtype=object),
+        "nickname": ("用户" + user_text).to_numpy(dtype=object),
+        "avatar": ("https://i0.hdslb.com/bfs/face/" + user_text + ".jpg").to_numpy(dtype=object),
+        "sub_comment_count": child_count.astype(str),
+        "last_modify_ts": ((create_time + 60) * 1000).astype(str),
+    }, columns=REQUIRED_COLUMNS)
+
+
+def write_comments(file_path, df, encoding="utf-8"):
+    # 扩展名为 .gz/.zst 时按扩展名压缩
+    df.to_csv(file_path, index=False, encoding=encoding)
+
+
+def read_all_text(file_path):
+    # 原先的读取方式：全部列按文本读取
+    encoding, _ = detect_encoding(file_path)
+    with open_source(file_path) as (f, _):
+        return pd.read_csv(f, dtype=str, encoding=encoding)
+
+
+def bench_read(file_path, repeat=3):
+    """全部列按文本读取，与只读取所需的列并直接解析整数列（可选pyarrow解析器）的对比。"""
+    readers = [
+        ("all_text", read_all_text),
+        ("projected", lambda path: read_comments_csv(path, LOAD_COLUMNS)[0]),
+        ("projected_pyarrow", lambda path: read_comments_csv(path, LOAD_COLUMNS, "pyarrow")[0]),
+    ]
+    results = {
+        "file_mb": os.path.getsize(file_path) / 2**20,
+        "compression": compression_of(file_path),
+        "pyarrow": importlib.util.find_spec("pyarrow") is not None,
+        "readers": [],
+    }
+    for name, reader in readers:
+        df, _ = timed(reader, file_path)
+        wall_time = min(timed(reader, file_path)[1] for _ in range(repeat))
+        results["rows"] = len(df)
+        results["readers"].append({
+            "reader": name,
+            "wall_s": wall_time,
+            "peak_mb": peak_memory(reader, file_path) / 2**20,
+            "frame_mb": df.memory_usage(deep=True).sum() / 2**20,
+        })
+    return results
+
+
+def bench_search(file_path, queries, repeat=5):
+    # 比较索引搜索与原先逐条扫描的耗时
+    df = pd.read_csv(file_path, dtype=str)
+    store, _ = build_store(df)
+    nicknames, contents = store.columns["nickname"], store.columns["content"]
+
+    index, build_time = timed(SearchIndex, nicknames, contents)
+    results = {"rows": len(store), "index_build_s": build_time, "queries": []}
+    for query in queries:
+        scan_hits, scan_time = timed(scan_search, nicknames, contents, query)
+        index_time = min(timed(index.search, query)[1] for _ in range(repeat))
+        hits = index.search(query)
+        if len(hits) != len(scan_hits) or (hits != scan_hits).any():
+            raise AssertionError(f"索引搜索结果与扫描结果不一致: {query!r}")
+        results["queries"].append({
+            "query": query,
+            "hits": len(hits),
+            "scan_ms": scan_time * 1000,
+            "index_ms": index_time * 1000,
+        })
+    return results
+
+
+def peak_memory(func, *args):
+    # 函数执行期间Python分配（含numpy数组）的峰值字节数
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def store_records(store):
+    # 原导出所用的评论字典（按评论ID），由评论存储的评论表逐行组装
+    table = store.table()
+    return dict(zip(table["comment_id"].tolist(), table.to_dict("records")))
+
+
+def bench_export(file_path, repeat=3):
+    # 比较逐条组装字典的原导出与由评论存储分块写出的导出
+    df = pd.read_csv(file_path, dtype=str)
+    store, _ = build_store(df)
+    comments = store_records(store)
+    exporters = [
+        ("csv_records", ".csv", save_csv_records, comments),
+        ("csv", ".csv", save_csv, store),
+        ("jsonl", ".jsonl", save_jsonl, store),
+        ("parquet", ".parquet", save_parquet, store),
+    ]
+    results = {"rows": len(store), "exports": []}
+    with tempfile.TemporaryDirectory() as out_dir:
+        for name, extension, func, data in exporters:
+            out_path = os.path.join(out_dir, name + extension)
+            try:
+                wall_time = min(timed(func, out_path, data)[1] for _ in range(repeat))
+            except ImportError as e:
+                results["exports"].append({"format": name, "skipped": str(e)})
+                continue
+            results["exports"].append({
+                "format": name,
+                "wall_s": wall_time,
+                "peak_mb": peak_memory(func, out_path, data) / 2**20,
+                "size_mb": os.path.getsize(out_path) / 2**20,
+            })
+    return results
+
+
+def load_app_module():
+    # 界面模块的文件名不是合法的模块名，按路径加载（会导入tkinter，但不创建窗口）
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "3.py")
+    spec = importlib.util.spec_from_file_location("comment_app", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def tree_rows_headless(app_module, store):
+    # 不创建窗口，只运行界面生成Treeview行的代码（即加载线程中的工作）
+    app = app_module.CommentApp.__new__(app_module.CommentApp)
+    app.store = store
+    app.sorted_replies = None
+    app.batch_size = 1000
+    positions, parents, _, _ = walk(store.top_level(), store.children)
+    return sum(len(batch) for batch in app.tree_row_batches(positions, parents))
+
+
+def tree_rows_display(app_module, store):
+    # 在真实的Treeview中插入全部行（需要显示环境，例如 xvfb-run）
+    root = app_module.tk.Tk()
+    root.withdraw()
+    try:
+        app = app_module.CommentApp(root)
+        app.store = store
+        positions, parents, _, _ = walk(store.top_level(), store.children)
+        count = 0
+        for batch in app.tree_row_batches(positions, parents):
+            for parent_iid, iid, text, values, tags in batch:
+                app.tree.insert(parent_iid, "end", iid=iid, text=text, values=values, tags=tags)
+            count += len(batch)
+        root.update()
+        return count
+    finally:
+        root.destroy()
+
+
+def search_queries(store, count=3):
+    # 查询词取自数据本身：高频单字、一个短语和一个昵称
+    contents = store["content"].fillna("")
+    queries = [contents.iat[0][:1], contents.iat[len(contents) // 2][:4], store.value("nickname", len(store) - 1)]
+    return [query for query in queries[:count] if isinstance(query, str) and query]
+
+
+def run_search(store, queries):
+    index = SearchIndex(store.columns["nickname"], store.columns["content"])
+    return [len(index.search(query)) for query in queries]
+
+
+def run_query(store, queries):
+    # 文本与评级、时间、回复数条件组合的查询，结果连同各级父评论（每个查询收窄上一个）
+    engine = QueryEngine(store, SearchIndex(store.columns["nickname"], store.columns["content"]))
+    middle = int(np.median(store.create_time)) if len(store) else 0
+    shown = []
+    for query in queries:
+        for narrowed in (Query(query), Query(query, ratings=["C1", "C2", "C3", "D"]),
+                         Query(query, ratings=["C1", "C2", "C3", "D"], end=middle, min_replies=0)):
+            shown.append(int(engine.run(narrowed)[1].sum()))
+    return shown
+
+
+def run_sort(store):
+    # 预先计算各列排序，再按每列取出顶级评论的显示顺序（点击列标题时的工作）
+    orders = sort_orders(store, RATING_ORDER, store.parent_pos)
+    is_top = store.parent_pos < 0
+    return {name: order[is_top[order]] for name, order in orders.items()}
+
+
+def make_store(df):
+    # 构建评论存储（不含评级）
+    _, table, _ = build_comment_table(df)
+    return CommentStore.from_table(table)
+
+
+def run_stage(stages, name, memory, func, *args):
+    """计时运行一个阶段；memory 为真时在tracemalloc下再运行一次记录内存峰值。"""
+    result, seconds = timed(func, *args)
+    stage = {"stage": name, "wall_s": seconds}
+    if memory:
+        stage["peak_mb"] = peak_memory(func, *args) / 2**20
+    stages.append(stage)
+    return result
+
+
+def bench_file(file_path, out_dir, memory=True, display=False):
+    """对一个CSV文件依次测量各处理阶段，返回阶段列表。"""
+    stages = []
+    df, encoding, _ = run_stage(stages, "read", memory, read_comments_csv, file_path)
+    store = run_stage(stages, "process_data", memory, make_store, df)
+    del df
+    run_stage(stages, "ratings", memory, store.rate)
+
+    try:
+        app_module = load_app_module()
+    except ImportError as e:
+        stages.append({"stage": "tree", "skipped": str(e)})
+    else:
+        if display:
+            run_stage(stages, "tree_display", False, tree_rows_display, app_module, store)
+        else:
+            run_stage(stages, "tree_headless", memory, tree_rows_headless, app_module, store)
+
+    run_stage(stages, "search", memory, run_search, store, search_queries(store))
+    run_stage(stages, "query", memory, run_query, store, search_queries(store))
+    run_stage(stages, "sort", memory, run_sort, store)
+    run_stage(stages, "export_txt", memory, save_txt, os.path.join(out_dir, "export.txt"), store)
+    run_stage(stages, "export_csv", memory, save_csv, os.path.join(out_dir, "export.csv"), store)
+    return {"rows": len(store), "encoding": encoding, "store_mb": store.nbytes / 2**20, "stages": stages}
+
+
+def first_page(db, order=None, page_size=500):
+    # 打开后首屏的工作：取第一页顶级评论并生成各行的列值；order 为 top_level 的排序参数
+    pages = db.top_level(**(order or {}))
+    children = db.children
+    rows = pages[:page_size].tolist()
+    return [(db.value("nickname", pos), db.value("content", pos), db.value("time_str", pos), children.count(pos))
+            for pos in rows]
+
+
+def run_db_query(db, queries):
+    engine = DbQueryEngine(db)
+    shown = []
+    for query in queries:
+        for narrowed in (Query(query), Query(query, ratings=["C1", "C2", "C3", "D"])):
+            hits, selection = engine.run(narrowed)
+            shown.append(hits)
+            first_page(db, {"mask": selection})
+    return shown
+
+
+def bench_database(file_path, out_dir, repeat=3):
+    """数据库模式的各阶段：导入、再次打开、首屏、搜索、按列排序的首屏与导出（只取耗时，内存由SQLite页缓存限定）。"""
+    stages = []
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    db, _ = run_stage(stages, "import", False, import_csv, file_path)
+    db.close()
+    db = run_stage(stages, "open", False, open_database, file_path)
+    run_stage(stages, "first_page", False, first_page, db)
+    queries = [query for query in (db.value("content", 0)[:1], db.value("content", len(db) // 2)[:4],
+                                   db.value("nickname", len(db) - 1)) if isinstance(query, str) and query]
+    run_stage(stages, "query", False, run_db_query, db, queries)
+    for key in ("nickname", "reply_count", "rating"):
+        order = {"key": key, "reverse": True, "reverse_ties": True, "rating_order": RATING_ORDER}
+        run_stage(stages, f"sort_{key}", False, first_page, db, order)
+    run_stage(stages, "export_txt", False, save_txt, os.path.join(out_dir, "export.txt"), db)
+    run_stage(stages, "export_csv", False, save_csv, os.path.join(out_dir, "export.csv"), db)
+    db.close()
+    open_times = []
+    for _ in range(repeat):
+        reopened, seconds = timed(open_database, file_path)
+        reopened.close()
+        open_times.append(seconds)
+    return {
+        "rows": len(db),
+        "db_mb": os.path.getsize(db.path) / 2**20,
+        "open_s_best": min(open_times),
+        # 进程最大常驻内存的增量（Linux下ru_maxrss单位为KB）
+        "max_rss_growth_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024,
+        "stages": stages,
+    }
+
+
+def same_store(a, b):
+    # 两个评论存储的各列取值、父子关系与ID查找表是否完全相同
+    rows = np.arange(len(a))
+    if len(a) != len(b) or a.up_host_id != b.up_host_id:
+        return False
+    for field in TEXT_FIELDS:
+        if not pd.Series(a.take(field, rows)).equals(pd.Series(b.take(field, rows))):
+            return False
+    return all(np.array_equal(x, y) for x, y in (
+        (a.create_time, b.create_time), (a.parent_pos, b.parent_pos),
+        (a.children.offsets, b.children.offsets), (a.children.index, b.children.index),
+        (a.ids.hashes, b.ids.hashes), (a.ids.order, b.ids.order),
+    ))
+
+
+def bench_parallel(file_path, workers_list, per_video_host=False, repeat=1):
+    """单进程与多进程构建评论存储的耗时对比（不含读取CSV），并校验结果完全相同。"""
+    df = read_comments_csv(file_path)[0]
+    serial_times = []
+    for _ in range(repeat):
+        (serial, _), seconds = timed(build_store, df, DISPLAY_TIMEZONE, 10, 100, per_video_host)
+        serial_times.append(seconds)
+    results = {
+        "rows": len(df),
+        "videos": int(df["video_id"].nunique()),
+        "per_video_host": per_video_host,
+        "serial_s": min(serial_times),
+        "parallel": [],
+    }
+    for workers in workers_list:
+        times = []
+        for _ in range(repeat):
+            (store, _), seconds = timed(build_store_parallel, df, DISPLAY_TIMEZONE, 10, 100, per_video_host, workers)
+            times.append(seconds)
+        if not same_store(serial, store):
+            raise AssertionError(f"多进程构建的结果与单进程不一致: workers={workers}")
+        results["parallel"].append({
+            "workers": workers,
+            "seconds": min(times),
+            "speedup": results["serial_s"] / min(times),
+        })
+    return results
+
+
+def environment():
+    return {
+        "python": sys.version.split()[0],
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def bench_suite(sizes, shapes, encodings, duplicate_rate, missing_video_rate, seed=0,
+                memory=True, display=False, data_dir=None):
+    """对每种 行数×形状×编码 组合生成模拟数据并测量各阶段。
+
+    data_dir 为空时数据写入临时目录并在结束后删除，否则保留在该目录中。
+    """
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = data_dir or tmp_dir
+        os.makedirs(data_dir, exist_ok=True)
+        for rows, shape, encoding in itertools.product(sizes, shapes, encodings):
+            config = {
+                "rows": rows, "shape": shape, "encoding": encoding,
+                "duplicate_rate": duplicate_rate, "missing_video_rate": missing_video_rate, "seed": seed,
+            }
+            print(f"[基准] {config}", file=sys.stderr, flush=True)
+            file_path = os.path.join(data_dir, f"synth_{shape}_{rows}_{encoding}.csv")
+            df, generate_time = timed(generate_comments, rows, shape, duplicate_rate, missing_video_rate, seed)
+            write_comments(file_path, df, encoding)
+            del df
+            run = {"config": config, "generate_s": generate_time,
+                   "file_mb": os.path.getsize(file_path) / 2**20}
+            run.update(bench_file(file_path, tmp_dir, memory, display))
+            runs.append(run)
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": environment(),
+        "memory_traced": memory,
+        # 进程的最大常驻内存（Linux下单位为KB）
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "runs": runs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="评论管理器性能基准")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    search_parser = subparsers.add_parser("search", help="索引搜索与线性扫描对比")
+    search_parser.add_argument("file", help="爬虫导出的CSV文件")
+    search_parser.add_argument("-q", "--query", action="append", required=True, help="查询词，可重复指定")
+    search_parser.add_argument("--repeat", type=int, default=5)
+
+    export_parser = subparsers.add_parser("export", help="表格导出的耗时与内存峰值对比")
+    export_parser.add_argument("file", help="爬虫导出的CSV文件")
+    export_parser.add_argument("--repeat", type=int, default=3)
+
+    database_parser = subparsers.add_parser("database", help="数据库模式的导入、打开、首屏、搜索与导出耗时")
+    database_parser.add_argument("file", help="爬虫导出的CSV文件（数据库建在其旁的缓存目录中）")
+    database_parser.add_argument("--repeat", type=int, default=3)
+
+    parallel_parser = subparsers.add_parser("parallel", help="按视频分区的多进程处理与单进程处理对比")
+    parallel_parser.add_argument("file", help="爬虫导出的CSV文件")
+    parallel_parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, os.cpu_count() or 1],
+                                 help="进程数，可指定多个")
+    parallel_parser.add_argument("--per-video-host", action="store_true", help="每个视频分别确定Up主")
+    parallel_parser.add_argument("--repeat", type=int, default=1)
+
+    read_parser = subparsers.add_parser("read", help="按列读取与整数解析的耗时与内存，支持 .csv.gz/.csv.zst")
+    read_parser.add_argument("file", help="爬虫导出的CSV文件")
+    read_parser.add_argument("--repeat", type=int, default=3)
+
+    generate_parser = subparsers.add_parser("generate", help="生成模拟的爬虫评论CSV")
+    generate_parser.add_argument("file", help="输出的CSV文件（扩展名为 .csv.gz/.csv.zst 时压缩）")
+    add_synth_arguments(generate_parser)
+    generate_parser.add_argument("--rows", type=int, default=100000)
+    generate_parser.add_argument("--shape", choices=sorted(THREAD_SHAPES), default="wide")
+    generate_parser.add_argument("--encoding", choices=["utf-8", "gbk"], default="utf-8")
+
+    suite_parser = subparsers.add_parser("suite", help="在模拟数据上测量各处理阶段的耗时与内存峰值")
+    add_synth_arguments(suite_parser)
+    suite_parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000],
+                              help="数据行数，可指定多个（例如 10000 100000 5000000）")
+    suite_parser.add_argument("--shape", choices=sorted(THREAD_SHAPES), nargs="+", default=["wide", "deep"])
+    suite_parser.add_argument("--encoding", choices=["utf-8", "gbk"], nargs="+", default=["utf-8"])
+    suite_parser.add_argument("--no-memory", action="store_true", help="不记录内存峰值（省去tracemalloc下的第二次运行）")
+    suite_parser.add_argument("--display", action="store_true",
+                              help="在真实的Treeview中插入行（需要显示环境，可用 xvfb-run 提供虚拟显示）")
+    suite_parser.add_argument("--data-dir", default=None, help="保留生成的CSV文件的目录（默认用完即删）")
+    suite_parser.add_argument("-o", "--output", default=None, help="结果JSON文件（默认输出到标准输出）")
+
+    args = parser.parse_args()
+    if args.command == "search":
+        results = bench_search(args.file, args.query, args.repeat)
+    elif args.command == "export":
+        results = bench_export(args.file, args.repeat)
+    elif args.command == "database":
+        with tempfile.TemporaryDirectory() as out_dir:
+            results = bench_database(args.file, out_dir, args.repeat)
+    elif args.command == "parallel":
+        results = bench_parallel(args.file, sorted(set(args.workers)), args.per_video_host, args.repeat)
+        results["environment"] = environment()
+    elif args.command == "read":
+        results = bench_read(args.file, args.repeat)
+        results["environment"] = environment()
+    elif args.command == "generate":
+        df = generate_comments(args.rows, args.shape, args.duplicate_rate, args.missing_video_rate, args.seed)
+        write_comments(args.file, df, args.encoding)
+        return
+    elif args.command == "suite":
+        results = bench_suite(args.rows, args.shape, args.encoding, args.duplicate_rate, args.missing_video_rate,
+                              args.seed, not args.no_memory, args.display, args.data_dir)
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if getattr(args, "output", None):
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+def add_synth_arguments(parser):
+    parser.add_argument("--duplicate-rate", type=float, default=0.001, help="重复comment_id的行比例")
+    parser.add_argument("--missing-video-rate", type=float, default=0.0, help="video_id为空的行比例")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import collections
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from comment_core import DISPLAY_TIMEZONE
+from comment_store import TEXT_FIELDS, CodedColumn, DeferredColumn, IntColumn, StringColumn, Children, IdIndex, CommentStore
+
+# 缓存目录建在源文件所在目录下
+CACHE_DIR_NAME = ".blico_cache"
+CACHE_VERSION = 3
+# 每个缓存目录的默认容量上限（字节），超出时淘汰最久未使用的条目
+DEFAULT_MAX_BYTES = 2 << 30
+# 内容哈希对文件头、中、尾各取这么多字节
+HASH_BLOCK = 1 << 20
+# SQLite存储（comment_db）的数据库文件也放在缓存目录中，与数据集缓存一同计入容量、按最近使用淘汰
+DB_SUFFIX = ".sqlite"
+# SQLite在数据库文件旁建立的日志文件
+DB_SIDE_FILES = ("-wal", "-shm", "-journal")
+# 与列一起保存的数组（create_time、父子关系与ID查找表）
+ARRAY_NAMES = ("create_time", "parent_pos", "child_offsets", "child_index", "id_hashes", "id_order")
+
+# 本进程中打开着的数据库（路径 -> 连接数），淘汰时跳过，不删除界面或导出正在读取的数据库及其日志文件
+open_databases = collections.Counter()
+open_databases_lock = threading.Lock()
+
+
+def cache_dir(file_path):
+    return os.path.join(os.path.dirname(os.path.abspath(file_path)), CACHE_DIR_NAME)
+
+
+def entry_dir(file_path):
+    name = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir(file_path), name)
+
+
+def file_signature(file_path):
+    """文件的缓存键：路径、大小、修改时间以及内容哈希。
+
+    哈希只取文件头、中、尾各 HASH_BLOCK 字节（采样），不读全文；
+    大小与修改时间都不变、只改了采样之外内容的文件不会被识别为变化。
+    """
+    stat = os.stat(file_path)
+    digest = hashlib.blake2b(digest_size=16)
+    offsets = {0, max(stat.st_size // 2 - HASH_BLOCK // 2, 0), max(stat.st_size - HASH_BLOCK, 0)}
+    with open(file_path, "rb") as f:
+        for offset in sorted(offsets):
+            f.seek(offset)
+            digest.update(f.read(HASH_BLOCK))
+    return {
+        "path": os.path.abspath(file_path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "hash": digest.hexdigest(),
+    }
+
+
+def save_column(prefix, column):
+    # 文本列直接写出UTF-8字节段与偏移数组，缺失值另存掩码；
+    # 编号列保存编号数组，不同的值再按文本列保存；整数列保存整数数组
+    if isinstance(column, CodedColumn):
+        np.save(prefix + ".codes.npy", column.codes)
+        save_column(prefix + ".categories", column.categories)
+        return
+    if isinstance(column, IntColumn):
+        np.save(prefix + ".ints.npy", column.values)
+        if column.null is not None:
+            np.save(prefix + ".null.npy", column.null)
+        return
+    np.save(prefix + ".offsets.npy", column.offsets)
+    if column.null is not None:
+        np.save(prefix + ".null.npy", column.null)
+    with open(prefix + ".bin", "wb") as f:
+        # 追加得到的列的字节缓冲可能长于本列
+        f.write(memoryview(column.data)[:column.offsets[-1]])
+
+
+def load_array(path):
+    # 以只读方式映射数组文件，按需读入；存储更新时总是换上新数组（见 CommentStore.snapshot），不会原地写入
+    return np.load(path, mmap_mode="r")
+
+
+def load_column(prefix):
+    if os.path.exists(prefix + ".codes.npy"):
+        return CodedColumn(load_array(prefix + ".codes.npy"), load_column(prefix + ".categories"))
+    null = load_array(prefix + ".null.npy") if os.path.exists(prefix + ".null.npy") else None
+    if os.path.exists(prefix + ".ints.npy"):
+        return IntColumn(load_array(prefix + ".ints.npy"), null)
+    with open(prefix + ".bin", "rb") as f:
+        data = f.read()
+    return StringColumn(data, load_array(prefix + ".offsets.npy"), null)
+
+
+def save_edits(prefix, column):
+    # DeferredColumn 中刷新时追加的行与改过的行
+    if column.tail is not None:
+        save_column(prefix + ".tail", column.tail)
+    if column.patch is not None:
+        np.save(prefix + ".patch_rows.npy", column.patch_rows)
+        save_column(prefix + ".patch", column.patch)
+
+
+def load_edits(prefix):
+    # 返回 save_edits 保存的 (tail, patch_rows, patch)，没有保存的部分为None与空数组
+    tail = load_column(prefix + ".tail") if has_column(prefix + ".tail") else None
+    if not os.path.exists(prefix + ".patch_rows.npy"):
+        return tail, np.empty(0, dtype=np.int64), None
+    return tail, load_array(prefix + ".patch_rows.npy"), load_column(prefix + ".patch")
+
+
+def has_column(prefix):
+    return any(os.path.exists(prefix + suffix) for suffix in (".codes.npy", ".ints.npy", ".offsets.npy"))
+
+
+def directory_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def load_dataset(file_path, params, tz_name=DISPLAY_TIMEZONE):
+    """命中时返回评论存储（CommentStore），未命中返回None。
+
+    params 为影响处理结果的参数（评级阈值等），与写入时不同视为未命中；
+    时间字符串不写入缓存，按 tz_name 现场生成。
+    """
+    path = entry_dir(file_path)
+    meta_path = os.path.join(path, "meta.json")
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if (meta.get("version") != CACHE_VERSION or meta.get("params") != params
+                or meta.get("signature") != file_signature(file_path)):
+            return None
+        store = CommentStore(tz_name)
+        deferred = meta.get("deferred", [])
+        store.columns = {
+            field: load_column(os.path.join(path, field)) for field in TEXT_FIELDS if field not in deferred
+        }
+        arrays = {name: load_array(os.path.join(path, name + ".npy")) for name in ARRAY_NAMES}
+        # 没有另存的值时源文件各行即缓存中的各行
+        source_path = os.path.join(path, "source_time.npy")
+        source_time = load_array(source_path) if os.path.exists(source_path) else arrays["create_time"]
+        edits = {field: load_edits(os.path.join(path, field)) for field in deferred}
+    except (OSError, ValueError, KeyError):
+        return None
+    store.size = meta["rows"]
+    store.create_time = arrays["create_time"]
+    store.parent_pos = arrays["parent_pos"]
+    store.children = Children(arrays["child_offsets"], arrays["child_index"])
+    store.ids = IdIndex(arrays["id_hashes"], arrays["id_order"])
+    # 加载时略去的列不写入缓存，仍在导出时从源文件读取（源文件未变化），刷新时另存的值从缓存读取
+    if deferred:
+        store.defer(file_path, deferred, source_time)
+        for field in deferred:
+            store.columns[field] = store.columns[field].with_edits(*edits[field])
+    store.per_video_host = params.get("per_video_host", False)
+    # 缓存中的评级按 params 中的阈值算出，之后刷新时可以增量评级
+    if "rating_thresholds" in params:
+        store.mark_rated(*params["rating_thresholds"])
+    else:
+        store.find_hosts()
+    # 记录最近使用时间，供淘汰策略使用
+    os.utime(meta_path)
+    return store
+
+
+def store_dataset(file_path, store, params, signature, max_bytes=DEFAULT_MAX_BYTES):
+    """写入缓存条目（先写临时目录再改名），然后按容量上限淘汰旧条目。
+
+    signature 为读取源文件之前取得的 file_signature：读取期间文件又被追加时，
+    条目记下的是读取前的文件，下次打开时不会命中，而是重新加载。
+    """
+    path = entry_dir(file_path)
+    os.makedirs(cache_dir(file_path), exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    try:
+        deferred = []
+        edited = False
+        for field in TEXT_FIELDS:
+            column = store.columns[field]
+            if isinstance(column, DeferredColumn):
+                if not column.loaded:
+                    # 仍未读取的列只保存刷新时另存的值，源文件中的各行下次仍从源文件读取
+                    deferred.append(field)
+                    if column.edited:
+                        save_edits(os.path.join(tmp_path, field), column)
+                        edited = True
+                    continue
+                column = column.materialize()
+            save_column(os.path.join(tmp_path, field), column)
+        # 父子关系与ID查找表也一并保存，命中时无需重新链接
+        arrays = {
+            "create_time": store.create_time,
+            "parent_pos": store.parent_pos,
+            "child_offsets": store.children.offsets,
+            "child_index": store.children.index,
+            "id_hashes": store.ids.hashes,
+            "id_order": store.ids.order,
+        }
+        if edited:
+            arrays["source_time"] = store.source_time
+        for name in arrays:
+            np.save(os.path.join(tmp_path, name + ".npy"), arrays[name])
+        # meta.json 最后写入，作为条目完整的标志
+        meta = {
+            "version": CACHE_VERSION,
+            "signature": signature,
+            "params": params,
+            "rows": len(store),
+            "deferred": deferred,
+        }
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp_path, path)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    evict(cache_dir(file_path), max_bytes, keep=path)
+
+
+def hold_database(path):
+    # 打开数据库连接时登记，关闭时调用 release_database
+    with open_databases_lock:
+        open_databases[os.path.abspath(path)] += 1
+
+
+def release_database(path):
+    with open_databases_lock:
+        path = os.path.abspath(path)
+        open_databases[path] -= 1
+        if open_databases[path] <= 0:
+            del open_databases[path]
+
+
+def database_in_use(path):
+    with open_databases_lock:
+        return os.path.abspath(path) in open_databases
+
+
+def evict(root, max_bytes, keep=None):
+    # 按最近使用时间从旧到新删除条目（数据集缓存与数据库，本进程打开着的数据库除外），直到总大小不超过上限
+    entries = []
+    for entry in os.scandir(root):
+        if entry.is_dir():
+            meta_path = os.path.join(entry.path, "meta.json")
+            if os.path.exists(meta_path):
+                entries.append((os.path.getmtime(meta_path), entry.path, directory_size(entry.path)))
+        elif entry.name.endswith(DB_SUFFIX):
+            files = database_files(entry.path)
+            entries.append((max(os.path.getmtime(path) for path in files), entry.path,
+                            sum(os.path.getsize(path) for path in files)))
+    total = sum(size for _, _, size in entries)
+    for _, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep or database_in_use(path):
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            remove_database(path)
+        total -= size
+
+
+def database_files(path):
+    # 数据库文件及其现有的日志文件
+    return [path] + [path + suffix for suffix in DB_SIDE_FILES if os.path.exists(path + suffix)]
+
+
+def remove_database(path):
+    # 其它进程正打开的数据库（Windows上无法删除）留待下次淘汰
+    for file_path in database_files(path):
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
@@ -0,0 +1,169 @@
+"""无界面的命令行入口：加载、评级并导出一个或多个爬虫CSV。
+
+不导入tkinter，可在服务器、定时任务或爬虫流水线中运行。输入为目录时处理其中
+所有CSV文件（含 .csv.gz/.csv.zst 压缩文件），多个文件由进程池并行处理（每个进程一次处理一个文件）；只有一个文件时
+按video_id分区后由进程池并行处理。结束后输出并写入每个文件的耗时汇总。
+"""
+import argparse
+import csv
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from comment_core import COMPRESSIONS, DISPLAY_TIMEZONE, LOAD_COLUMNS, REQUIRED_COLUMNS, read_comments_csv
+from comment_export import save_txt, TABLE_EXPORTERS
+from comment_parallel import build_store_parallel
+from comment_store import build_store
+
+FORMATS = ("txt", "csv", "parquet", "jsonl")
+DEFAULT_FORMATS = ("txt", "csv")
+SUMMARY_NAME = "summary.csv"
+# 目录中要处理的文件
+INPUT_PATTERNS = ["*.csv"] + ["*.csv" + extension for extension in COMPRESSIONS]
+SUMMARY_FIELDS = [
+    "file", "status", "rows", "encoding", "read_s", "process_s",
+    "txt_s", "csv_s", "parquet_s", "jsonl_s", "total_s", "missing_video_id", "error"
+]
+
+
+def collect_inputs(paths):
+    # 目录展开为其中的CSV文件（不递归），按文件名排序
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(
+                file_path for pattern in INPUT_PATTERNS for file_path in glob.glob(os.path.join(path, pattern))
+            ))
+        else:
+            files.append(path)
+    return files
+
+
+def output_path(file_path, out_dir, fmt):
+    name = os.path.basename(file_path)
+    if os.path.splitext(name)[1].lower() in COMPRESSIONS:
+        name = os.path.splitext(name)[0]
+    name = os.path.splitext(name)[0]
+    return os.path.join(out_dir, f"{name}_comments.{fmt}")
+
+
+def process_file(file_path, out_dir, formats=DEFAULT_FORMATS, tz_name=DISPLAY_TIMEZONE, low=10, high=100,
+                 per_video_host=False, engine=None, split_workers=1):
+    """处理单个文件并返回汇总行，出错时记录错误而不抛出（便于进程池汇总）。
+
+    只导出TXT时不读取头像等TXT用不到的列。split_workers 大于1时按video_id分区，
+    在这么多个进程中并行处理这一个文件。
+    """
+    result = {field: "" for field in SUMMARY_FIELDS}
+    result["file"] = file_path
+    started = time.perf_counter()
+    try:
+        start = time.perf_counter()
+        columns = LOAD_COLUMNS if set(formats) <= {"txt"} else REQUIRED_COLUMNS
+        df, encoding, _ = read_comments_csv(file_path, columns, engine)
+        result["read_s"] = time.perf_counter() - start
+        result["encoding"] = encoding
+
+        start = time.perf_counter()
+        if split_workers > 1:
+            store, missing_video_id = build_store_parallel(df, tz_name, low, high, per_video_host, split_workers)
+        else:
+            store, missing_video_id = build_store(df, tz_name, low, high, per_video_host)
+        del df
+        result["process_s"] = time.perf_counter() - start
+        result["rows"] = len(store)
+        result["missing_video_id"] = len(missing_video_id)
+
+        for fmt in formats:
+            start = time.perf_counter()
+            path = output_path(file_path, out_dir, fmt)
+            if fmt == "txt":
+                save_txt(path, store)
+            else:
+                TABLE_EXPORTERS["." + fmt](path, store)
+            result[f"{fmt}_s"] = time.perf_counter() - start
+        result["status"] = "ok"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["total_s"] = time.perf_counter() - started
+    return result
+
+
+def run(files, out_dir, formats=DEFAULT_FORMATS, tz_name=DISPLAY_TIMEZONE, low=10, high=100, workers=None,
+        per_video_host=False, engine=None):
+    """处理所有文件，按完成顺序逐个回报，返回按输入顺序排列的汇总行。"""
+    os.makedirs(out_dir, exist_ok=True)
+    args = (out_dir, formats, tz_name, low, high, per_video_host, engine)
+    results = {}
+    if workers == 1 or len(files) <= 1:
+        # 只有一个文件时进程池改为按视频分区处理这个文件
+        split_workers = 1 if workers == 1 else workers or os.cpu_count() or 1
+        for file_path in files:
+            results[file_path] = process_file(file_path, *args, split_workers)
+            report(results[file_path])
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(process_file, file_path, *args): file_path for file_path in files}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                report(results[futures[future]])
+    return [results[file_path] for file_path in files]
+
+
+def report(result):
+    if result["status"] == "ok":
+        print(f"[完成] {result['file']}: {result['rows']} 条评论, {result['total_s']:.2f} 秒", flush=True)
+    else:
+        print(f"[失败] {result['file']}: {result['error']}", file=sys.stderr, flush=True)
+
+
+def write_summary(results, summary_path):
+    with open(summary_path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        for result in results:
+            writer.writerow({
+                key: f"{value:.3f}" if isinstance(value, float) else value
+                for key, value in result.items()
+            })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="评论管理器命令行批处理")
+    parser.add_argument("inputs", nargs="+", help="CSV文件或包含CSV文件的目录")
+    parser.add_argument("-o", "--out-dir", required=True, help="导出文件与汇总的输出目录")
+    parser.add_argument("-f", "--format", action="append", choices=FORMATS,
+                        help="导出格式，可重复指定（默认txt与csv；parquet需要pyarrow）")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="并行进程数（默认为CPU核数）")
+    parser.add_argument("--tz", default=DISPLAY_TIMEZONE, help="时间显示时区")
+    parser.add_argument("--low", type=int, default=10, help="评级阈值：二级回复数的低档")
+    parser.add_argument("--high", type=int, default=100, help="评级阈值：二级回复数的高档")
+    parser.add_argument("--per-video-host", action="store_true",
+                        help="每个视频分别以其第一个顶级评论的用户为Up主（默认按全部数据的第一个顶级评论）")
+    parser.add_argument("--engine", choices=["c", "pyarrow"], default="c",
+                        help="CSV解析器（pyarrow更快，需要安装pyarrow；不能解析的文件自动退回c）")
+    parser.add_argument("--summary", default=None, help=f"耗时汇总文件路径（默认为输出目录下的 {SUMMARY_NAME}）")
+    args = parser.parse_args(argv)
+
+    files = collect_inputs(args.inputs)
+    if not files:
+        parser.error("没有找到CSV文件")
+    formats = tuple(args.format) if args.format else DEFAULT_FORMATS
+
+    start = time.perf_counter()
+    results = run(files, args.out_dir, formats, args.tz, args.low, args.high, args.workers, args.per_video_host,
+                  args.engine)
+    summary_path = args.summary or os.path.join(args.out_dir, SUMMARY_NAME)
+    write_summary(results, summary_path)
+
+    failed = sum(result["status"] != "ok" for result in results)
+    print(f"共 {len(results)} 个文件，失败 {failed} 个，总耗时 {time.perf_counter() - start:.2f} 秒；"
+          f"汇总已写入 {summary_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
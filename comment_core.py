@@ -0,0 +1,547 @@
+import codecs
+import contextlib
+import gzip
+import io
+import logging
+import os
+import re
+from datetime import datetime
+from zoneinfo import ZoneInfo  # Python 3.9+
+
+import numpy as np
+import pandas as pd
+
+from comment_profile import stage
+
+logger = logging.getLogger(__name__)
+
+# 处理评论所需的列
+REQUIRED_COLUMNS = [
+    "comment_id", "parent_comment_id", "create_time",
+    "video_id", "content", "user_id", "nickname",
+    "avatar", "sub_comment_count", "last_modify_ts"
+]
+
+# 读取时跳过的列：界面、搜索与评级都用不到，导出时才从源文件读取（见 CommentStore.defer）
+DEFERRED_COLUMNS = ["avatar"]
+LOAD_COLUMNS = [col for col in REQUIRED_COLUMNS if col not in DEFERRED_COLUMNS]
+# 读取时直接解析为可空整数的列
+INTEGER_COLUMNS = ["create_time", "sub_comment_count", "last_modify_ts"]
+# 10 到 10**18，按位数区分64位整数
+DECIMAL_POWERS = 10 ** np.arange(1, 19, dtype=np.int64)
+
+# 按扩展名识别的压缩格式，读取时边读边解压（.zst 需要 zstandard）
+COMPRESSIONS = {".gz": "gzip", ".zst": "zstd"}
+
+# 评论字典的字段顺序（与逐行构建时保持一致）
+COMMENT_FIELDS = [
+    "comment_id", "parent_comment_id", "create_time", "content",
+    "nickname", "user_id", "avatar", "sub_comment_count",
+    "last_modify_ts", "rating", "video_id", "time_str"
+]
+
+# 默认显示时区
+DISPLAY_TIMEZONE = "Asia/Shanghai"
+# 界面时区列表中预置的时区（也可输入其它IANA时区名）
+TIMEZONES = ["Asia/Shanghai", "Asia/Tokyo", "Asia/Singapore", "Europe/London", "Europe/Berlin",
+             "America/New_York", "America/Los_Angeles", "UTC"]
+
+# 编码检测时每次读取的字节数
+ENCODING_SAMPLE_SIZE = 1 << 20
+NON_ASCII = re.compile(rb"[\x80-\xff]")
+
+# 增量刷新时校验的已读取内容末尾字节数，以及向前查找换行符时每次读取的字节数
+TAIL_ANCHOR_SIZE = 4096
+TAIL_BLOCK_SIZE = 1 << 16
+
+# 向量化格式化能安全处理的最大时间戳（9999-12-31 00:00:00 UTC 之前）
+MAX_VECTOR_TS = 253402214399
+
+
+def compression_of(file_path):
+    # 压缩格式（gzip/zstd），未压缩的文件为None
+    return COMPRESSIONS.get(os.path.splitext(file_path)[1].lower())
+
+
+@contextlib.contextmanager
+def open_source(file_path):
+    """以二进制方式打开源文件，压缩文件边读边解压。
+
+    产出 (读取用的流, 磁盘上的文件)；进度按磁盘上的文件已读取的字节数计算。
+    """
+    with open(file_path, "rb") as raw:
+        compression = compression_of(file_path)
+        if compression == "gzip":
+            with gzip.GzipFile(fileobj=raw) as f:
+                yield f, raw
+        elif compression == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError("读取.zst文件需要安装 zstandard（pip install zstandard）")
+            with zstandard.ZstdDecompressor().stream_reader(raw, closefd=False) as f:
+                yield f, raw
+        else:
+            yield raw, raw
+
+
+def detect_encoding(file_path, sample_size=ENCODING_SAMPLE_SIZE):
+    """根据文件前缀判断编码，返回 (编码, 首个非UTF-8字节的偏移或None)。
+
+    带UTF-8 BOM的文件返回 utf-8-sig；否则从第一个非ASCII字节处取样本，
+    能按UTF-8解码则为 utf-8，否则为 gbk。全部为ASCII时按 utf-8 处理。
+    只向前读取，压缩文件按解压后的内容判断（偏移也是解压后的）。
+    """
+    with open_source(file_path) as (f, _):
+        block = f.read(sample_size)
+        if block.startswith(codecs.BOM_UTF8):
+            return "utf-8-sig", None
+        offset = 0
+        while True:
+            if not block:
+                return "utf-8", None
+            match = NON_ASCII.search(block)
+            if match:
+                break
+            offset += len(block)
+            block = f.read(sample_size)
+        start = offset + match.start()
+        sample = block[match.start():]
+        if len(sample) < sample_size:
+            sample += f.read(sample_size - len(sample))
+    try:
+        # final=False：样本末尾被截断的多字节字符不算错误
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8", None
+    except UnicodeDecodeError as e:
+        return "gbk", start + e.start
+
+
+def read_comments_csv(file_path, columns=REQUIRED_COLUMNS, engine=None):
+    """读取爬虫导出的CSV（.gz/.zst 边读边解压），返回 (df, 编码, 首个非UTF-8字节的偏移或None)。
+
+    只读取 columns 中的列，文件缺少必要的列时抛出ValueError；INTEGER_COLUMNS 中的整数列解析为
+    可空整数（见 parse_integers）。engine="pyarrow" 时先用更快的多线程解析器（需要pyarrow），未安装或
+    不能解析该文件时退回默认解析器（不能解析的原因记入日志）。
+    """
+    encoding, bad_offset = detect_encoding(file_path)
+    try:
+        df = read_frame(file_path, encoding, columns, engine)
+    except UnicodeDecodeError:
+        # 非UTF-8字节出现在取样范围之后，退回GBK重新解析
+        encoding, bad_offset = 'gbk', None
+        df = read_frame(file_path, encoding, columns, engine)
+    return df, encoding, bad_offset
+
+
+def read_options(columns):
+    # read_csv 的列与类型参数：只读取 columns 中的列，全部按文本读取（整数列之后由 parse_integers 逐列解析）
+    return {"usecols": list(columns), "dtype": str}
+
+
+def read_header(file_path, encoding):
+    with open_source(file_path) as (f, _):
+        return pd.read_csv(f, nrows=0, encoding=encoding)
+
+
+def read_frame(file_path, encoding, columns=REQUIRED_COLUMNS, engine=None):
+    """按 read_comments_csv 的规则读取整个文件。
+
+    数值列中有非整数的值（例如手工编辑过的文件）时，只有这些列按文本保留（见 parse_integers）。
+    """
+    check_columns(read_header(file_path, encoding), REQUIRED_COLUMNS)
+    if engine == "pyarrow":
+        try:
+            with open_source(file_path) as (f, _):
+                df = pd.read_csv(f, encoding=encoding, engine="pyarrow", **read_options(columns))
+        except ImportError:
+            # 未安装pyarrow
+            pass
+        except pd.errors.ParserError as e:
+            # pyarrow比默认解析器严格（如字段数多于表头的行），记下原因后交给默认解析器
+            logger.warning("pyarrow无法解析 %s，改用默认解析器：%s", file_path, e)
+        else:
+            return parse_integers(df)
+    with open_source(file_path) as (f, _):
+        return parse_integers(pd.read_csv(f, encoding=encoding, **read_options(columns)))
+
+
+def parse_integers(df):
+    """把按文本读出的 INTEGER_COLUMNS 逐列解析为可空整数。
+
+    某列中有不能原样还原为整数的值（文本、小数、前导零、超出范围等）时只有该列保留为文本，
+    不必重新读取整个文件。
+    """
+    for col in INTEGER_COLUMNS:
+        if col not in df.columns:
+            continue
+        text = df[col]
+        numbers = pd.to_numeric(text, errors="coerce", dtype_backend="numpy_nullable")
+        valid = text.notna().to_numpy()
+        if str(numbers.dtype) != "Int64" or (numbers.notna().to_numpy() != valid).any():
+            continue
+        # 解析出的整数与原文的位数（含负号）相同时原文即其规范写法，不逐个格式化比较
+        ints = numbers.to_numpy(dtype=np.int64, na_value=0)[valid]
+        digits = np.searchsorted(DECIMAL_POWERS, np.abs(ints), side="right") + 1 + (ints < 0)
+        if (digits != text[valid].str.len().to_numpy()).any():
+            continue
+        df[col] = numbers
+    return df
+
+
+def iter_csv_chunks(file_path, encoding, chunk_rows, columns=REQUIRED_COLUMNS, integers=False):
+    """分块读取CSV（压缩文件边读边解压），逐块产出 (df, 已读取的文件字节数)。
+
+    integers 为真时整数列逐块解析为可空整数（见 parse_integers），有非整数的值的列在该块中保留为文本。
+    """
+    check_columns(read_header(file_path, encoding), REQUIRED_COLUMNS)
+    with open_source(file_path) as (f, raw):
+        for chunk in pd.read_csv(f, encoding=encoding, chunksize=chunk_rows, **read_options(columns)):
+            yield parse_integers(chunk) if integers else chunk, raw.tell()
+
+
+def read_column(file_path, field, create_time):
+    """重新读取源文件中的一列，与已加载的 len(create_time) 行一一对应。
+
+    按加载时的规则丢弃create_time无效的行；这些行的create_time与加载时不同
+    （源文件已被改写）时抛出ValueError。
+    """
+    columns = ["create_time", field]
+    encoding, _ = detect_encoding(file_path)
+    try:
+        df = read_frame(file_path, encoding, columns)
+    except UnicodeDecodeError:
+        df = read_frame(file_path, "gbk", columns)
+    df = clean_create_time(df)
+    if len(df) < len(create_time) or not np.array_equal(df["create_time"].to_numpy()[:len(create_time)], create_time):
+        raise ValueError(f"源文件已改变，无法读取 {field} 列，请重新加载")
+    return df[field].astype(object).to_numpy()[:len(create_time)]
+
+
+def complete_lines_end(file_path, size):
+    """文件前 size 字节中最后一个换行符之后的偏移，即已完整写入的行的末尾。
+
+    压缩文件不能从中间读取，整个文件视为已读取的内容。
+    """
+    if compression_of(file_path) is not None:
+        return size
+    with open(file_path, "rb") as f:
+        pos = size
+        while pos > 0:
+            start = max(pos - TAIL_BLOCK_SIZE, 0)
+            f.seek(start)
+            newline = f.read(pos - start).rfind(b"\n")
+            if newline >= 0:
+                return start + newline + 1
+            pos = start
+    return 0
+
+
+def read_anchor(file_path, offset):
+    # offset 之前的最后几KB，用于判断已读取的内容是否被改写
+    with open(file_path, "rb") as f:
+        f.seek(max(offset - TAIL_ANCHOR_SIZE, 0))
+        return f.read(min(offset, TAIL_ANCHOR_SIZE))
+
+
+def read_appended_rows(file_path, offset, anchor):
+    """读取 offset 之后追加的完整行，列名取自文件的表头。
+
+    返回 (新行df或None, 新的偏移, 新的锚点)，没有完整的新行或最后一行尚未写完
+    时df为None。文件被截断、offset 之前的内容被改写或追加部分无法按原编码解码时
+    返回None，需要整体重新加载；压缩文件有任何变化都整体重新加载。
+    """
+    if compression_of(file_path) is not None:
+        if os.path.getsize(file_path) == offset and read_anchor(file_path, offset) == anchor:
+            return None, offset, anchor
+        return None
+    with open(file_path, "rb") as f:
+        header = f.readline()
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size < offset:
+            return None
+        f.seek(offset - len(anchor))
+        if f.read(len(anchor)) != anchor:
+            return None
+        data = f.read(size - offset)
+    end = data.rfind(b"\n") + 1
+    if not end or not header.endswith(b"\n"):
+        return None, offset, anchor
+    data = data[:end]
+    encoding, _ = detect_encoding(file_path)
+    try:
+        df = pd.read_csv(io.BytesIO(header + data), dtype=str, encoding=encoding)
+    except UnicodeDecodeError:
+        return None
+    except pd.errors.ParserError:
+        # 带引号的字段中含换行时最后一条记录可能还没写完，等下次再读
+        return None, offset, anchor
+    return df, offset + end, (anchor + data)[-TAIL_ANCHOR_SIZE:]
+
+
+def check_columns(df, columns=LOAD_COLUMNS):
+    # 读取文件时检查全部必要的列；处理时跳过读取时略去的列（DEFERRED_COLUMNS）
+    missing_columns = [col for col in columns if col not in df.columns]
+    if missing_columns:
+        raise ValueError(f"缺少必要的列: {', '.join(missing_columns)}")
+
+
+def clean_create_time(df):
+    # 转换create_time为整数，丢弃无法解析的行
+    df = df.copy()
+    df["create_time"] = pd.to_numeric(df["create_time"], errors='coerce')
+    df = df.dropna(subset=["create_time"])
+    df["create_time"] = df["create_time"].astype(int)
+    return df
+
+
+def format_timestamp(ts, tz_name=DISPLAY_TIMEZONE):
+    try:
+        if ts < 0 or ts > 1e12:
+            return "无效时间"
+        dt = datetime.fromtimestamp(ts, tz=ZoneInfo(tz_name))
+        return dt.strftime('%Y-%m-%d %H:%M:%S')
+    except Exception as e:
+        return f"未知时间 ({e})"
+
+
+def format_timestamps(values, tz_name=DISPLAY_TIMEZONE):
+    """批量格式化时间戳，结果与逐个调用 format_timestamp 一致，返回对象数组。"""
+    ts = np.asarray(values, dtype=np.int64)
+    result = np.full(len(ts), "无效时间", dtype=object)
+    valid = (ts >= 0) & (ts <= 1e12)
+    fast = valid & (ts <= MAX_VECTOR_TS)
+    if fast.any():
+        local = (
+            pd.DatetimeIndex(ts[fast].astype("datetime64[s]"))
+            .tz_localize("UTC").tz_convert(tz_name).tz_localize(None)
+            .to_numpy()
+        )
+        # "YYYY-MM-DDTHH:MM:SS" 中的T直接在字符缓冲区里换成空格
+        text = np.datetime_as_string(local, unit="s")
+        text.view(np.uint32).reshape(len(text), -1)[:, 10] = ord(" ")
+        result[fast] = text.astype(object)
+    # 超出向量化范围的年份交给逐个格式化，保留原有的错误信息
+    for i in np.flatnonzero(valid & ~fast).tolist():
+        result[i] = format_timestamp(int(ts[i]), tz_name)
+    return result
+
+
+def rename_duplicate_ids(ids, labels, existing=()):
+    # 逐个处理重复的comment_id，与原先逐行构建字典时的规则一致；
+    # existing 为之前已加入的评论ID（流式加载时跨块去重）
+    seen = set()
+    result = []
+    for comment_id, label in zip(ids, labels):
+        if comment_id in seen or comment_id in existing:
+            comment_id = f"{comment_id}_{label}"
+        seen.add(comment_id)
+        result.append(comment_id)
+    return result
+
+
+def build_comment_table(df, tz_name=DISPLAY_TIMEZONE):
+    """列式构建评论表，返回 (清洗后的df, 评论表, 缺失video_id的评论ID列表)。
+
+    评论表按原始行顺序排列，使用从0开始的位置索引，列顺序为COMMENT_FIELDS；
+    time_str 列为按 tz_name 格式化好的create_time。
+    """
+    df, ids = clean_comments(df)
+    table, missing_video_id = make_table(df, ids, tz_name)
+    return df, table, missing_video_id
+
+
+def clean_comments(df):
+    """检查列、清洗create_time并给重复的comment_id改名，返回 (清洗后的df, 评论ID)。"""
+    check_columns(df)
+    df = clean_create_time(df)
+
+    ids = df["comment_id"].astype(object)
+    duplicated = ids.duplicated(keep="first")
+    if duplicated.any():
+        labels = pd.Series(df.index, index=df.index).astype(str)
+        renamed = ids.where(~duplicated, ids.fillna("nan").astype(str) + "_" + labels)
+        # 改名后仍可能与其它已有ID冲突，此时退回逐个处理以保持原有语义
+        if renamed.duplicated().any():
+            renamed = pd.Series(rename_duplicate_ids(ids.tolist(), df.index), index=df.index, dtype=object)
+        ids = renamed
+    return df, ids
+
+
+def clean_video_ids(df):
+    # 去掉首尾空白的video_id，缺失的设置为 "N/A"；返回 (video_id, 是否缺失的掩码)
+    video_ids = df["video_id"].astype(object).fillna("").astype(str).str.strip()
+    missing = (video_ids == "").to_numpy()
+    return video_ids.where(~missing, "N/A"), missing
+
+
+def make_table(df, ids, tz_name=DISPLAY_TIMEZONE):
+    # 由清洗后的df与处理过重复的评论ID组装评论表，返回 (评论表, 缺失video_id列表)
+    ids = pd.Series(ids, index=df.index, dtype=object)
+    video_ids, missing = clean_video_ids(df)
+    with stage("格式化时间", rows=len(df)):
+        time_strs = format_timestamps(df["create_time"].to_numpy(), tz_name)
+
+    table = pd.DataFrame({
+        "comment_id": ids.to_numpy(),
+        "parent_comment_id": df["parent_comment_id"].astype(object).to_numpy(),
+        "create_time": df["create_time"].to_numpy(),
+        "content": df["content"].astype(object).to_numpy(),
+        "nickname": df["nickname"].astype(object).to_numpy(),
+        "user_id": df["user_id"].astype(object).to_numpy(),
+        "avatar": column_values(df, "avatar"),
+        "sub_comment_count": column_values(df, "sub_comment_count"),
+        "last_modify_ts": column_values(df, "last_modify_ts"),
+        "rating": "",
+        "video_id": video_ids.to_numpy(),
+        "time_str": time_strs,
+    }, columns=COMMENT_FIELDS)
+
+    missing_video_id = table["comment_id"].to_numpy()[missing].tolist()
+    return table, missing_video_id
+
+
+def column_values(df, field):
+    # 整数列保持可空整数类型；读取时略去的列先留空，由调用方改为按需读取
+    if field not in df.columns:
+        return None
+    if pd.api.types.is_integer_dtype(df[field].dtype):
+        return df[field].array
+    return df[field].astype(object).to_numpy()
+
+
+def ingest_comments_rows(df, tz_name=DISPLAY_TIMEZONE):
+    """逐行构建评论字典的原始实现，保留用于与 build_store 对照（见 tests）。
+
+    返回 (清洗后的df, 评论表, comments, replies, 缺失video_id列表)。
+    """
+    check_columns(df)
+    df = clean_create_time(df)
+
+    comments = {}
+    replies = {}
+    missing_video_id = []
+
+    for idx, row in df.iterrows():
+        comment_id = row["comment_id"]
+        if comment_id in comments:
+            # 处理重复的comment_id
+            comment_id = f"{comment_id}_{idx}"
+        parent_id = row["parent_comment_id"]
+        video_id = row.get("video_id", "").strip()
+
+        if not video_id:
+            missing_video_id.append(comment_id)
+            video_id = "N/A"
+
+        comment = {
+            "comment_id": comment_id,
+            "parent_comment_id": parent_id,
+            "create_time": row["create_time"],
+            "content": row["content"],
+            "nickname": row["nickname"],
+            "user_id": row["user_id"],
+            "avatar": row["avatar"],
+            "sub_comment_count": row["sub_comment_count"],
+            "last_modify_ts": row["last_modify_ts"],
+            "rating": ""
+        }
+        comment["video_id"] = video_id
+        comment["time_str"] = format_timestamp(row["create_time"], tz_name)
+
+        comments[comment_id] = comment
+        if parent_id not in replies:
+            replies[parent_id] = []
+        replies[parent_id].append(comment)
+
+    for parent_id in replies:
+        replies[parent_id].sort(key=lambda x: x["create_time"])
+
+    table = pd.DataFrame(list(comments.values()), columns=COMMENT_FIELDS)
+    return df, table, comments, replies, missing_video_id
+
+
+def parent_positions(table):
+    # 每条评论的父评论在表中的位置，顶级评论为-1
+    return pd.Index(table["comment_id"]).get_indexer(table["parent_comment_id"])
+
+
+def reply_counts(parent_pos):
+    """按父评论位置聚合，返回每条评论的二级回复数与三级回复数。"""
+    n = len(parent_pos)
+    has_parent = parent_pos >= 0
+    parents = parent_pos[has_parent]
+    child_count = np.bincount(parents, minlength=n)
+    grandchild_count = np.bincount(
+        parents, weights=child_count[has_parent], minlength=n
+    ).astype(np.int64)
+    return child_count, grandchild_count
+
+
+def find_up_host(table, parent_pos=None):
+    # 确定Up主的user_id（假设第一个顶级评论来自Up主）
+    if parent_pos is None:
+        parent_pos = parent_positions(table)
+    top_level = np.flatnonzero(parent_pos < 0)
+    if len(top_level):
+        return table["user_id"].iat[top_level[0]]
+    return None
+
+
+def rate_comments(table, up_host_id=None, low=10, high=100, parent_pos=None):
+    """一次性计算所有评论的评级，返回与评论表行对齐的评级数组。
+
+    up_host_id 为 None 时按第一个顶级评论自动确定Up主；
+    low/high 为二级回复数与三级回复数的分档阈值（默认10/100）。
+    """
+    if parent_pos is None:
+        parent_pos = parent_positions(table)
+    if up_host_id is None:
+        up_host_id = find_up_host(table, parent_pos)
+    count_second, count_third = reply_counts(parent_pos)
+
+    is_up = table["user_id"].to_numpy(dtype=object) == up_host_id
+    return select_ratings(is_up, parent_pos < 0, count_second, count_third, low, high)
+
+
+def select_ratings(is_up, is_top, count_second, count_third, low=10, high=100):
+    # 由是否Up主、是否顶级与二、三级回复数得出评级
+    conditions = [
+        is_up & is_top,
+        is_up,
+        count_second == 0,
+        (count_second < low) & (count_third > 0),
+        count_second < low,
+        (count_second <= high) & (count_third >= low),
+        count_second <= high,
+        count_third >= high,
+    ]
+    choices = ["A1", "A2", "D", "B1", "C1", "B2", "C2", "B3"]
+    return np.select(conditions, choices, default="C3").astype(object)
+
+
+def sort_orders(table, rating_order, parent_pos=None):
+    """各排序键的升序行位置数组（稳定排序），降序时直接反转。
+
+    键为 nickname/content（忽略大小写）、create_time、reply_count（直接回复数）
+    与 rating（按 rating_order 的等级，未知评级排在最后）。
+    """
+    if parent_pos is None:
+        parent_pos = parent_positions(table)
+    keys = {
+        "nickname": text_sort_codes(table["nickname"]),
+        "content": text_sort_codes(table["content"]),
+        "create_time": table["create_time"].to_numpy(dtype=np.int64),
+        "reply_count": reply_counts(parent_pos)[0],
+        "rating": table["rating"].map(rating_order).fillna(100).to_numpy(dtype=np.int64),
+    }
+    # 行位置用int32保存，常驻内存减半
+    return {name: np.argsort(key, kind="stable").astype(np.int32) for name, key in keys.items()}
+
+
+def text_sort_codes(values):
+    # 文本按casefold后的字典序编号，缺失值视为空字符串
+    folded = pd.Series(values, dtype=object).fillna("").astype(str).str.casefold()
+    codes, _ = pd.factorize(folded, sort=True)
+    return codes
@@ -0,0 +1,732 @@
+"""可选的SQLite存储：把爬虫CSV分块导入本地数据库，界面与导出按需分页读取。
+
+适合内存放不下的多月存档：导入时内存只与块大小有关；数据库保存在缓存目录中，
+源文件未变化时再次打开无需重新导入。评论的行位置即在CSV中的顺序（row 列），
+父子关系、回复数与评级在导入后用SQL计算；nickname 与 content 建有trigram全文
+索引，用于三个字及以上的子串搜索。
+"""
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from comment_cache import (
+    DB_SUFFIX, DEFAULT_MAX_BYTES, cache_dir, entry_dir, evict, file_signature, hold_database, release_database
+)
+from comment_core import (
+    COMMENT_FIELDS, DISPLAY_TIMEZONE, check_columns, clean_create_time, detect_encoding, format_timestamp,
+    format_timestamps, iter_csv_chunks, make_table, rename_duplicate_ids
+)
+from comment_profile import stage
+from comment_store import CommentStore
+
+DB_VERSION = 3
+# 保存在数据库中的字段（time_str 按显示时区现场生成）
+DB_FIELDS = [field for field in COMMENT_FIELDS if field != "time_str"]
+# 数据库的页缓存上限（KB，负数为SQLite的约定），限制常驻内存
+CACHE_KB = 65536
+# 导出TXT时每批取出的评论串数
+THREAD_BATCH = 2000
+# trigram 全文索引只能检索至少这么多个字的查询，更短的逐行比较
+FTS_MIN_CHARS = 3
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE comments (
+    row INTEGER PRIMARY KEY,
+    comment_id TEXT,
+    parent_comment_id TEXT,
+    create_time INTEGER NOT NULL,
+    content TEXT,
+    nickname TEXT,
+    user_id TEXT,
+    avatar TEXT,
+    sub_comment_count TEXT,
+    last_modify_ts TEXT,
+    rating TEXT,
+    video_id TEXT,
+    parent_row INTEGER,
+    reply_count INTEGER NOT NULL DEFAULT 0,
+    third_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX comments_comment_id ON comments(comment_id);
+"""
+
+# 导入完成后再建的索引，批量插入时不必逐行维护
+INDEXES = """
+CREATE INDEX comments_parent_comment_id ON comments(parent_comment_id);
+CREATE INDEX comments_video_id ON comments(video_id);
+CREATE INDEX comments_user_id ON comments(user_id);
+CREATE INDEX comments_create_time ON comments(create_time);
+CREATE INDEX comments_children ON comments(parent_row, create_time, row);
+CREATE INDEX comments_top_level ON comments(create_time, row) WHERE parent_row IS NULL;
+CREATE VIRTUAL TABLE comments_fts USING fts5(
+    nickname, content, content='comments', content_rowid='row', tokenize='trigram'
+);
+INSERT INTO comments_fts(comments_fts) VALUES ('rebuild');
+CREATE TRIGGER comments_fts_insert AFTER INSERT ON comments BEGIN
+    INSERT INTO comments_fts(rowid, nickname, content) VALUES (new.row, new.nickname, new.content);
+END;
+CREATE TRIGGER comments_fts_update AFTER UPDATE OF nickname, content ON comments BEGIN
+    INSERT INTO comments_fts(comments_fts, rowid, nickname, content)
+        VALUES ('delete', old.row, old.nickname, old.content);
+    INSERT INTO comments_fts(rowid, nickname, content) VALUES (new.row, new.nickname, new.content);
+END;
+"""
+
+# 与 select_ratings 相同的评级规则；{up} 为Up主的user_id（参数或按视频查找的子查询）
+RATING_SQL = """
+UPDATE comments SET rating = CASE
+    WHEN user_id = {up} AND parent_row IS NULL THEN 'A1'
+    WHEN user_id = {up} THEN 'A2'
+    WHEN reply_count = 0 THEN 'D'
+    WHEN reply_count < :low AND third_count > 0 THEN 'B1'
+    WHEN reply_count < :low THEN 'C1'
+    WHEN reply_count <= :high AND third_count >= :low THEN 'B2'
+    WHEN reply_count <= :high THEN 'C2'
+    WHEN third_count >= :high THEN 'B3'
+    ELSE 'C3'
+END
+"""
+# 各视频的Up主：每个视频第一个顶级评论的用户（逐条执行，executescript 会提交进行中的事务）
+VIDEO_HOSTS_SQL = (
+    "CREATE TEMP TABLE IF NOT EXISTS video_hosts (video_id TEXT PRIMARY KEY, user_id TEXT)",
+    "DELETE FROM video_hosts",
+    """INSERT INTO video_hosts SELECT c.video_id, c.user_id FROM comments AS c JOIN (
+        SELECT min(row) AS row FROM comments WHERE parent_row IS NULL GROUP BY video_id
+    ) AS first ON c.row = first.row""",
+)
+
+# 刷新时有变化的行（changed）及其所在的视频（touched_videos），评级只重新计算受其影响的行
+CHANGED_SQL = (
+    "CREATE TEMP TABLE IF NOT EXISTS changed (row INTEGER PRIMARY KEY)",
+    "DELETE FROM changed",
+    "CREATE TEMP TABLE IF NOT EXISTS touched_videos (video_id TEXT PRIMARY KEY)",
+    "DELETE FROM touched_videos",
+)
+# 受影响的行：有变化的行及其父评论与祖父评论，只有这些行的回复数、三级回复数或评级可能变化
+AFFECTED_SQL = (
+    "CREATE TEMP TABLE IF NOT EXISTS affected (row INTEGER PRIMARY KEY)",
+    "DELETE FROM affected",
+    "INSERT INTO affected SELECT row FROM changed",
+    """INSERT OR IGNORE INTO affected SELECT c.parent_row FROM changed JOIN comments AS c ON c.row = changed.row
+        WHERE c.parent_row IS NOT NULL""",
+    """INSERT OR IGNORE INTO affected SELECT p.parent_row FROM changed JOIN comments AS c ON c.row = changed.row
+        JOIN comments AS p ON p.row = c.parent_row WHERE p.parent_row IS NOT NULL""",
+    """UPDATE comments SET reply_count = (SELECT count(*) FROM comments AS k WHERE k.parent_row = comments.row)
+        WHERE row IN (SELECT row FROM affected)""",
+    """UPDATE comments SET third_count = (
+        SELECT coalesce(sum(k.reply_count), 0) FROM comments AS k WHERE k.parent_row = comments.row
+    ) WHERE row IN (SELECT row FROM affected)""",
+)
+# 有变化的视频现在的Up主（第一个顶级评论的行与用户，没有顶级评论时行为NULL）与原来的Up主
+NEW_HOSTS_SQL = (
+    "DROP TABLE IF EXISTS temp.new_hosts",
+    """CREATE TEMP TABLE new_hosts AS SELECT t.video_id, h.video_id IS NOT NULL AS had_host, h.user_id AS old_user,
+        c.row AS host_row, c.user_id FROM touched_videos AS t
+        LEFT JOIN video_hosts AS h ON h.video_id = t.video_id
+        LEFT JOIN comments AS c ON c.row = (
+            SELECT min(row) FROM comments WHERE video_id = t.video_id AND parent_row IS NULL
+        )""",
+)
+
+
+def database_path(file_path):
+    # 与数据集缓存放在同一目录，一同计入缓存的容量淘汰
+    return entry_dir(file_path) + DB_SUFFIX
+
+
+def connect(path):
+    # 界面线程与加载线程共用连接，访问由 CommentDatabase.lock 串行化
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute(f"PRAGMA cache_size = -{CACHE_KB}")
+    conn.execute("PRAGMA temp_store = FILE")
+    # SQL的lower只转换ASCII字母，忽略大小写的搜索与排序改用Python的字符串方法，与内存中的结果一致
+    conn.create_function("py_lower", 1, py_lower, deterministic=True)
+    conn.create_function("py_casefold", 1, py_casefold, deterministic=True)
+    return conn
+
+
+def py_lower(text):
+    return text.lower() if isinstance(text, str) else text
+
+
+def py_casefold(text):
+    return text.casefold() if isinstance(text, str) else text
+
+
+def sql_values(table, fields):
+    # 缺失值写为NULL
+    values = table[fields].astype(object)
+    return values.where(values.notna(), None).itertuples(index=False, name=None)
+
+
+def text_key(column):
+    # 文本列的排序键，与内存中的忽略大小写排序一致（casefold，缺失值视为空字符串）
+    return f"py_casefold(coalesce({column}, ''))"
+
+
+class CommentDatabase:
+    """SQLite中的评论数据，接口与 CommentStore 中界面按需读取的部分一致。
+
+    行位置从0开始连续编号；刷新时已有评论的位置不变，新评论追加在后面。
+    """
+
+    def __init__(self, path, tz_name=DISPLAY_TIMEZONE):
+        self.path = path
+        self.tz_name = tz_name
+        self.conn = connect(path)
+        self.lock = threading.RLock()
+        try:
+            # 行数随插入记在 meta 表中，打开时不必扫描整个表
+            self.size = self.meta("rows") or 0
+        except sqlite3.DatabaseError:
+            self.conn.close()
+            raise
+        # 打开期间缓存目录的容量淘汰不会删除该数据库
+        hold_database(path)
+        self.closed = False
+        self.up_host_id = None
+        self.per_video_host = False  # 为真时每个视频分别确定Up主，与 CommentStore 相同
+        self.video_hosts_ready = False  # 本连接的临时表 video_hosts 是否已填好
+        self.cached_row = None  # 最近读取的一行，界面生成一行时会连续读取其中多个字段
+
+    def __len__(self):
+        return self.size
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def scalar(self, sql, params=()):
+        rows = self.execute(sql, params)
+        return rows[0][0] if rows else None
+
+    def script(self, sql):
+        with self.lock:
+            self.conn.executescript(sql)
+
+    def meta(self, key):
+        value = self.scalar("SELECT value FROM meta WHERE key = ?", (key,))
+        return None if value is None else json.loads(value)
+
+    def set_meta(self, key, value):
+        self.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, json.dumps(value, ensure_ascii=False)))
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.conn.close()
+            self.closed = True
+        release_database(self.path)
+
+    def snapshot(self):
+        """只读快照：在新连接上开始一个读事务（WAL模式），之后的刷新不影响快照；用完后 close()。"""
+        snapshot = CommentDatabase(self.path, self.tz_name)
+        snapshot.conn.execute("BEGIN")
+        # 读事务在第一次读取时才确定所见的版本
+        snapshot.size = snapshot.meta("rows") or 0
+        snapshot.up_host_id = self.up_host_id
+        return snapshot
+
+    def add_rows(self, chunk):
+        """导入一块原始数据（与流式加载相同：与已有ID重复的评论按行号改名），返回缺失video_id的评论ID。"""
+        check_columns(chunk)
+        chunk = clean_create_time(chunk)
+        raw_ids = chunk["comment_id"].astype(object).tolist()
+        existing = self.existing_ids(raw_ids)
+        ids = rename_duplicate_ids(raw_ids, chunk.index, existing)
+        table, missing_video_id = make_table(chunk, ids, self.tz_name)
+        self.insert(table)
+        return missing_video_id
+
+    def existing_ids(self, ids):
+        found = self.execute(
+            "SELECT c.comment_id FROM json_each(?) AS j JOIN comments AS c ON c.comment_id = j.value",
+            (json.dumps([value if isinstance(value, str) else None for value in ids], ensure_ascii=False),)
+        )
+        return {comment_id for comment_id, in found}
+
+    def insert(self, table):
+        rows = zip(range(self.size, self.size + len(table)), sql_values(table, DB_FIELDS))
+        with self.lock:
+            self.conn.executemany(
+                f"INSERT INTO comments (row, {', '.join(DB_FIELDS)}) VALUES (?{', ?' * len(DB_FIELDS)})",
+                ((row, *values) for row, values in rows)
+            )
+        self.size += len(table)
+        self.set_meta("rows", self.size)
+
+    def link(self):
+        # 父评论未确定的行按 parent_comment_id 查找父评论（已确定的不会因追加而变化）
+        self.execute("""
+            UPDATE comments SET parent_row = parent.row FROM comments AS parent
+            WHERE comments.parent_row IS NULL AND parent.comment_id = comments.parent_comment_id
+        """)
+
+    def rate(self, low=10, high=100):
+        """用SQL聚合计算直接回复数、三级回复数与评级，规则与 rate_comments 相同。"""
+        with stage("评级", rows=self.size):
+            with self.lock:
+                self.conn.execute("BEGIN")
+                self.conn.execute("UPDATE comments SET reply_count = 0, third_count = 0 "
+                                  "WHERE reply_count != 0 OR third_count != 0")
+                self.conn.execute("""
+                    UPDATE comments SET reply_count = counts.n FROM (
+                        SELECT parent_row, count(*) AS n FROM comments WHERE parent_row IS NOT NULL GROUP BY parent_row
+                    ) AS counts WHERE comments.row = counts.parent_row
+                """)
+                self.conn.execute("""
+                    UPDATE comments SET third_count = counts.n FROM (
+                        SELECT parent_row, sum(reply_count) AS n FROM comments WHERE parent_row IS NOT NULL
+                        GROUP BY parent_row
+                    ) AS counts WHERE comments.row = counts.parent_row
+                """)
+                self.up_host_id = self.find_up_host()
+                if self.per_video_host:
+                    self.find_video_hosts()
+                self.conn.execute(RATING_SQL.format(up=self.up_sql()), {"up": self.up_host_id, "low": low, "high": high})
+                self.conn.execute("COMMIT")
+            self.cached_row = None
+            self.set_meta("rating_params", [low, high, self.per_video_host])
+
+    def up_sql(self):
+        # 评级时Up主的user_id：按视频时从 video_hosts 中查找
+        if self.per_video_host:
+            return "(SELECT user_id FROM video_hosts AS v WHERE v.video_id = comments.video_id)"
+        return ":up"
+
+    def find_video_hosts(self):
+        for sql in VIDEO_HOSTS_SQL:
+            self.conn.execute(sql)
+        self.video_hosts_ready = True
+
+    def find_up_host(self):
+        # 确定Up主的user_id（假设第一个顶级评论来自Up主）
+        return self.scalar("SELECT user_id FROM comments WHERE parent_row IS NULL ORDER BY row LIMIT 1")
+
+    def apply_rows(self, chunk, low=10, high=100):
+        """应用刷新时新读到的行，规则与 CommentStore.apply_rows 相同。
+
+        返回字典：added/modified（新增与更新的评论的行位置）、missing_video_id（新增评论中缺失video_id的评论ID）。
+        """
+        check_columns(chunk)
+        chunk = clean_create_time(chunk)
+        chunk = chunk[~chunk["comment_id"].astype(object).duplicated(keep="last")]
+        table, missing_video_id = make_table(chunk, chunk["comment_id"].astype(object).tolist(), self.tz_name)
+        ids = table["comment_id"].tolist()
+        found = dict(self.execute(
+            "SELECT c.comment_id, json_array(c.row, c.last_modify_ts) FROM json_each(?) AS j "
+            "JOIN comments AS c ON c.comment_id = j.value",
+            (json.dumps([value if isinstance(value, str) else None for value in ids], ensure_ascii=False),)
+        ))
+        is_new = np.array([comment_id not in found for comment_id in ids], dtype=bool)
+
+        # 已有评论中 last_modify_ts 变化的视为更新，父评论重新查找
+        updates = []
+        fields = [field for field in DB_FIELDS if field not in ("comment_id", "rating")]
+        for comment_id, values in zip(table["comment_id"][~is_new], sql_values(table[~is_new], fields)):
+            row, old_ts = json.loads(found[comment_id])
+            if values[fields.index("last_modify_ts")] != old_ts:
+                updates.append((*values, row))
+        old_size = self.size
+        with self.lock:
+            self.conn.execute("BEGIN")
+            if self.per_video_host and not self.video_hosts_ready:
+                # 各视频原来的Up主，用于判断刷新后是否变化
+                self.find_video_hosts()
+            self.mark_changed([update[-1] for update in updates])
+            self.conn.executemany(
+                f"UPDATE comments SET {', '.join(f'{field} = ?' for field in fields)}, parent_row = NULL WHERE row = ?",
+                updates
+            )
+            self.insert(table[is_new])
+            self.link()
+            # 新评论，以及因父评论出现而不再是顶级的评论
+            self.conn.execute("INSERT OR IGNORE INTO changed SELECT row FROM comments WHERE row >= ?", (old_size,))
+            self.conn.execute("INSERT OR IGNORE INTO changed SELECT row FROM comments WHERE parent_row >= ? AND row < ?",
+                              (old_size, old_size))
+            # 阈值或Up主变化时全部重新评级，否则只重新评级受影响的行（与 CommentStore.update_ratings 相同）
+            rerated_all = self.meta("rating_params") != [low, high, self.per_video_host] or self.update_hosts()
+            if not rerated_all:
+                self.rate_changed(low, high)
+            self.conn.execute("COMMIT")
+        self.cached_row = None
+        if rerated_all:
+            self.rate(low, high)
+        new_ids = set(table["comment_id"][is_new].tolist())
+        return {
+            "added": np.arange(old_size, self.size),
+            "modified": np.array([update[-1] for update in updates], dtype=np.int64),
+            "missing_video_id": [comment_id for comment_id in missing_video_id if comment_id in new_ids],
+        }
+
+    def mark_changed(self, rows):
+        # 更新前记下要更新的行及其原来的父评论（回复数减少），以及它们原来所在的视频
+        for sql in CHANGED_SQL:
+            self.conn.execute(sql)
+        self.conn.execute("INSERT OR IGNORE INTO changed SELECT value FROM json_each(?)", (json.dumps(rows),))
+        self.conn.execute("""
+            INSERT OR IGNORE INTO changed SELECT c.parent_row FROM changed JOIN comments AS c ON c.row = changed.row
+            WHERE c.parent_row IS NOT NULL
+        """)
+        self.mark_videos()
+
+    def mark_videos(self):
+        self.conn.execute("""
+            INSERT OR IGNORE INTO touched_videos SELECT c.video_id FROM changed JOIN comments AS c ON c.row = changed.row
+            WHERE c.video_id IS NOT NULL
+        """)
+
+    def update_hosts(self):
+        """changed 中的行有变化后更新Up主，返回Up主（per_video_host 时为任一已有视频的Up主）是否改变。"""
+        up_host_id = self.find_up_host()
+        changed = up_host_id != self.up_host_id
+        self.up_host_id = up_host_id
+        if not self.per_video_host:
+            return changed
+        # 只重新查找有变化的行所在视频的Up主，新视频的Up主直接记下
+        self.mark_videos()
+        for sql in NEW_HOSTS_SQL:
+            self.conn.execute(sql)
+        if self.conn.execute(
+            "SELECT count(*) FROM new_hosts WHERE had_host AND (host_row IS NULL OR old_user IS NOT user_id)"
+        ).fetchone()[0]:
+            return True
+        self.conn.execute("INSERT OR REPLACE INTO video_hosts SELECT video_id, user_id FROM new_hosts "
+                          "WHERE host_row IS NOT NULL")
+        return False
+
+    def rate_changed(self, low=10, high=100):
+        # 只重新计算受影响的行的回复数、三级回复数与评级，其它行都不变
+        with stage("评级", rows=self.scalar("SELECT count(*) FROM changed")):
+            for sql in AFFECTED_SQL:
+                self.conn.execute(sql)
+            self.conn.execute(RATING_SQL.format(up=self.up_sql()) + "WHERE row IN (SELECT row FROM affected)",
+                              {"up": self.up_host_id, "low": low, "high": high})
+
+    def row(self, pos):
+        if self.cached_row is None or self.cached_row["row"] != pos:
+            with self.lock:
+                cursor = self.conn.execute(f"SELECT row, {', '.join(DB_FIELDS)}, reply_count FROM comments WHERE row = ?", (pos,))
+                names = [column[0] for column in cursor.description]
+                self.cached_row = dict(zip(names, cursor.fetchone()))
+        return self.cached_row
+
+    def value(self, field, pos):
+        if field == "time_str":
+            return format_timestamp(self.row(pos)["create_time"], self.tz_name)
+        value = self.row(pos)[field]
+        # 缺失的文本与内存中的存储一样返回NaN
+        return np.nan if value is None else value
+
+    def table(self, start=0, stop=None):
+        """第 start 到 stop 行的评论表，列与 COMMENT_FIELDS 一致（time_str 按当前时区生成）。"""
+        stop = self.size if stop is None else min(stop, self.size)
+        rows = self.execute(f"SELECT {', '.join(DB_FIELDS)} FROM comments WHERE row >= ? AND row < ? ORDER BY row",
+                            (start, stop))
+        return self.make_frame(rows)
+
+    def make_frame(self, rows):
+        table = pd.DataFrame(rows, columns=DB_FIELDS, dtype=object)
+        table["create_time"] = table["create_time"].astype(np.int64)
+        table["time_str"] = format_timestamps(table["create_time"].to_numpy(), self.tz_name)
+        return table[COMMENT_FIELDS]
+
+    @property
+    def children(self):
+        return DbChildren(self)
+
+    def top_level(self, reverse=False, mask=None, key="create_time", reverse_ties=False, rating_order=None):
+        """顶级评论（mask 为搜索结果时只含其中的评论），按需分页读取的行位置序列。
+
+        默认按create_time排序，时间相同时保持行顺序；reverse_ties 为真时相同键的行也倒序
+        （与按列排序时直接反转升序结果一致）。
+        """
+        return TopLevelPages(self, mask, order_key(key, mask, rating_order), reverse, reverse_ties)
+
+    def build_children(self, order=None, mask=None):
+        # order 为 (排序键, 是否降序, 评级顺序)，默认按时间；mask 为搜索结果时只含其中的回复
+        key, descending, rating_order = order if order is not None else ("create_time", False, None)
+        return DbChildren(self, mask, key, descending, rating_order)
+
+    def thread_stores(self, reverse=False, batch_threads=THREAD_BATCH):
+        """按顶级评论的顺序，每次取出 batch_threads 个完整评论串组成的 CommentStore（供导出TXT）。"""
+        pages = self.top_level(reverse)
+        for start in range(0, len(pages), batch_threads):
+            roots = pages[start:start + batch_threads]
+            rows = self.execute(f"""
+                WITH RECURSIVE thread(row) AS (
+                    SELECT value FROM json_each(?)
+                    UNION ALL
+                    SELECT c.row FROM comments AS c JOIN thread ON c.parent_row = thread.row
+                )
+                SELECT {', '.join(DB_FIELDS)} FROM comments WHERE row IN thread ORDER BY row
+            """, (json.dumps(roots.tolist()),))
+            yield CommentStore.from_table(self.make_frame(rows), self.tz_name)
+
+
+def order_key(key, mask=None, rating_order=None):
+    """排序键的SQL表达式与参数（表别名为c）。搜索结果中的回复数只计显示的回复。"""
+    if key in ("nickname", "content"):
+        return text_key(f"c.{key}"), []
+    if key == "reply_count":
+        if mask is None:
+            return "c.reply_count", []
+        return "(SELECT count(*) FROM comments AS k JOIN shown ON shown.row = k.row WHERE k.parent_row = c.row)", []
+    if key == "rating":
+        # 未知评级排在最后，与 sort_orders 一致
+        cases = " ".join("WHEN ? THEN ?" for _ in rating_order)
+        return f"CASE c.rating {cases} ELSE 100 END", [value for item in rating_order.items() for value in item]
+    return "c.create_time", []
+
+
+class TopLevelPages:
+    """按需读取的顶级评论行位置序列，支持 len() 与切片，用作界面的 pending_top。
+
+    顺序翻页时从上一页最后一行的排序键继续（键集分页），不必跳过前面的行。
+    """
+
+    def __init__(self, db, mask, key, reverse=False, reverse_ties=False):
+        self.db = db
+        self.expression, self.params = key
+        self.source = "comments AS c" if mask is None else "shown JOIN comments AS c ON c.row = shown.row"
+        self.reverse = reverse
+        self.reverse_ties = reverse_ties
+        self.count = None
+        self.last = None  # (下一页的起点, 上一页最后一行的排序键, 行位置)
+
+    def __len__(self):
+        if self.count is None:
+            self.count = self.db.scalar(f"SELECT count(*) FROM {self.source} WHERE c.parent_row IS NULL")
+        return self.count
+
+    def __getitem__(self, index):
+        start, stop, _ = index.indices(len(self))
+        if stop <= start:
+            return np.empty(0, dtype=np.int64)
+        key_order = "DESC" if self.reverse else "ASC"
+        row_order = "DESC" if self.reverse_ties else "ASC"
+        sql = f"SELECT c.row, {self.expression} FROM {self.source} WHERE c.parent_row IS NULL"
+        params = list(self.params)
+        if self.last is not None and self.last[0] == start:
+            _, key, row = self.last
+            key_op = "<" if self.reverse else ">"
+            row_op = "<" if self.reverse_ties else ">"
+            sql += f" AND ({self.expression} {key_op} ? OR ({self.expression} = ? AND c.row {row_op} ?))"
+            params += self.params + [key] + self.params + [key, row]
+            offset = 0
+        else:
+            offset = start
+        sql += f" ORDER BY {self.expression} {key_order}, c.row {row_order} LIMIT ? OFFSET ?"
+        rows = self.db.execute(sql, params + self.params + [stop - start, offset])
+        if rows:
+            self.last = (start + len(rows), rows[-1][1], rows[-1][0])
+        return np.array([row for row, _ in rows], dtype=np.int64)
+
+
+class DbChildren:
+    """数据库中的子评论表，接口与 Children 中界面使用的部分一致（of/count）。"""
+
+    def __init__(self, db, mask=None, key="create_time", descending=False, rating_order=None):
+        self.db = db
+        self.filtered = mask is not None
+        self.expression, self.params = order_key(key, mask, rating_order)
+        self.order = "DESC" if descending else "ASC"
+
+    def of(self, pos):
+        join = "JOIN shown ON shown.row = c.row" if self.filtered else ""
+        rows = self.db.execute(
+            f"SELECT c.row FROM comments AS c {join} WHERE c.parent_row = ? "
+            f"ORDER BY {self.expression} {self.order}, c.row {self.order}",
+            [pos] + self.params
+        )
+        return np.array([row for row, in rows], dtype=np.int64)
+
+    def count(self, pos):
+        if not self.filtered:
+            return self.db.row(pos)["reply_count"]
+        return self.db.scalar(
+            "SELECT count(*) FROM comments AS c JOIN shown ON shown.row = c.row WHERE c.parent_row = ?", (pos,)
+        )
+
+
+class Selection:
+    """数据库中的搜索结果：命中的评论及其各级父评论保存在临时表 shown 中。"""
+
+    def __init__(self, db, hits):
+        self.db = db
+        self.hits = hits
+        self.context = ContextRows(db)
+
+
+class ContextRows:
+    # 搜索结果中只作为上下文显示的父评论，按行位置查询（用法与内存中的 context_mask 相同）
+    def __init__(self, db):
+        self.db = db
+
+    def __getitem__(self, pos):
+        return self.db.scalar("SELECT matched FROM shown WHERE row = ?", (pos,)) == 0
+
+
+def query_condition(query):
+    """把 Query 换成SQL条件（表别名为c）与参数。"""
+    conditions, params = [], []
+    if query.ratings is not None:
+        conditions.append(f"c.rating IN ({', '.join('?' * len(query.ratings)) or 'NULL'})")
+        params += sorted(query.ratings)
+    for column, op, value in (
+            ("create_time", ">=", query.start), ("create_time", "<", query.end),
+            ("user_id", "=", query.user_id), ("video_id", "=", query.video_id),
+            ("reply_count", ">=", query.min_replies), ("reply_count", "<=", query.max_replies)):
+        if value is not None:
+            conditions.append(f"c.{column} {op} ?")
+            params.append(value)
+    if query.text and len(query.text) >= FTS_MIN_CHARS:
+        conditions.append("c.row IN (SELECT rowid FROM comments_fts WHERE comments_fts MATCH ?)")
+        params.append('"' + query.text.replace('"', '""') + '"')
+    elif query.text:
+        conditions.append("(instr(py_lower(coalesce(c.nickname, '')), ?) OR instr(py_lower(coalesce(c.content, '')), ?))")
+        params += [query.text, query.text]
+    return " AND ".join(conditions) or "1", params
+
+
+class DbQueryEngine:
+    """在数据库上执行 Query；命中保存在临时表中，收窄的查询只在上一次的命中中继续筛选。"""
+
+    def __init__(self, db):
+        self.db = db
+        self.last = None
+        db.script("""
+            CREATE TEMP TABLE IF NOT EXISTS hits (row INTEGER PRIMARY KEY);
+            CREATE TEMP TABLE IF NOT EXISTS shown (row INTEGER PRIMARY KEY, matched INTEGER NOT NULL);
+        """)
+
+    def run(self, query):
+        """返回 (命中数, Selection)；显示的行为命中的评论连同各级父评论。"""
+        condition, params = query_condition(query)
+        db = self.db
+        with db.lock:
+            db.conn.execute("BEGIN")
+            if self.last is not None and query.narrows(self.last):
+                db.conn.execute(f"DELETE FROM hits WHERE row NOT IN (SELECT c.row FROM hits JOIN comments AS c "
+                                f"ON c.row = hits.row WHERE {condition})", params)
+            else:
+                db.conn.execute("DELETE FROM hits")
+                db.conn.execute(f"INSERT INTO hits SELECT c.row FROM comments AS c WHERE {condition}", params)
+            # 沿 parent_row 向上补全父评论，UNION 去重使每行至多处理一次
+            db.conn.execute("DELETE FROM shown")
+            db.conn.execute("INSERT INTO shown SELECT row, 1 FROM hits")
+            db.conn.execute("""
+                INSERT OR IGNORE INTO shown
+                WITH RECURSIVE up(row) AS (
+                    SELECT c.parent_row FROM hits JOIN comments AS c ON c.row = hits.row WHERE c.parent_row IS NOT NULL
+                    UNION
+                    SELECT c.parent_row FROM up JOIN comments AS c ON c.row = up.row WHERE c.parent_row IS NOT NULL
+                )
+                SELECT row, 0 FROM up
+            """)
+            db.conn.execute("COMMIT")
+            hits = db.conn.execute("SELECT count(*) FROM hits").fetchone()[0]
+        self.last = query
+        return hits, Selection(db, hits)
+
+
+def open_database(file_path, tz_name=DISPLAY_TIMEZONE, low=10, high=100, per_video_host=False):
+    """源文件已导入且未变化时打开其数据库，否则返回None；评级参数不同时重新评级。"""
+    path = database_path(file_path)
+    if not os.path.exists(path):
+        return None
+    db = None
+    try:
+        db = CommentDatabase(path, tz_name)
+        if db.meta("version") != DB_VERSION or db.meta("signature") != file_signature(file_path):
+            db.close()
+            return None
+    except (sqlite3.DatabaseError, OSError, ValueError):
+        if db is not None:
+            db.close()
+        return None
+    db.per_video_host = per_video_host
+    if db.meta("rating_params") != [low, high, per_video_host]:
+        db.rate(low, high)
+    db.up_host_id = db.find_up_host()
+    # 记录最近使用时间，供缓存目录的淘汰策略使用
+    os.utime(path)
+    return db
+
+
+def import_csv(file_path, tz_name=DISPLAY_TIMEZONE, low=10, high=100, chunk_rows=100000, progress=None, cancel=None,
+               per_video_host=False, max_bytes=DEFAULT_MAX_BYTES):
+    """把CSV分块导入新的数据库（先写临时文件，完成后改名），返回 (CommentDatabase, 缺失video_id的评论ID列表)。
+
+    导入后按 max_bytes 淘汰缓存目录中最久未使用的条目（不含本数据库）。
+
+    progress(已读取字节数) 在每块之后调用；cancel 为 threading.Event，被设置时放弃导入并返回None。
+    """
+    path = database_path(file_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    signature = file_signature(file_path)
+    encoding, _ = detect_encoding(file_path)
+    try:
+        result = import_rows(file_path, path, encoding, tz_name, chunk_rows, progress, cancel)
+    except UnicodeDecodeError:
+        if encoding == "gbk":
+            raise
+        # 非UTF-8字节出现在取样范围之后，退回GBK重新导入
+        result = import_rows(file_path, path, "gbk", tz_name, chunk_rows, progress, cancel)
+    if result is None:
+        return None
+    db, missing_video_id = result
+    with stage("建立索引", rows=len(db)):
+        db.link()
+        db.script(INDEXES)
+    db.per_video_host = per_video_host
+    db.rate(low, high)
+    db.set_meta("version", DB_VERSION)
+    db.set_meta("signature", signature)
+    # WAL模式下读事务看到固定的版本，导出可以读取快照，同时界面刷新写入
+    db.execute("PRAGMA journal_mode = WAL")
+    db.close()
+    os.replace(db.path, path)
+    evict(cache_dir(file_path), max_bytes, keep=path)
+    db = CommentDatabase(path, tz_name)
+    db.per_video_host = per_video_host
+    db.up_host_id = db.find_up_host()
+    return db, missing_video_id
+
+
+def import_rows(file_path, path, encoding, tz_name, chunk_rows, progress=None, cancel=None):
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = connect(tmp_path)
+    conn.executescript(SCHEMA)
+    conn.close()
+    db = CommentDatabase(tmp_path, tz_name)
+    # 临时文件完成后才改名，导入中途不需要日志
+    db.execute("PRAGMA journal_mode = OFF")
+    db.execute("PRAGMA synchronous = OFF")
+    missing_video_id = []
+    try:
+        # 各列都按文本保存在数据库中，整数列也按文本读取
+        for chunk, offset in iter_csv_chunks(file_path, encoding, chunk_rows):
+            if cancel is not None and cancel.is_set():
+                db.close()
+                os.remove(tmp_path)
+                return None
+            with db.lock:
+                db.conn.execute("BEGIN")
+                missing_video_id.extend(db.add_rows(chunk))
+                db.conn.execute("COMMIT")
+            if progress is not None:
+                progress(offset)
+    except Exception:
+        db.close()
+        os.remove(tmp_path)
+        raise
+    return db, missing_video_id
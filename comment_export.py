@@ -0,0 +1,163 @@
+import os
+
+import pandas as pd
+
+from comment_db import CommentDatabase
+from comment_store import walk
+
+# 每级缩进
+INDENT = "    "
+# 文件缓冲区大小，以及攒够多少段文本后合并写入一次
+WRITE_BUFFER = 1 << 20
+WRITE_BATCH = 4096
+
+# 导出表格时使用的评论表列（time_str 导出为 create_time），以及每块的行数
+EXPORT_COLUMNS = [
+    "comment_id", "parent_comment_id", "time_str", "video_id", "content",
+    "user_id", "nickname", "avatar", "sub_comment_count", "last_modify_ts", "rating"
+]
+EXPORT_CHUNK_ROWS = 10000
+
+
+def iter_txt(store, reverse=False, batch_rows=EXPORT_CHUNK_ROWS):
+    """逐段生成TXT文本，每条评论一段。
+
+    先按深度优先顺序展开评论串（walk 用显式栈，不受递归深度限制），
+    再每 batch_rows 条按行位置批量取出字段后拼接文本。数据库中的评论按批取出
+    若干完整的评论串逐批生成，各批的文本直接相连。
+    """
+    if isinstance(store, CommentDatabase):
+        for part in store.thread_stores(reverse):
+            yield from iter_txt(part, reverse, batch_rows)
+        return
+    positions, _, depths, ranks = walk(store.top_level(reverse), store.children)
+    counts = store.children.counts()
+    for start in range(0, len(positions), batch_rows):
+        rows = positions[start:start + batch_rows]
+        fields = zip(
+            depths[start:start + batch_rows].tolist(), ranks[start:start + batch_rows].tolist(),
+            store.take("comment_id", rows), store.take("time_str", rows), store.take("nickname", rows),
+            store.take("user_id", rows), counts[rows].tolist(), store.take("rating", rows),
+            store.take("content", rows)
+        )
+        for i, (depth, rank, comment_id, time_str, nickname, user_id, count, rating, content) in enumerate(fields, start):
+            if depth == 0:
+                if i:
+                    yield "}\n\n"
+                yield (
+                    f"{{\n"
+                    f"{INDENT}main_post: {comment_id}\n"
+                    f"{INDENT}time: {time_str}\n"
+                    f"{INDENT}username: {nickname} ({user_id})\n"
+                    f"{INDENT}replyer_number: {count}\n"
+                    f"{INDENT}rating: {rating}\n"
+                    f"{INDENT}content: {content}\n"
+                )
+            else:
+                indent = INDENT * (depth + 1)
+                yield (
+                    f"{indent}replyer{rank}:\n"
+                    f"{indent}{INDENT}time: {time_str}\n"
+                    f"{indent}{INDENT}username: {nickname} ({user_id})\n"
+                    f"{indent}{INDENT}replyer_number: {count}\n"
+                    f"{indent}{INDENT}rating: {rating}\n"
+                    f"{indent}{INDENT}content: {content}\n"
+                )
+    if len(positions):
+        yield "}\n\n"
+
+
+def write_txt(file, store, reverse=False):
+    """按评论串结构写出TXT，reverse 为顶级评论按时间倒序。"""
+    batch = []
+    for piece in iter_txt(store, reverse):
+        batch.append(piece)
+        if len(batch) >= WRITE_BATCH:
+            file.write("".join(batch))
+            batch.clear()
+    file.write("".join(batch))
+
+
+def save_txt(file_path, store, reverse=False):
+    with open(file_path, 'w', encoding='utf-8', buffering=WRITE_BUFFER) as f:
+        write_txt(f, store, reverse)
+
+
+def export_columns(table):
+    """导出用的列：create_time 取格式化后的时间字符串，列顺序与原导出一致。"""
+    return table[EXPORT_COLUMNS].rename(columns={"time_str": "create_time"})
+
+
+def iter_chunks(store, chunk_rows=EXPORT_CHUNK_ROWS):
+    # 每次只从存储中取出一块行组成评论表
+    for start in range(0, len(store), chunk_rows):
+        yield export_columns(store.table(start, start + chunk_rows))
+
+
+def save_csv(file_path, store, chunk_rows=EXPORT_CHUNK_ROWS):
+    """由评论存储分块写出CSV，结果与 save_csv_records 相同。"""
+    with open(file_path, 'w', encoding='utf-8-sig', newline='', buffering=WRITE_BUFFER) as f:
+        if not len(store):
+            export_columns(store.table(0, 0)).to_csv(f, index=False)
+        for i, chunk in enumerate(iter_chunks(store, chunk_rows)):
+            chunk.to_csv(f, index=False, header=(i == 0))
+
+
+def save_jsonl(file_path, store, chunk_rows=EXPORT_CHUNK_ROWS):
+    # 每行一个JSON对象，缺失值写为null
+    with open(file_path, 'w', encoding='utf-8', buffering=WRITE_BUFFER) as f:
+        for chunk in iter_chunks(store, chunk_rows):
+            text = chunk.to_json(orient="records", lines=True, force_ascii=False)
+            f.write(text if text.endswith("\n") else text + "\n")
+
+
+def save_parquet(file_path, store, chunk_rows=EXPORT_CHUNK_ROWS):
+    # 每块写为一个行组，所有列均为字符串类型
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("导出Parquet需要安装 pyarrow（pip install pyarrow）")
+    schema = pa.schema([(name, pa.string()) for name in export_columns(store.table(0, 0)).columns])
+    with pq.ParquetWriter(file_path, schema) as writer:
+        for chunk in iter_chunks(store, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+# 按扩展名选择导出格式，未知扩展名按CSV导出
+TABLE_EXPORTERS = {
+    ".csv": save_csv,
+    ".jsonl": save_jsonl,
+    ".parquet": save_parquet,
+}
+
+
+def save_table(file_path, store):
+    extension = os.path.splitext(file_path)[1].lower()
+    TABLE_EXPORTERS.get(extension, save_csv)(file_path, store)
+
+
+def save_csv_records(file_path, comments):
+    """逐条组装字典再导出CSV的原始实现，保留用于对照与基准测试。"""
+    # 准备导出数据
+    data_to_export = []
+
+    for comment in comments.values():
+        data = {
+            "comment_id": comment.get("comment_id", ""),
+            "parent_comment_id": comment.get("parent_comment_id", ""),
+            "create_time": comment.get("time_str", ""),
+            "video_id": comment.get("video_id", "N/A"),  # 使用get避免KeyError
+            "content": comment.get("content", ""),
+            "user_id": comment.get("user_id", ""),
+            "nickname": comment.get("nickname", ""),
+            "avatar": comment.get("avatar", ""),
+            "sub_comment_count": comment.get("sub_comment_count", ""),
+            "last_modify_ts": comment.get("last_modify_ts", ""),
+            "rating": comment.get("rating", "")
+        }
+        data_to_export.append(data)
+
+    # 将数据转换为DataFrame并导出为CSV
+    export_df = pd.DataFrame(data_to_export)
+    export_df.to_csv(file_path, index=False, encoding='utf-8-sig')
@@ -0,0 +1,169 @@
+"""后台任务调度：有界线程池按优先级执行加载、刷新与导出任务。
+
+同一个键的新任务取代旧任务：排队中的旧任务直接移除，运行中的被设置取消标志，
+由任务在各阶段之间检查后自行退出（协作式取消）；同一个键的任务不会同时运行，
+新任务等旧任务退出后才开始，因此两次加载不会同时改写评论存储。
+"""
+import collections
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 优先级，数值小的先执行
+PRIORITY_HIGH = 0  # 加载与刷新：决定界面显示的数据
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2  # 导出：读取快照，不影响界面
+PRIORITY_NAMES = {PRIORITY_HIGH: "高", PRIORITY_NORMAL: "中", PRIORITY_LOW: "低"}
+
+# 任务状态
+QUEUED = "排队中"
+RUNNING = "运行中"
+DONE = "完成"
+FAILED = "失败"
+CANCELLED = "已取消"
+
+# 线程池大小：一个加载或刷新之外还能同时进行一个导出
+DEFAULT_WORKERS = 2
+# 任务面板中保留的已结束任务数
+HISTORY_SIZE = 20
+
+
+class Job:
+    """一个后台任务。cancel 被设置后任务应尽快退出；key/priority 在提交时设置。"""
+
+    def __init__(self, label=""):
+        self.label = label
+        self.key = None
+        self.priority = PRIORITY_NORMAL
+        self.cancel = threading.Event()
+        self.state = None
+        self.submitted = None
+        self.started = None
+        self.finished = None
+        self.error = None
+
+    def elapsed(self, now=None):
+        """排队中为已等待的秒数，运行中与已结束为运行的秒数。"""
+        now = time.perf_counter() if now is None else now
+        if self.started is None:
+            return now - self.submitted if self.submitted is not None else 0.0
+        return (self.finished or now) - self.started
+
+
+class JobScheduler:
+    """在有界线程池中按优先级（同优先级先提交的先执行）运行任务，可在任意线程中提交与取消。"""
+
+    def __init__(self, max_workers=DEFAULT_WORKERS):
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="job")
+        self.lock = threading.Lock()
+        self.queue = []  # (优先级, 提交序号, 任务, 函数, 参数) 的堆
+        self.running = []
+        self.history = collections.deque(maxlen=HISTORY_SIZE)
+        self.counter = itertools.count()
+        self.closed = False
+
+    def submit(self, job, func, *args, key=None, priority=PRIORITY_NORMAL):
+        """提交任务，在线程池中调用 func(*args)；key 相同的旧任务被取代。返回 job。"""
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("任务调度器已关闭")
+            if key is not None:
+                self.supersede(key)
+            job.key = key
+            job.priority = priority
+            job.state = QUEUED
+            job.submitted = time.perf_counter()
+            heapq.heappush(self.queue, (priority, next(self.counter), job, func, args))
+            self.dispatch()
+        return job
+
+    def supersede(self, key):
+        # 移除排队中的同键任务，取消运行中的同键任务（调用时已持有锁）
+        kept = []
+        for item in self.queue:
+            if item[2].key == key:
+                item[2].cancel.set()
+                self.retire(item[2], CANCELLED)
+            else:
+                kept.append(item)
+        if len(kept) != len(self.queue):
+            self.queue = kept
+            heapq.heapify(self.queue)
+        for job in self.running:
+            if job.key == key:
+                job.cancel.set()
+
+    def dispatch(self):
+        # 有空闲线程时按优先级取出可以开始的任务；同键任务仍在运行的暂不开始（调用时已持有锁）
+        waiting = []
+        busy_keys = {job.key for job in self.running if job.key is not None}
+        while self.queue and len(self.running) < self.max_workers:
+            item = heapq.heappop(self.queue)
+            _, _, job, func, args = item
+            if job.cancel.is_set():
+                self.retire(job, CANCELLED)
+                continue
+            if job.key is not None and job.key in busy_keys:
+                waiting.append(item)
+                continue
+            job.state = RUNNING
+            job.started = time.perf_counter()
+            self.running.append(job)
+            busy_keys.add(job.key)
+            self.executor.submit(self.run, job, func, args)
+        for item in waiting:
+            heapq.heappush(self.queue, item)
+
+    def run(self, job, func, args):
+        try:
+            func(*args)
+        except Exception as e:
+            # 任务函数通常自行处理并显示错误，这里只记录未处理的异常
+            job.error = e
+        with self.lock:
+            self.running.remove(job)
+            if job.cancel.is_set():
+                state = CANCELLED
+            else:
+                state = FAILED if job.error is not None else DONE
+            self.retire(job, state)
+            if not self.closed:
+                self.dispatch()
+
+    def retire(self, job, state):
+        job.state = state
+        job.finished = time.perf_counter()
+        self.history.append(job)
+
+    def cancel(self, job):
+        """取消任务：排队中的直接移除，运行中的设置取消标志。"""
+        with self.lock:
+            job.cancel.set()
+            if job.state == QUEUED:
+                self.queue = [item for item in self.queue if item[2] is not job]
+                heapq.heapify(self.queue)
+                self.retire(job, CANCELLED)
+
+    def jobs(self):
+        """任务面板显示的任务：运行中、排队中（按执行顺序）与最近结束的（新的在前）。"""
+        with self.lock:
+            queued = [item[2] for item in sorted(self.queue, key=lambda item: item[:2])]
+            return self.running + queued + list(reversed(self.history))
+
+    def idle(self):
+        with self.lock:
+            return not self.running and not self.queue
+
+    def shutdown(self):
+        # 退出时取消全部任务，不等待运行中的任务
+        with self.lock:
+            self.closed = True
+            for item in self.queue:
+                item[2].cancel.set()
+            self.queue = []
+            for job in self.running:
+                job.cancel.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,240 @@
+"""多核处理：按 video_id 把评论分区，在进程池中分别构建各分区的评论存储、评论串与评级，
+再按原始行顺序合并，各行的值、父子关系与评级都与单进程的 build_store 相同。
+
+同一视频的评论总在同一分区中，各分区返回链接好的子评论表（CSR）与评级，合并时只做向量化的
+拼接与按行重排，不再整体重新链接、评级：只有父评论在别的分区中的回复（video_id 与父评论不同）
+需要在合并后挂到父评论下，并与受影响的父评论、祖父评论一起重新评级；按全部数据的第一个顶级评论
+确定Up主时，分区内先按没有Up主评级，合并后只改Up主的评论。
+"""
+import heapq
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from comment_core import DISPLAY_TIMEZONE, clean_comments, clean_video_ids, make_table, reply_counts, select_ratings
+from comment_profile import activate, stage
+from comment_store import TEXT_FIELDS, Children, CodedColumn, CommentStore, IdIndex, IntColumn, StringColumn
+
+# 每个进程分到的分区数，分区多一些可以平衡大小悬殊的视频
+PARTS_PER_WORKER = 4
+# 重排文本列时每批搬动的字节数上限（按字节建立的下标数组的大小与此成正比）
+GATHER_BYTES = 1 << 22
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def partition_rows(video_ids, parts):
+    """把各视频的行分到至多 parts 个分区，返回各分区的行位置数组（升序）。
+
+    视频从大到小依次放入当前行数最少的分区，同一视频的行不会被拆开。
+    """
+    codes, _ = pd.factorize(pd.Series(video_ids, dtype=object), use_na_sentinel=False)
+    sizes = np.bincount(codes)
+    heap = [(0, part) for part in range(min(parts, len(sizes)))]
+    part_of_video = np.empty(len(sizes), dtype=np.int64)
+    for video in np.argsort(-sizes, kind="stable").tolist():
+        rows, part = heapq.heappop(heap)
+        part_of_video[video] = part
+        heapq.heappush(heap, (rows + int(sizes[video]), part))
+    part_of_row = part_of_video[codes]
+    order = np.argsort(part_of_row, kind="stable")
+    bounds = np.searchsorted(part_of_row[order], np.arange(1, len(heap)))
+    return [rows for rows in np.split(order, bounds) if len(rows)]
+
+
+def pool_context():
+    # 界面在工作线程中调用，不能在有其它线程时fork；子进程由forkserver（没有时为spawn）启动
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def build_partition(df, tz_name, low, high, per_video_host):
+    """在子进程中运行：df 为一个分区的清洗后数据（comment_id 已去重），返回链接并评级后的分区存储。
+
+    按全部数据确定Up主时，Up主要合并后才能确定，分区内先按没有Up主评级。
+    """
+    table, _ = make_table(df, df["comment_id"], tz_name)
+    store = CommentStore.from_table(table, tz_name)
+    store.per_video_host = per_video_host
+    if per_video_host:
+        store.rate(low, high)
+    else:
+        count_second, count_third = reply_counts(store.parent_pos)
+        is_up = np.zeros(len(store), dtype=bool)
+        ratings = select_ratings(is_up, store.parent_pos < 0, count_second, count_third, low, high)
+        store.columns["rating"] = CodedColumn.from_values(ratings)
+    return store
+
+
+def merge_column(columns, source):
+    """合并各分区的同一列；source[g] 为合并后第 g 行在各分区依次相连后的位置。"""
+    if all(isinstance(column, CodedColumn) for column in columns):
+        return merge_coded(columns, source)
+    if all(isinstance(column, IntColumn) for column in columns):
+        values = np.concatenate([column.values for column in columns])[source]
+        null = np.concatenate([column.null_mask() for column in columns])[source]
+        return IntColumn(values, null if null.any() else None)
+    columns = [
+        column if isinstance(column, StringColumn) else StringColumn.from_values(column.take(np.arange(len(column))))
+        for column in columns
+    ]
+    bases = np.cumsum([0] + [int(column.offsets[-1]) for column in columns[:-1]])
+    starts = np.concatenate([column.offsets[:-1] + base for column, base in zip(columns, bases)])[source]
+    ends = np.concatenate([column.offsets[1:] + base for column, base in zip(columns, bases)])[source]
+    data = np.frombuffer(b"".join(memoryview(column.data)[:column.offsets[-1]] for column in columns), dtype=np.uint8)
+    offsets = np.zeros(len(source) + 1, dtype=np.int64)
+    np.cumsum(ends - starts, out=offsets[1:])
+    null = np.concatenate([column.null_mask() for column in columns])[source]
+    return StringColumn(gather_bytes(data, starts, offsets).tobytes(), offsets, null if null.any() else None)
+
+
+def gather_bytes(data, starts, offsets):
+    """依次取出 data 中的各段（第 i 段从 starts[i] 开始，长度与结果中的 offsets[i]:offsets[i + 1] 相同）。
+
+    按字节建立下标、整批搬动，每批不超过 GATHER_BYTES 字节，不逐段拼接。
+    """
+    out = np.empty(int(offsets[-1]), dtype=np.uint8)
+    # 每批的第一行：结果中的字节位置按 GATHER_BYTES 分段
+    bounds = np.unique(np.searchsorted(offsets[1:], np.arange(0, len(out), GATHER_BYTES), side="right"))
+    bounds = np.append(bounds, len(starts))
+    for first, last in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        lengths = offsets[first + 1:last + 1] - offsets[first:last]
+        begin, end = int(offsets[first]), int(offsets[last])
+        # 结果中第 k 个字节来自 starts[行] + (k - offsets[行])
+        shift = np.repeat(starts[first:last] - offsets[first:last], lengths)
+        out[begin:end] = data[shift + np.arange(begin, end)]
+    return out
+
+
+def merge_coded(columns, source):
+    # 各分区的不同值统一编号，再按合并后首次出现的顺序重新编号（与整体一次编码的结果相同）
+    categories = np.concatenate([np.asarray(column.categories, dtype=object) for column in columns])
+    unified, uniques = pd.factorize(pd.Series(categories, dtype=object))
+    bases = np.cumsum([0] + [len(column.categories) for column in columns[:-1]])
+    # 末尾的-1对应缺失值（编号-1），全为缺失值的列没有不同值
+    lookup = np.append(unified, -1)
+    codes = np.concatenate([
+        lookup[np.where(column.codes >= 0, column.codes + base, -1)] for column, base in zip(columns, bases)
+    ])[source]
+    valid = codes >= 0
+    used, first = np.unique(codes[valid], return_index=True)
+    used = used[np.argsort(first)]
+    renumber = np.empty(len(uniques), dtype=np.int64)
+    renumber[used] = np.arange(len(used))
+    codes[valid] = renumber[codes[valid]]
+    return CodedColumn(codes.astype(np.int32), StringColumn.from_values(np.asarray(uniques, dtype=object)[used]))
+
+
+def merge_children(stores, parts, source):
+    """按整体的行位置合并各分区的子评论表：各组整段搬到合并后父评论的位置，不重新排序。
+
+    分区的行位置按原始行顺序排列，组内按（时间, 行位置）的顺序合并后不变。
+    """
+    counts = np.concatenate([part.children.counts() for part in stores])[source]
+    offsets = np.zeros(len(source) + 1, dtype=np.int32)
+    np.cumsum(counts, out=offsets[1:])
+    index = np.empty(int(offsets[-1]), dtype=np.int32)
+    for part, part_rows in zip(stores, parts):
+        local = part.children
+        entry_parent = np.repeat(np.arange(len(part), dtype=np.int64), np.diff(local.offsets))
+        rank = np.arange(len(local.index)) - local.offsets[entry_parent]
+        index[offsets[part_rows[entry_parent]] + rank] = part_rows[local.index]
+    return Children(offsets, index)
+
+
+def merge_stores(stores, parts, tz_name=DISPLAY_TIMEZONE):
+    """按原始行位置合并各分区链接并评级后的评论存储（parts 为各分区的行位置），返回合并后的存储。
+
+    父子关系与评级沿用各分区的结果，只有父评论在别的分区中的回复合并后才挂上，
+    这些回复与Up主的评论记入 unrated，由 update_ratings 重新评级。
+    """
+    rows = np.concatenate(parts)
+    source = np.empty(len(rows), dtype=np.int64)
+    source[rows] = np.arange(len(rows))
+
+    store = CommentStore(tz_name)
+    store.size = len(rows)
+    for field in TEXT_FIELDS:
+        store.columns[field] = merge_column([part.columns[field] for part in stores], source)
+    store.create_time = np.concatenate([part.create_time for part in stores])[source]
+    # 各分区的行位置换成整体的行位置，ID查找表与一次性构建时一样按 (哈希, 行位置) 排序
+    hashes = np.concatenate([part.ids.hashes for part in stores])
+    order = np.concatenate([part_rows[part.ids.order] for part, part_rows in zip(stores, parts)]).astype(np.int32)
+    sort = np.lexsort((order, hashes))
+    store.ids = IdIndex(hashes[sort], order[sort])
+    store.parent_pos = np.concatenate([
+        np.where(part.parent_pos >= 0, part_rows[np.maximum(part.parent_pos, 0)], -1)
+        for part, part_rows in zip(stores, parts)
+    ])[source].astype(np.int32)
+    store.children = merge_children(stores, parts, source)
+    return store
+
+
+def adopt_across(store):
+    """为父评论在别的分区中的回复查找父评论，返回挂上父评论的行。
+
+    只查找分区内没有找到父评论、父评论ID不为空的行。
+    """
+    parents = store.columns["parent_comment_id"]
+    orphans = np.flatnonzero((store.parent_pos < 0) & (parents.codes >= 0))
+    # 按父评论ID的不同值查找
+    codes, inverse = np.unique(parents.codes[orphans], return_inverse=True)
+    found = store.ids.lookup(parents.categories.take(codes), store.columns["comment_id"])[inverse]
+    adopted = orphans[found >= 0]
+    if len(adopted):
+        store.parent_pos[adopted] = found[found >= 0]
+        store.children = store.children.regroup(store.parent_pos, store.create_time, adopted)
+    return adopted
+
+
+def build_store_parallel(df, tz_name=DISPLAY_TIMEZONE, low=10, high=100, per_video_host=False, workers=None):
+    """与 build_store 相同，但按 video_id 分区在 workers 个进程中并行构建，返回值也相同。"""
+    workers = workers or default_workers()
+    with stage("清洗", rows=len(df)):
+        df, ids = clean_comments(df)
+        df = df.assign(comment_id=ids)
+        video_ids, missing = clean_video_ids(df)
+        missing_video_id = ids.to_numpy()[missing].tolist()
+        parts = partition_rows(video_ids.to_numpy(), workers * PARTS_PER_WORKER)
+    if len(parts) < 2:
+        # 只有一个视频时无法分区，直接在本进程中处理（不再重复清洗）
+        with stage("构建评论表", rows=len(df)):
+            table, _ = make_table(df, ids, tz_name)
+        store = CommentStore.from_table(table, tz_name)
+        del table
+        store.per_video_host = per_video_host
+        store.rate(low, high)
+        return store, missing_video_id
+
+    with stage("分区处理", rows=len(df)) as info:
+        info["parts"] = len(parts)
+        info["workers"] = workers
+        # 子进程中不记录阶段（计时器只在主进程中）
+        with ProcessPoolExecutor(workers, mp_context=pool_context(), initializer=activate, initargs=(None,)) as pool:
+            futures = [
+                pool.submit(build_partition, df.iloc[rows], tz_name, low, high, per_video_host) for rows in parts
+            ]
+            del df
+            stores = [future.result() for future in futures]
+
+    with stage("合并分区", rows=sum(len(rows) for rows in parts)) as info:
+        store = merge_stores(stores, parts, tz_name)
+        del stores
+        store.per_video_host = per_video_host
+        # 以分区的评级为准：先按分区内的父子关系确定Up主，挂上跨分区的回复后增量评级
+        # （Up主因此改变时 update_ratings 全部重新评级）
+        store.mark_rated(low, high)
+        if not per_video_host:
+            # 分区内按没有Up主评级，Up主的评论要重新评级
+            store.unrated.append(np.flatnonzero(store.is_up(np.arange(len(store)))))
+        adopted = adopt_across(store)
+        store.unrated.append(adopted)
+        info["cross_partition"] = len(adopted)
+        _, rerated_all = store.update_ratings(low, high)
+        info["rerated_all"] = rerated_all
+    return store, missing_video_id
@@ -0,0 +1,207 @@
+"""轻量的阶段计时：记录每个处理阶段的耗时、行数、吞吐量与内存，可导出Chrome追踪格式。
+
+各模块通过模块级的 stage() 标记阶段；没有激活的 Profiler 时它什么也不记录，
+因此命令行、基准测试等不需要计时的场合几乎没有额外开销。
+"""
+import collections
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 会话中最多保留的事件数，超出时丢弃最早的事件
+MAX_EVENTS = 100000
+
+
+def current_rss():
+    """进程当前的常驻内存（字节），无法获取时返回None。"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss():
+    """进程启动以来的最大常驻内存（字节），无法获取时返回None。"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 以字节为单位，Linux 以KB为单位
+        return peak if sys.platform == "darwin" else peak * 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss)
+    return None
+
+
+class Profiler:
+    """记录一个会话中所有阶段的事件，可在任意线程中使用。
+
+    每个事件属于一次运行（一次加载、刷新或导出），界面显示最近一次运行的汇总。
+    trace_memory 为真时用tracemalloc记录每个阶段的Python分配峰值（会明显变慢；
+    多个线程同时运行的阶段共用同一个峰值）。
+    """
+
+    def __init__(self, max_events=MAX_EVENTS):
+        self.events = collections.deque(maxlen=max_events)
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.run_id = 0
+        self.run_labels = {}
+        self.trace_memory = False
+        self.local = threading.local()  # 各线程绑定的运行（后台任务并行时各自记入自己的运行）
+
+    def begin_run(self, label):
+        with self.lock:
+            self.run_id += 1
+            self.run_labels[self.run_id] = label
+            return self.run_id
+
+    def current_run(self):
+        # 当前线程绑定的运行，未绑定时为最近开始的运行
+        return getattr(self.local, "run_id", None) or self.run_id
+
+    @contextlib.contextmanager
+    def bind_run(self, run_id):
+        """在当前线程中把阶段记入 run_id。"""
+        previous = getattr(self.local, "run_id", None)
+        self.local.run_id = run_id
+        try:
+            yield
+        finally:
+            self.local.run_id = previous
+
+    def set_trace_memory(self, enabled):
+        self.trace_memory = enabled
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None, category="stage"):
+        """计时一个阶段；产出的字典可在阶段内补充 rows 及其它要记录的值。"""
+        info = {"rows": rows}
+        run_id = self.current_run()
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            self.record(name, start, time.perf_counter(), category, run_id, **info)
+
+    def record(self, name, start, end, category="stage", run_id=None, rows=None, **args):
+        # start/end 为 time.perf_counter() 的值
+        event = {
+            "name": name,
+            "category": category,
+            "run": self.current_run() if run_id is None else run_id,
+            "thread": threading.current_thread().name,
+            "tid": threading.get_ident(),
+            "start": start - self.origin,
+            "wall_s": end - start,
+            "rows": rows,
+            "rss": current_rss(),
+            "peak_rss": peak_rss(),
+            "traced_peak": None,
+            "args": args,
+        }
+        if self.trace_memory and tracemalloc.is_tracing():
+            event["traced_peak"] = tracemalloc.get_traced_memory()[1]
+        with self.lock:
+            self.events.append(event)
+        return event
+
+    def run_events(self, run_id=None):
+        run_id = self.run_id if run_id is None else run_id
+        with self.lock:
+            return [event for event in self.events if event["run"] == run_id]
+
+    def run_wall(self, run_id=None):
+        # 一次运行从第一个阶段开始到最后一个阶段结束的时间
+        events = self.run_events(run_id)
+        if not events:
+            return 0.0
+        return max(e["start"] + e["wall_s"] for e in events) - min(e["start"] for e in events)
+
+    def summary(self, run_id=None):
+        """按阶段名汇总一次运行：同名事件（例如分多次的界面插入）合并为一行，按首次出现排序。"""
+        stages = {}
+        for event in self.run_events(run_id):
+            stage = stages.get(event["name"])
+            if stage is None:
+                stage = stages[event["name"]] = {
+                    "name": event["name"], "thread": event["thread"], "wall_s": 0.0, "rows": None,
+                    "rss": None, "peak_rss": None, "traced_peak": None, "args": {},
+                }
+            stage["wall_s"] += event["wall_s"]
+            if event["rows"] is not None:
+                stage["rows"] = (stage["rows"] or 0) + event["rows"]
+            for key in ("rss", "peak_rss", "traced_peak"):
+                if event[key] is not None:
+                    stage[key] = max(stage[key] or 0, event[key])
+            stage["args"].update(event["args"])
+        for stage in stages.values():
+            stage["rows_per_s"] = stage["rows"] / stage["wall_s"] if stage["rows"] and stage["wall_s"] else None
+        return list(stages.values())
+
+    def chrome_trace(self):
+        """整个会话的事件，Chrome追踪格式（chrome://tracing 或 Perfetto 可直接打开）。"""
+        pid = os.getpid()
+        with self.lock:
+            events = list(self.events)
+        trace = []
+        for tid, name in {event["tid"]: event["thread"] for event in events}.items():
+            trace.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+        for event in events:
+            args = {"run": event["run"], "label": self.run_labels.get(event["run"], ""), **event["args"]}
+            for key in ("rows", "rss", "peak_rss", "traced_peak"):
+                if event[key] is not None:
+                    args[key] = event[key]
+            trace.append({
+                "name": event["name"],
+                "cat": event["category"],
+                "ph": "X",
+                "pid": pid,
+                "tid": event["tid"],
+                "ts": event["start"] * 1e6,
+                "dur": event["wall_s"] * 1e6,
+                "args": args,
+            })
+        return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+    def dump(self, file_path):
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False)
+
+
+# 当前激活的 Profiler，由 activate() 设置
+_active = None
+
+
+def activate(profiler):
+    global _active
+    _active = profiler
+
+
+def stage(name, rows=None, category="stage"):
+    """标记一个阶段；没有激活的 Profiler 时不做任何记录。"""
+    if _active is None:
+        return contextlib.nullcontext({})
+    return _active.stage(name, rows, category)
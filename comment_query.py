@@ -0,0 +1,161 @@
+"""评论的组合查询：评级、时间范围、user_id、video_id、直接回复数与文本条件可任意组合。
+
+命中的评论连同它们的各级父评论一起显示，保留评论串的上下文；父评论沿 parent_pos
+向上标记，每行至多标记一次，代价与评论数成线性。新查询只是收窄上一次查询时
+（例如实时搜索中继续输入），只在上一次的命中中继续筛选。
+"""
+import numpy as np
+import pandas as pd
+
+from comment_search import matches
+
+
+def at_least(new, old):
+    # 下限条件：新的下限不低于旧的下限（旧的为None表示没有下限）
+    return old is None or (new is not None and new >= old)
+
+
+def at_most(new, old):
+    return old is None or (new is not None and new <= old)
+
+
+def parse_time(text, tz_name, end=False):
+    """把 "YYYY-MM-DD[ HH:MM[:SS]]" 按显示时区换成秒级时间戳，空文本返回None。
+
+    带时区的时间（如 "2024-01-01T08:00+09:00"）按其自身的时区换算，不再按显示时区解释。
+    end 为真且只给出日期时取次日零点，使结束日期当天的评论也包含在内。
+    """
+    text = text.strip()
+    if not text:
+        return None
+    timestamp = pd.Timestamp(text)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize(tz_name)
+    if end and len(text) <= 10:
+        timestamp += pd.Timedelta(days=1)
+    return int(timestamp.timestamp())
+
+
+def parse_int(text):
+    text = text.strip()
+    return int(text) if text else None
+
+
+class Query:
+    """一次查询的条件，各条件之间为“与”关系；为None（文本为空）的条件不参与筛选。
+
+    text 在昵称或内容中出现（忽略大小写）；ratings 为允许的评级集合；
+    start/end 为create_time（秒）的范围，含start不含end；min_replies/max_replies
+    为直接回复数的范围（含两端）。
+    """
+
+    def __init__(self, text="", ratings=None, start=None, end=None, user_id=None, video_id=None,
+                 min_replies=None, max_replies=None):
+        self.text = text.lower()
+        self.ratings = frozenset(ratings) if ratings is not None else None
+        self.start = start
+        self.end = end
+        self.user_id = user_id
+        self.video_id = video_id
+        self.min_replies = min_replies
+        self.max_replies = max_replies
+
+    def is_empty(self):
+        return not self.text and all(value is None for value in (
+            self.ratings, self.start, self.end, self.user_id, self.video_id, self.min_replies, self.max_replies
+        ))
+
+    def narrows(self, other):
+        """本查询的命中是否一定包含在 other 的命中之内（每个条件都相同或更严）。"""
+        return (
+            other.text in self.text
+            and (other.ratings is None or (self.ratings is not None and self.ratings <= other.ratings))
+            and at_least(self.start, other.start) and at_most(self.end, other.end)
+            and (other.user_id is None or self.user_id == other.user_id)
+            and (other.video_id is None or self.video_id == other.video_id)
+            and at_least(self.min_replies, other.min_replies) and at_most(self.max_replies, other.max_replies)
+        )
+
+
+def with_ancestors(parent_pos, rows):
+    """rows 连同其各级父评论的掩码。
+
+    从命中行出发逐层向上，每层只保留尚未标记的父评论（同一父评论只保留一次），
+    因此每行至多进入一次待处理集合。
+    """
+    mask = np.zeros(len(parent_pos), dtype=bool)
+    mask[rows] = True
+    slot = np.empty(len(parent_pos), dtype=np.int64)
+    frontier = np.asarray(rows)
+    while len(frontier):
+        parents = parent_pos[frontier]
+        parents = parents[parents >= 0]
+        parents = parents[~mask[parents]]
+        # 去重：每个父评论只保留写入槽位成功的那一次出现
+        order = np.arange(len(parents))
+        slot[parents] = order
+        frontier = parents[slot[parents] == order]
+        mask[frontier] = True
+    return mask
+
+
+class QueryEngine:
+    """在评论存储上执行查询，记住上一次的查询与命中用于收窄的查询。
+
+    search_index 为 None 时文本条件退回逐条扫描；存储内容变化后应换用新的实例。
+    """
+
+    def __init__(self, store, search_index=None):
+        self.store = store
+        self.search_index = search_index
+        self.last = None  # (上一次的查询, 其命中的行位置)
+
+    def match(self, query):
+        """直接命中查询的行位置（升序）。"""
+        rows = None
+        if self.last is not None and query.narrows(self.last[0]):
+            rows = self.last[1]
+        rows = self.filter(query, rows)
+        self.last = (query, rows)
+        return rows
+
+    def run(self, query):
+        """返回 (直接命中的行位置, 命中行及其各级父评论的掩码)。"""
+        rows = self.match(query)
+        return rows, with_ancestors(self.store.parent_pos, rows)
+
+    def filter(self, query, rows=None):
+        # 先按代价低的数值与编号条件缩小候选行，文本条件放在最后
+        store = self.store
+        rows = np.arange(len(store)) if rows is None else rows
+        if query.ratings is not None:
+            rows = rows[store.columns["rating"].isin(query.ratings, rows)]
+        if query.user_id is not None:
+            rows = rows[store.columns["user_id"].isin([query.user_id], rows)]
+        if query.video_id is not None:
+            rows = rows[store.columns["video_id"].isin([query.video_id], rows)]
+        if query.start is not None:
+            rows = rows[store.create_time[rows] >= query.start]
+        if query.end is not None:
+            rows = rows[store.create_time[rows] < query.end]
+        if query.min_replies is not None or query.max_replies is not None:
+            counts = store.children.counts()[rows]
+            if query.min_replies is not None:
+                rows = rows[counts >= query.min_replies]
+                counts = counts[counts >= query.min_replies]
+            if query.max_replies is not None:
+                rows = rows[counts <= query.max_replies]
+        if query.text:
+            rows = self.match_text(query.text, rows)
+        return rows
+
+    def match_text(self, text, rows):
+        # 先用搜索索引的候选行缩小范围，只校验同时满足其它条件的行
+        store = self.store
+        index = self.search_index
+        # 索引与存储行数不一致（刷新后尚未重建）时逐条检查
+        if index is None or index.size != len(store):
+            return rows[matches(store.columns["nickname"], store.columns["content"], rows, text)]
+        is_candidate = np.zeros(len(store), dtype=bool)
+        is_candidate[index.candidates(text)] = True
+        return index.verify(text, rows[is_candidate[rows]])
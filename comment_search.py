@@ -0,0 +1,131 @@
+import numpy as np
+
+from comment_store import CodedColumn
+
+# 字段分隔符（Unicode非字符），索引中不会出现以它开头的二元组
+SEPARATOR = "\ufdd0"
+BMP_MAX = 0xFFFF
+
+
+def build_postings(keys, rows):
+    """由 (键, 行位置) 对构建倒排表，返回 (有序键数组, 偏移数组, 行位置数组)。"""
+    pairs = (keys << 32) | rows
+    pairs.sort()
+    if len(pairs):
+        pairs = pairs[np.concatenate(([True], pairs[1:] != pairs[:-1]))]
+    pair_keys = pairs >> 32
+    starts = np.flatnonzero(np.concatenate(([True], pair_keys[1:] != pair_keys[:-1])))
+    starts = starts[starts < len(pairs)]
+    return pair_keys[starts], np.append(starts, len(pairs)), (pairs & 0xFFFFFFFF).astype(np.int32)
+
+
+def text_of(value):
+    # 缺失值按空文本处理
+    return value if isinstance(value, str) else ""
+
+
+def contains(values, rows, query):
+    """values 中 rows 各行是否包含 query（query 已小写，比较时忽略大小写）。
+
+    values 为存储中的列或列表；编号列对每个用到的不同值只比较一次。
+    """
+    if isinstance(values, CodedColumn):
+        codes = values.codes[rows]
+        used = np.unique(codes[codes >= 0])
+        # 末尾多留一个位置给缺失值（编号-1）
+        hit = np.zeros(len(values.categories) + 1, dtype=bool)
+        hit[used] = [query in text.lower() for text in values.categories.take(used)]
+        return hit[codes]
+    texts = values.take(rows) if hasattr(values, "take") else [values[i] for i in rows]
+    return np.fromiter((query in text_of(text).lower() for text in texts), dtype=bool, count=len(rows))
+
+
+def matches(nicknames, contents, rows, query):
+    # 昵称或内容包含 query 的行，已由昵称命中的行不再检查内容
+    hit = contains(nicknames, rows, query)
+    hit[~hit] = contains(contents, rows[~hit], query)
+    return hit
+
+
+def posting(postings, key):
+    keys, offsets, rows = postings
+    i = np.searchsorted(keys, key)
+    if i == len(keys) or keys[i] != key:
+        return rows[:0]
+    return rows[offsets[i]:offsets[i + 1]]
+
+
+def prefix_posting(postings, code):
+    # 以某个字符开头的所有二元组的倒排表之并（这些键在有序键数组中连续）
+    keys, offsets, rows = postings
+    start, end = np.searchsorted(keys, [code << 16, (code + 1) << 16])
+    return np.unique(rows[offsets[start]:offsets[end]])
+
+
+class SearchIndex:
+    """昵称与内容的字符二元组（bigram）倒排索引，适合不分词的中文文本。
+
+    每条评论被小写后拼接为 "昵称<分隔符>内容<分隔符>"，所有不以分隔符开头的相邻字符对
+    都记录一条 (二元组, 行位置)。查询时取各二元组的倒排表求交集，查询长于两个字符时
+    再用子串匹配校验候选行；单字查询取以该字开头的所有二元组（每个字符后面总跟着
+    字符或分隔符，因此不必另建单字倒排表）。结果为按行位置升序
+    排列的数组。nicknames/contents 可以是列表或存储中的列，只保留引用用于校验，
+    不另存一份文本。
+    """
+
+    def __init__(self, nicknames, contents):
+        self.nicknames = nicknames
+        self.contents = contents
+        self.size = len(nicknames)
+
+        texts = [
+            f"{text_of(nickname)}{SEPARATOR}{text_of(content)}{SEPARATOR}".lower()
+            for nickname, content in zip(np.asarray(nicknames, dtype=object), np.asarray(contents, dtype=object))
+        ]
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=self.size)
+        codes = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32)
+        # BMP以外的字符统一映射为0xFFFF，查询时需要校验
+        codes = np.minimum(codes, BMP_MAX)
+        rows = np.repeat(np.arange(self.size, dtype=np.uint32), lengths)
+
+        # 只在取出有效的二元组之后才换成64位，减少构建时的临时内存
+        valid = codes[:-1] != ord(SEPARATOR)
+        keys = (codes[:-1][valid].astype(np.uint64) << 16) | codes[1:][valid]
+        self.bigrams = build_postings(keys, rows[:-1][valid].astype(np.uint64))
+
+    def search(self, query):
+        query = query.lower()
+        if not query:
+            return np.arange(self.size)
+        return self.verify(query, self.candidates(query))
+
+    def candidates(self, query):
+        """二元组倒排表给出的候选行（已小写的非空查询），可能包含需要校验排除的行。"""
+        codes = [min(ord(ch), BMP_MAX) for ch in query]
+
+        if len(codes) == 1:
+            candidates = prefix_posting(self.bigrams, codes[0])
+        else:
+            keys = {(a << 16) | b for a, b in zip(codes, codes[1:])}
+            postings = sorted((posting(self.bigrams, key) for key in keys), key=len)
+            candidates = postings[0]
+            for other in postings[1:]:
+                if not len(candidates):
+                    break
+                candidates = np.intersect1d(candidates, other, assume_unique=True)
+        return candidates.astype(np.int64)
+
+    def verify(self, query, candidates):
+        # 二元组命中只保证两个字符相邻出现，更长的查询或BMP以外的字符需要校验
+        if len(query) > 2 or max(map(ord, query)) > BMP_MAX:
+            return candidates[matches(self.nicknames, self.contents, candidates, query)]
+        return candidates
+
+
+def scan_search(nicknames, contents, query):
+    # 逐条线性扫描的原始搜索方式，用于对照与基准测试
+    query = query.lower()
+    return np.array([
+        i for i, (nickname, content) in enumerate(zip(np.asarray(nicknames, dtype=object), np.asarray(contents, dtype=object)))
+        if query in text_of(nickname).lower() or query in text_of(content).lower()
+    ], dtype=np.int64)
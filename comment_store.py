@@ -0,0 +1,999 @@
+"""评论的紧凑存储：各字段按列保存，界面与导出按行位置读取，不再为每条评论保存字典。
+
+文本列保存为一整段UTF-8字节加偏移数组（StringColumn），重复值多的列（用户、昵称、
+视频、评级等）保存为编号加不同值（CodedColumn），读取时已解析为整数的列保存为
+整数数组（IntColumn），读取时略去的列在导出时才读取（DeferredColumn）；父子关系为每行父评论的行位置
+parent_pos（-1表示顶级评论）与CSR形式的子评论表（Children）。time_str 不保存，
+需要时按显示时区现场格式化。
+"""
+import copy
+import functools
+import threading
+
+import numpy as np
+import pandas as pd
+
+from comment_core import (
+    DISPLAY_TIMEZONE, COMMENT_FIELDS, DEFERRED_COLUMNS, build_comment_table, check_columns,
+    clean_create_time, make_table, read_column, rename_duplicate_ids, reply_counts, select_ratings,
+    format_timestamp, format_timestamps
+)
+from comment_profile import stage
+
+# 不同值的数量不超过行数的这个比例时按编号保存
+DICTIONARY_RATIO = 0.5
+# 总是逐条保存的列与总是按编号保存的列，其余列按重复程度选择
+STRING_FIELDS = ("comment_id", "content")
+CODED_FIELDS = ("parent_comment_id", "nickname", "user_id", "video_id", "rating")
+# 按列对象保存的字段（create_time 为整数数组，time_str 现场生成）
+TEXT_FIELDS = [field for field in COMMENT_FIELDS if field not in ("create_time", "time_str")]
+# 追加用数组第一次分配的最小容量
+MIN_CAPACITY = 1024
+
+
+class Growable:
+    """只在末尾追加的数组缓冲：容量不足时按倍数扩大，追加不复制已有元素（均摊每个元素O(1)）。
+
+    列与数组保存的是缓冲前若干个元素的视图，快照与追加后的新列可以共享同一个缓冲：
+    已写入的元素从不改写，追加只写在已用长度之后，持有较短视图的快照不受影响。
+    """
+
+    def __init__(self, array, used):
+        self.array = array
+        self.used = used
+
+
+def extend_array(array, growable, values):
+    """返回 (array 后接 values 的数组, 其所在的 Growable)。
+
+    array 正是 growable 中已用的全部元素时在其后的容量中原地写入，否则（没有缓冲，
+    或缓冲已被别的列追加过）先把 array 复制到新的缓冲。
+    """
+    values = np.asarray(values)
+    dtype = np.result_type(array.dtype, values.dtype)
+    length = len(array)
+    end = length + len(values)
+    if growable is None or growable.used != length or growable.array.dtype != dtype:
+        growable = Growable(np.empty(max(end, 2 * length, MIN_CAPACITY), dtype=dtype), length)
+        growable.array[:length] = array
+    elif end > len(growable.array):
+        grown = np.empty(max(end, 2 * len(growable.array)), dtype=dtype)
+        grown[:length] = growable.array[:length]
+        growable.array = grown
+    growable.array[length:end] = values
+    growable.used = end
+    return growable.array[:end], growable
+
+
+def extend_bytes(data, end, more):
+    """data[:end] 后接 more。data 是恰好到 end 为止的bytearray时原地追加（bytearray 自行按比例
+    预留容量），否则（不可变的bytes，或已被别的列追加过）先复制一次。"""
+    if not (isinstance(data, bytearray) and len(data) == end):
+        data = bytearray(data[:end])
+    data += more
+    return data
+
+
+class StringColumn:
+    """一列字符串：所有值的UTF-8编码连成一段字节，第 i 个值为 data[offsets[i]:offsets[i + 1]]。"""
+
+    def __init__(self, data, offsets, null=None):
+        # 追加得到的列的 data 为与后来追加的列共享的bytearray，可能长于本列（本列到 offsets[-1] 为止）
+        self.data = data
+        self.offsets = offsets
+        self.null = null  # 缺失值掩码，没有缺失值时为None
+        self.growth = (None, None)  # offsets 与 null 的追加缓冲（见 append）
+
+    @classmethod
+    def from_values(cls, values):
+        values = list(values)
+        encoded = [v.encode("utf-8", "surrogatepass") if isinstance(v, str) else b"" for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+        null = np.fromiter((not isinstance(v, str) for v in values), dtype=bool, count=len(values))
+        return cls(b"".join(encoded), offsets, null if null.any() else None)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if self.null is not None and self.null[i]:
+            return np.nan
+        return self.data[self.offsets[i]:self.offsets[i + 1]].decode("utf-8", "surrogatepass")
+
+    def take(self, positions):
+        positions = np.asarray(positions, dtype=np.int64)
+        data = self.data
+        values = np.empty(len(positions), dtype=object)
+        values[:] = [
+            data[start:end].decode("utf-8", "surrogatepass")
+            for start, end in zip(self.offsets[positions].tolist(), self.offsets[positions + 1].tolist())
+        ]
+        if self.null is not None:
+            values[self.null[positions]] = np.nan
+        return values
+
+    def __array__(self, dtype=None, copy=None):
+        return self.take(np.arange(len(self)))
+
+    def append(self, values):
+        """追加若干值，返回新的列（本列不变）；字节与数组都追加在预留的容量中，已有的值不复制。"""
+        other = StringColumn.from_values(values)
+        end = int(self.offsets[-1])
+        offsets_growth, null_growth = self.growth
+        offsets, offsets_growth = extend_array(self.offsets, offsets_growth, other.offsets[1:] + end)
+        null = None
+        if self.null is not None or other.null is not None:
+            if self.null is None:
+                null_growth = None
+            null, null_growth = extend_array(self.null_mask(), null_growth, other.null_mask())
+        column = StringColumn(extend_bytes(self.data, end, other.data), offsets, null)
+        column.growth = (offsets_growth, null_growth)
+        return column
+
+    def set(self, positions, values):
+        # 替换若干行的值：未变化的部分按段拼接，不逐条解码
+        positions = np.asarray(positions, dtype=np.int64)
+        if not len(positions):
+            return self
+        order = np.argsort(positions, kind="stable")
+        positions = positions[order]
+        other = StringColumn.from_values(np.asarray(values, dtype=object)[order])
+        pieces = []
+        previous = 0
+        for i, pos in enumerate(positions.tolist()):
+            pieces.append(self.data[self.offsets[previous]:self.offsets[pos]])
+            pieces.append(other.data[other.offsets[i]:other.offsets[i + 1]])
+            previous = pos + 1
+        pieces.append(self.data[self.offsets[previous]:self.offsets[-1]])
+        lengths = np.diff(self.offsets)
+        lengths[positions] = np.diff(other.offsets)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        null = self.null_mask().copy()
+        null[positions] = other.null_mask()
+        return StringColumn(b"".join(pieces), offsets, null if null.any() else None)
+
+    def null_mask(self):
+        return self.null if self.null is not None else np.zeros(len(self), dtype=bool)
+
+    def equals(self, value):
+        return self.take(np.arange(len(self))) == value
+
+    @property
+    def nbytes(self):
+        return int(self.offsets[-1]) + self.offsets.nbytes + (self.null.nbytes if self.null is not None else 0)
+
+
+class CodedColumn:
+    """一列重复值较多的字符串：每行保存不同值的编号（-1表示缺失值），不同的值保存为 StringColumn。
+
+    不同值也不保存为Python字符串对象：大量零散存活的小对象会使读取时释放的内存
+    无法归还系统。
+    """
+
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = categories
+        self.growth = None  # codes 的追加缓冲（见 append）
+        self.lookup = None  # 不同值到编号的字典，编码时才建立，与之后追加、更新得到的列共享
+
+    @classmethod
+    def from_values(cls, values):
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+        return cls(codes.astype(np.int32), StringColumn.from_values(uniques))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        code = self.codes[i]
+        return np.nan if code < 0 else self.categories[code]
+
+    def take(self, positions):
+        codes = self.codes[positions]
+        if len(codes) > len(self.categories):
+            # 行数多于不同值时先解码全部不同值，再按编号取（末尾的缺失值对应编号-1）
+            return np.append(np.asarray(self.categories), np.nan)[codes]
+        values = self.categories.take(np.maximum(codes, 0))
+        values[codes < 0] = np.nan
+        return values
+
+    def __array__(self, dtype=None, copy=None):
+        return self.take(np.arange(len(self)))
+
+    def value_codes(self):
+        # 不同值到编号的字典；别的列在共享的字典中加入了本列没有的值时重新建立
+        if self.lookup is None or len(self.lookup) != len(self.categories):
+            self.lookup = dict(zip(np.asarray(self.categories).tolist(), range(len(self.categories))))
+        return self.lookup
+
+    def encode(self, values):
+        """把值换成编号，新出现的值追加到不同值的末尾，返回 (编号, 新的不同值, 值到编号的字典)。
+
+        只查找本块中的不同值，不为全部已有的不同值建立索引。
+        """
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+        uniques = np.asarray(uniques, dtype=object)
+        lookup = self.value_codes()
+        known = np.fromiter((lookup.get(value, -1) for value in uniques.tolist()), dtype=np.int64, count=len(uniques))
+        categories = self.categories
+        unknown = known < 0
+        if unknown.any():
+            known[unknown] = np.arange(len(categories), len(categories) + unknown.sum())
+            categories = categories.append(uniques[unknown])
+            lookup.update(zip(uniques[unknown].tolist(), known[unknown].tolist()))
+        # 缺失值的编号为-1，对应末尾多留的一个位置
+        return np.append(known, -1)[codes].astype(np.int32), categories, lookup
+
+    def append(self, values):
+        codes, categories, lookup = self.encode(values)
+        new_codes, growth = extend_array(self.codes, self.growth, codes)
+        column = CodedColumn(new_codes, categories)
+        column.growth, column.lookup = growth, lookup
+        return column
+
+    def set(self, positions, values):
+        codes, categories, lookup = self.encode(values)
+        new_codes = self.codes.copy()
+        new_codes[positions] = codes
+        column = CodedColumn(new_codes, categories)
+        column.lookup = lookup
+        return column
+
+    def equals(self, value):
+        # 与某个值相等的行；缺失值与任何值都不相等
+        if not isinstance(value, str):
+            return np.zeros(len(self.codes), dtype=bool)
+        matches = np.flatnonzero(np.asarray(self.categories) == value)
+        if not len(matches):
+            return np.zeros(len(self.codes), dtype=bool)
+        return self.codes == matches[0]
+
+    def isin(self, values, positions=None):
+        # positions（默认全部行）中值属于 values 的行；缺失值不属于任何集合
+        wanted = np.flatnonzero(np.isin(np.asarray(self.categories), [value for value in values if isinstance(value, str)]))
+        codes = self.codes if positions is None else self.codes[positions]
+        return np.isin(codes, wanted)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.categories.nbytes
+
+
+class IntColumn:
+    """一列整数（时间戳、回复数等）：保存为整数数组，缺失值另存掩码。
+
+    取值时给出十进制文本，与按文本读取时的值相同，导出与比较都不受保存方式影响。
+    """
+
+    def __init__(self, values, null=None):
+        self.values = values
+        self.null = null  # 缺失值掩码，没有缺失值时为None
+        self.growth = (None, None)  # values 与 null 的追加缓冲（见 append）
+
+    @classmethod
+    def from_values(cls, values):
+        """由整数或整数的文本构建；有不能原样还原的值（小数、前导零等）时返回None。"""
+        series = pd.Series(values)
+        if not pd.api.types.is_integer_dtype(series.dtype):
+            text = series.astype(object)
+            series = pd.to_numeric(text, errors="coerce", dtype_backend="numpy_nullable")
+            if len(series) and not pd.api.types.is_integer_dtype(series.dtype):
+                return None
+            valid = text.notna().to_numpy()
+            if (series.notna().to_numpy() != valid).any():
+                return None
+            canonical = series.to_numpy(dtype=np.int64, na_value=0)[valid].astype(str)
+            if (canonical != text.to_numpy()[valid].astype(str)).any():
+                return None
+        null = series.isna().to_numpy()
+        ints = series.to_numpy(dtype=np.int64, na_value=0)
+        # 取值范围允许时保存为32位整数
+        if len(ints) and np.iinfo(np.int32).min <= ints.min() and ints.max() <= np.iinfo(np.int32).max:
+            ints = ints.astype(np.int32)
+        return cls(ints, null if null.any() else None)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        if self.null is not None and self.null[i]:
+            return np.nan
+        return str(int(self.values[i]))
+
+    def take(self, positions):
+        result = self.values[positions].astype(str).astype(object)
+        if self.null is not None:
+            result[self.null[positions]] = np.nan
+        return result
+
+    def __array__(self, dtype=None, copy=None):
+        return self.take(np.arange(len(self)))
+
+    def append(self, values):
+        other = IntColumn.from_values(values)
+        if other is None:
+            # 新的值不是整数，整列改为按文本保存
+            return StringColumn.from_values(self.take(np.arange(len(self)))).append(values)
+        values_growth, null_growth = self.growth
+        new_values, values_growth = extend_array(self.values, values_growth, other.values)
+        null = None
+        if self.null is not None or other.null is not None:
+            if self.null is None:
+                null_growth = None
+            null, null_growth = extend_array(self.null_mask(), null_growth, other.null_mask())
+        column = IntColumn(new_values, null)
+        column.growth = (values_growth, null_growth)
+        return column
+
+    def set(self, positions, values):
+        other = IntColumn.from_values(values)
+        if other is None:
+            return StringColumn.from_values(self.take(np.arange(len(self)))).set(positions, values)
+        new_values = self.values.astype(np.result_type(self.values, other.values))
+        new_values[positions] = other.values
+        null = self.null_mask().copy()
+        null[positions] = other.null_mask()
+        return IntColumn(new_values, null if null.any() else None)
+
+    def null_mask(self):
+        return self.null if self.null is not None else np.zeros(len(self), dtype=bool)
+
+    def equals(self, value):
+        return self.take(np.arange(len(self))) == value
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + (self.null.nbytes if self.null is not None else 0)
+
+
+class DeferredColumn:
+    """读取时略去的一列：第一次取值时才调用 load() 读出源文件中的 size 行（例如只有导出才用到的头像链接）。
+
+    刷新时追加的行（tail）与改过值的已有行（patch_rows 与 patch）另存，不必读出源文件中的值；
+    追加与修改返回新的列，与原来的列共用读出的源文件各行（base）。
+    """
+
+    def __init__(self, field, load, size):
+        self.field = field
+        self.load = load
+        self.size = size
+        self.column = None
+        self.lock = threading.Lock()
+        self.base = self
+        self.tail = None
+        self.patch_rows = np.empty(0, dtype=np.int64)  # 升序
+        self.patch = None
+
+    def resolve(self):
+        # 源文件中的各行（只读取一次），不含追加与改过的值
+        base = self.base
+        with base.lock:
+            if base.column is None:
+                with stage(f"读取{self.field}列", rows=self.size):
+                    base.column = compact_column(self.field, base.load())
+            return base.column
+
+    @property
+    def loaded(self):
+        return self.base.column is not None
+
+    @property
+    def edited(self):
+        return self.tail is not None or self.patch is not None
+
+    def with_edits(self, tail, patch_rows, patch):
+        column = copy.copy(self)
+        column.tail, column.patch_rows, column.patch = tail, patch_rows, patch
+        return column
+
+    def materialize(self):
+        # 读出源文件中的各行后合上另存的值，得到普通的列
+        column = self.resolve()
+        if self.patch is not None:
+            column = column.set(self.patch_rows, self.patch.take(np.arange(len(self.patch_rows))))
+        if self.tail is not None:
+            column = column.append(self.tail.take(np.arange(len(self.tail))))
+        return column
+
+    def __len__(self):
+        return self.size + (len(self.tail) if self.tail is not None else 0)
+
+    def __getitem__(self, i):
+        return self.take([i])[0]
+
+    def take(self, positions):
+        # 只取追加或改过的行时不读取源文件
+        positions = np.asarray(positions, dtype=np.int64)
+        values = np.empty(len(positions), dtype=object)
+        rest = positions < self.size
+        if not rest.all():
+            values[~rest] = self.tail.take(positions[~rest] - self.size)
+        if self.patch is not None:
+            at = np.minimum(np.searchsorted(self.patch_rows, positions), len(self.patch_rows) - 1)
+            patched = rest & (self.patch_rows[at] == positions)
+            values[patched] = self.patch.take(at[patched])
+            rest &= ~patched
+        if rest.any():
+            values[rest] = self.resolve().take(positions[rest])
+        return values
+
+    def __array__(self, dtype=None, copy=None):
+        return self.take(np.arange(len(self)))
+
+    def append(self, values):
+        tail = compact_column(self.field, values) if self.tail is None else self.tail.append(values)
+        return self.with_edits(tail, self.patch_rows, self.patch)
+
+    def set(self, positions, values):
+        positions = np.asarray(positions, dtype=np.int64)
+        values = np.asarray(values, dtype=object)
+        in_tail = positions >= self.size
+        tail = self.tail
+        if in_tail.any():
+            tail = tail.set(positions[in_tail] - self.size, values[in_tail])
+        patch_rows, patch = self.patch_rows, self.patch
+        if not in_tail.all():
+            # 与之前改过的行合并，同一行取最后的值
+            rows = np.concatenate((patch_rows, positions[~in_tail]))
+            before = patch.take(np.arange(len(patch_rows))) if patch is not None else np.empty(0, dtype=object)
+            merged = np.concatenate((before, values[~in_tail]))
+            patch_rows, last = np.unique(rows[::-1], return_index=True)
+            patch = compact_column(self.field, merged[::-1][last])
+        return self.with_edits(tail, patch_rows, patch)
+
+    def null_mask(self):
+        return pd.isna(self.take(np.arange(len(self))))
+
+    def equals(self, value):
+        return self.take(np.arange(len(self))) == value
+
+    @property
+    def nbytes(self):
+        size = self.base.column.nbytes if self.loaded else 0
+        for column in (self.tail, self.patch):
+            size += column.nbytes if column is not None else 0
+        return size + self.patch_rows.nbytes
+
+
+def integer_text(values):
+    # 可空整数换成文本的对象数组，缺失值为NaN
+    text = np.full(len(values), np.nan, dtype=object)
+    valid = ~np.asarray(pd.isna(values), dtype=bool)
+    text[valid] = np.asarray(values[valid], dtype=np.int64).astype(str)
+    return text
+
+
+def compact_column(field, values):
+    if pd.api.types.is_integer_dtype(getattr(values, "dtype", None)):
+        return IntColumn.from_values(values)
+    values = np.asarray(values, dtype=object)
+    if field in STRING_FIELDS:
+        return StringColumn.from_values(values)
+    if field in CODED_FIELDS:
+        return CodedColumn.from_values(values)
+    column = CodedColumn.from_values(values)
+    if len(column.categories) <= len(values) * DICTIONARY_RATIO:
+        return column
+    return StringColumn.from_values(values)
+
+
+class IdIndex:
+    """评论ID到行位置的查找表：按ID的64位哈希排序，命中后再比较原文以排除哈希冲突。"""
+
+    def __init__(self, hashes=None, order=None):
+        self.hashes = np.empty(0, dtype=np.uint64) if hashes is None else hashes
+        self.order = np.empty(0, dtype=np.int32) if order is None else order
+
+    @staticmethod
+    def hash(values):
+        values = pd.Series(values, dtype=object).fillna("").astype(str).to_numpy(dtype=object)
+        return pd.util.hash_array(values, categorize=False)
+
+    def add(self, values, start):
+        # 只排序新加入的哈希，再按位置并入已排好的表（哈希相同的仍按行位置先后）
+        hashes = self.hash(values)
+        sort = np.argsort(hashes, kind="stable")
+        hashes = hashes[sort]
+        order = (np.arange(start, start + len(values), dtype=np.int64)[sort]).astype(np.int32)
+        at = np.searchsorted(self.hashes, hashes, side="right")
+        self.hashes, self.order = np.insert(self.hashes, at, hashes), np.insert(self.order, at, order)
+
+    def lookup(self, values, ids):
+        """每个值所在的行位置，不存在时为-1；ids 为评论ID列。"""
+        values = np.asarray(values, dtype=object)
+        hashes = self.hash(values)
+        result = np.full(len(values), -1, dtype=np.int64)
+        i = np.searchsorted(self.hashes, hashes)
+        pending = np.arange(len(values))
+        # 哈希相同的行可能不止一个（冲突），依次向后比较直到哈希不同
+        while len(pending):
+            j = i[pending]
+            valid = j < len(self.hashes)
+            pending, j = pending[valid], j[valid]
+            same_hash = self.hashes[j] == hashes[pending]
+            pending, j = pending[same_hash], j[same_hash]
+            positions = self.order[j]
+            found = ids.take(positions) == values[pending]
+            result[pending[found]] = positions[found]
+            pending = pending[~found]
+            i[pending] += 1
+        return result
+
+    @property
+    def nbytes(self):
+        return self.hashes.nbytes + self.order.nbytes
+
+
+class Children:
+    """CSR形式的子评论表：第 p 行的子评论为 index[offsets[p]:offsets[p + 1]]。"""
+
+    def __init__(self, offsets, index):
+        self.offsets = offsets
+        self.index = index
+
+    @classmethod
+    def build(cls, parent_pos, order):
+        """按 order 中的先后顺序把回复分组到各自的父评论下（组内保持 order 的顺序）。"""
+        rows = order[parent_pos[order] >= 0]
+        rows = rows[np.argsort(parent_pos[rows], kind="stable")]
+        counts = np.bincount(parent_pos[rows], minlength=len(parent_pos))
+        offsets = np.zeros(len(parent_pos) + 1, dtype=np.int32)
+        np.cumsum(counts, out=offsets[1:])
+        return cls(offsets, rows.astype(np.int32))
+
+    def regroup(self, parent_pos, create_time, rows):
+        """rows 的父评论或时间有变化（含追加在末尾的新行）后的子评论表，返回新的子评论表。
+
+        只有涉及的父评论（rows 原来的和现在的父评论）的子评论按（时间, 行位置）重新排序，
+        其余各组整段保留，不必对全部回复重新排序。
+        """
+        size = len(parent_pos)
+        rows = np.unique(rows)
+        entry_parent = np.repeat(np.arange(len(self.offsets) - 1, dtype=np.int32), np.diff(self.offsets))
+        changed = np.zeros(size, dtype=bool)
+        changed[rows] = True
+        stale = changed[self.index]
+        affected = np.zeros(size, dtype=bool)
+        affected[entry_parent[stale]] = True
+        new_parents = parent_pos[rows]
+        affected[new_parents[new_parents >= 0]] = True
+        keep = ~affected[entry_parent]
+        group = np.concatenate((self.index[~keep & ~stale], rows[new_parents >= 0]))
+        group = group[np.lexsort((group, create_time[group], parent_pos[group]))]
+        at = np.searchsorted(entry_parent[keep], parent_pos[group])
+        index = np.insert(self.index[keep], at, group).astype(np.int32)
+        offsets = np.zeros(size + 1, dtype=np.int32)
+        np.cumsum(np.bincount(parent_pos[index], minlength=size), out=offsets[1:])
+        return Children(offsets, index)
+
+    def select(self, mask):
+        """只保留 mask 中的子评论（各组内顺序不变），父评论仍按原行位置索引。"""
+        keep = mask[self.index]
+        kept = np.zeros(len(keep) + 1, dtype=np.int32)
+        np.cumsum(keep, out=kept[1:])
+        return Children(kept[self.offsets], self.index[keep])
+
+    def of(self, pos):
+        return self.index[self.offsets[pos]:self.offsets[pos + 1]]
+
+    def count(self, pos):
+        return int(self.offsets[pos + 1] - self.offsets[pos])
+
+    def counts(self):
+        return np.diff(self.offsets)
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.index.nbytes
+
+
+def walk(roots, children):
+    """按深度优先顺序展开评论串，返回 (行位置, 父评论行位置, 深度, 在兄弟中的序号) 四个数组。
+
+    用显式栈遍历，不受递归深度限制；顶级评论的父评论位置为-1，序号从1开始。
+    """
+    offsets, index = children.offsets, children.index
+    positions, parents, depths, ranks = [], [], [], []
+    stack = [(-1, 0, enumerate(np.asarray(roots).tolist(), start=1))]
+    while stack:
+        parent, depth, siblings = stack[-1]
+        for rank, pos in siblings:
+            positions.append(pos)
+            parents.append(parent)
+            depths.append(depth)
+            ranks.append(rank)
+            start, end = offsets[pos], offsets[pos + 1]
+            if end > start:
+                # 先展开更深层的回复，再回到本层继续
+                stack.append((pos, depth + 1, enumerate(index[start:end].tolist(), start=1)))
+                break
+        else:
+            stack.pop()
+    return (np.array(positions, dtype=np.int64), np.array(parents, dtype=np.int64),
+            np.array(depths, dtype=np.int64), np.array(ranks, dtype=np.int64))
+
+
+class CommentStore:
+    """按行位置访问的评论数据，行顺序即加载顺序（追加的行排在后面，已有行的位置不变）。"""
+
+    def __init__(self, tz_name=DISPLAY_TIMEZONE):
+        self.tz_name = tz_name
+        self.size = 0
+        self.columns = {field: compact_column(field, []) for field in TEXT_FIELDS}
+        self.create_time = np.empty(0, dtype=np.int64)
+        self.parent_pos = np.empty(0, dtype=np.int32)
+        self.children = Children(np.zeros(1, dtype=np.int32), np.empty(0, dtype=np.int32))
+        self.ids = IdIndex()
+        self.growth = {}  # create_time 与 parent_pos 的追加缓冲
+        self.up_host_id = None
+        self.per_video_host = False  # 为真时每个视频分别以其第一个顶级评论的用户为Up主
+        # Up主所在的行与其用户编号（per_video_host 时按视频编号，末尾一个位置给缺失的video_id），见 find_hosts
+        self.host_rows = None
+        self.host_users = None
+        self.rating_params = None  # 当前评级所用的 (low, high, per_video_host)，尚未评级时为None
+        self.unrated = []  # 上次评级之后有变化、需要重新评级的行位置数组（见 update_ratings）
+        self.source_time = None  # 读取时略去的列（见 defer）所对应的源文件各行的create_time
+
+    @classmethod
+    def from_table(cls, table, tz_name=DISPLAY_TIMEZONE):
+        # table 为 build_comment_table/make_table 构建的评论表
+        store = cls(tz_name)
+        store.append_table(table)
+        return store
+
+    def __len__(self):
+        return self.size
+
+    def snapshot(self):
+        """快照，供导出等后台任务读取，之后的刷新不影响快照；刷新也在快照上进行，完成后换上。
+
+        更新数据时总是换上新的列与数组而不原地修改，快照只需复制列的字典，不复制数据。
+        """
+        snapshot = copy.copy(self)
+        snapshot.columns = dict(self.columns)
+        snapshot.growth = dict(self.growth)
+        snapshot.ids = IdIndex(self.ids.hashes, self.ids.order)
+        return snapshot
+
+    def append_table(self, table):
+        """追加评论表中的行（评论ID需已去重）并链接父子关系，返回因此找到父评论的已有行。
+
+        第一次加入时整体链接；之后只为新行查找父评论，子评论表只重排涉及的父评论。
+        """
+        with stage("构建存储", rows=len(table)):
+            start = self.size
+            for field in TEXT_FIELDS:
+                values = table[field].array
+                # 列的保存方式由第一次加入的数据决定
+                if start:
+                    column = self.columns[field]
+                    if not isinstance(column, IntColumn) and pd.api.types.is_integer_dtype(values.dtype):
+                        # 之前的块中该列有非整数的值而按文本保存（见 parse_integers），整数也按文本追加
+                        values = integer_text(values)
+                    self.columns[field] = column.append(values)
+                else:
+                    self.columns[field] = compact_column(field, values)
+            self.create_time, self.growth["create_time"] = extend_array(
+                self.create_time, self.growth.get("create_time"), table["create_time"].to_numpy(dtype=np.int64))
+            self.size += len(table)
+            ids = table["comment_id"].to_numpy(dtype=object)
+            self.ids.add(ids, start)
+            if not start:
+                self.link()
+                return np.empty(0, dtype=np.int64)
+            return self.link_rows(start, ids)
+
+    def defer(self, file_path, fields=DEFERRED_COLUMNS, source_time=None):
+        """fields 为读取时略去的列，改为第一次取值（导出）时再从源文件读取。
+
+        按 source_time（默认为当前各行的create_time）校验读到的行与已加载的行一一对应。
+        """
+        self.source_time = self.create_time if source_time is None else source_time
+        for field in fields:
+            load = functools.partial(read_column, file_path, field, self.source_time)
+            self.columns[field] = DeferredColumn(field, load, len(self.source_time))
+
+    def add_rows(self, chunk):
+        """加入一块原始数据（流式加载），与已有ID重复的评论按行号改名，返回缺失video_id的评论ID。"""
+        check_columns(chunk)
+        chunk = clean_create_time(chunk)
+        raw_ids = chunk["comment_id"].astype(object).tolist()
+        existing = set()
+        if self.size:
+            found = self.ids.lookup(raw_ids, self.columns["comment_id"]) >= 0
+            existing = {comment_id for comment_id, hit in zip(raw_ids, found.tolist()) if hit}
+        ids = rename_duplicate_ids(raw_ids, chunk.index, existing)
+        table, missing_video_id = make_table(chunk, ids, self.tz_name)
+        self.append_table(table)
+        return missing_video_id
+
+    def link(self):
+        # 父评论ID按不同值查找行位置，再按时间顺序建立子评论表
+        parents = self.columns["parent_comment_id"]
+        parent_of_code = self.ids.lookup(np.asarray(parents.categories), self.columns["comment_id"])
+        self.parent_pos = np.append(parent_of_code, -1)[parents.codes].astype(np.int32)
+        self.growth["parent_pos"] = None
+        self.children = Children.build(self.parent_pos, self.time_order())
+
+    def link_rows(self, start, ids):
+        """为 start 之后的新行（评论ID为 ids）查找父评论，返回父评论ID属于新行、因而不再是顶级的已有行。
+
+        新行与这些行记入 unrated，由 update_ratings 重新评级。
+        """
+        parents = self.columns["parent_comment_id"]
+        rows = np.arange(start, self.size)
+        parent_pos = self.ids.lookup(parents.take(rows), self.columns["comment_id"]).astype(np.int32)
+        self.parent_pos, self.growth["parent_pos"] = extend_array(self.parent_pos, self.growth.get("parent_pos"), parent_pos)
+        # 先于父评论读到的回复：父评论ID是某个新行的评论ID的已有顶级评论
+        lookup = parents.value_codes()
+        wanted = np.array([lookup.get(comment_id, -1) for comment_id in ids.tolist()], dtype=np.int64)
+        orphans = np.flatnonzero(self.parent_pos[:start] < 0)
+        adopted = orphans[np.isin(parents.codes[orphans], wanted[wanted >= 0])]
+        if len(adopted):
+            # 快照可能持有原数组，改写已有的行时复制
+            self.parent_pos = self.parent_pos.copy()
+            self.parent_pos[adopted] = self.ids.lookup(parents.take(adopted), self.columns["comment_id"])
+            self.growth["parent_pos"] = None
+        changed = np.concatenate((rows, adopted))
+        self.children = self.children.regroup(self.parent_pos, self.create_time, changed)
+        self.unrated = self.unrated + [changed]
+        return adopted
+
+    def time_order(self):
+        # 按create_time的稳定排序，时间相同时保持行顺序
+        return np.argsort(self.create_time, kind="stable")
+
+    def rate(self, low=10, high=100):
+        """按第一个顶级评论确定Up主并计算全部评级，规则与 rate_comments 相同。"""
+        with stage("评级", rows=self.size):
+            is_top = self.parent_pos < 0
+            self.find_hosts()
+            count_second, count_third = reply_counts(self.parent_pos)
+            is_up = self.is_up(np.arange(self.size))
+            ratings = select_ratings(is_up, is_top, count_second, count_third, low, high)
+            self.columns["rating"] = CodedColumn.from_values(ratings)
+            self.rating_params = (low, high, self.per_video_host)
+            self.unrated = []
+
+    def mark_rated(self, low=10, high=100):
+        """评级已在别处算好（读取缓存、合并分区）时调用：确定Up主并记下评级参数，之后可以增量评级。"""
+        self.find_hosts()
+        self.rating_params = (low, high, self.per_video_host)
+        self.unrated = []
+
+    def update_ratings(self, low=10, high=100):
+        """重新评级上次评级之后有变化的行（unrated）及其父评论与祖父评论，返回 (可能变化的行位置, 是否全部重新评级)。
+
+        其它行的回复数、三级回复数都不变；阈值或Up主变化时全部重新评级。
+        """
+        if self.rating_params != (low, high, self.per_video_host):
+            self.rate(low, high)
+            return np.arange(self.size), True
+        rows = np.unique(np.concatenate(self.unrated)) if self.unrated else np.empty(0, dtype=np.int64)
+        if not len(rows):
+            return rows, False
+        if self.update_hosts(rows):
+            self.rate(low, high)
+            return np.arange(self.size), True
+        with stage("评级", rows=len(rows)):
+            parents = self.parent_pos[rows]
+            parents = parents[parents >= 0]
+            grandparents = self.parent_pos[parents]
+            rows = np.unique(np.concatenate((rows, parents, grandparents[grandparents >= 0])))
+            offsets, index = self.children.offsets, self.children.index
+            starts, ends = offsets[rows].astype(np.int64), offsets[rows + 1].astype(np.int64)
+            count_second = ends - starts
+            # 各行的子评论在 index 中连续，展开后按所属的行累加子评论的回复数
+            entries = np.repeat(starts - np.cumsum(count_second) + count_second, count_second) + np.arange(count_second.sum())
+            children = index[entries]
+            count_third = np.bincount(np.repeat(np.arange(len(rows)), count_second),
+                                      weights=offsets[children + 1] - offsets[children], minlength=len(rows))
+            ratings = select_ratings(self.is_up(rows), self.parent_pos[rows] < 0, count_second,
+                                     count_third.astype(np.int64), low, high)
+            self.columns["rating"] = self.columns["rating"].set(rows, ratings)
+            self.unrated = []
+        return rows, False
+
+    def find_hosts(self):
+        """确定Up主（第一个顶级评论的用户）；per_video_host 时还按视频记下各视频第一个顶级评论的行。"""
+        self.up_host_id = self.find_up_host()
+        if self.per_video_host:
+            videos = self.columns["video_id"].codes
+            top_rows = np.flatnonzero(self.parent_pos < 0)
+            found, first = np.unique(videos[top_rows], return_index=True)
+            # 末尾多留一个位置给缺失的video_id（编号-1），没有顶级评论的视频没有Up主
+            hosts = np.full(len(self.columns["video_id"].categories) + 1, -1, dtype=np.int64)
+            hosts[found] = top_rows[first]
+        else:
+            is_top = self.parent_pos < 0
+            hosts = np.array([np.argmax(is_top) if is_top.any() else -1], dtype=np.int64)
+        self.set_hosts(hosts)
+
+    def set_hosts(self, hosts):
+        self.host_rows = hosts
+        self.host_users = np.full(len(hosts), -1, dtype=np.int64)
+        found = hosts >= 0
+        self.host_users[found] = self.columns["user_id"].codes[hosts[found]]
+
+    def update_hosts(self, rows):
+        """rows 有变化后更新Up主，返回Up主（per_video_host 时为任一已有视频的Up主）是否改变。"""
+        old_rows, old_users = self.host_rows, self.host_users
+        if old_rows is None or np.isin(rows, old_rows[old_rows >= 0]).any():
+            # Up主所在的行本身有变化（不再是顶级评论、换了视频或用户），重新查找
+            self.find_hosts()
+        else:
+            if self.per_video_host:
+                hosts = np.full(len(self.columns["video_id"].categories) + 1, -1, dtype=np.int64)
+                hosts[:len(old_rows) - 1] = old_rows[:-1]
+                hosts[-1] = old_rows[-1]
+            else:
+                hosts = old_rows.copy()
+            # 其余的行只可能成为更靠前的顶级评论
+            top = rows[self.parent_pos[rows] < 0]
+            slots = self.columns["video_id"].codes[top] if self.per_video_host else np.zeros(len(top), dtype=np.int64)
+            first = np.where(hosts >= 0, hosts, self.size)
+            np.minimum.at(first, slots, top)
+            self.set_hosts(np.where(first < self.size, first, -1))
+            found = self.host_rows[self.host_rows >= 0]
+            self.up_host_id = self.columns["user_id"][int(found.min())] if len(found) else None
+        if old_users is None:
+            return True
+        new_users = self.host_users
+        return bool((new_users[:len(old_users) - 1] != old_users[:-1]).any() or new_users[-1] != old_users[-1])
+
+    def is_up(self, rows):
+        # rows 各行是否为Up主（per_video_host 时为所在视频的Up主），按用户编号比较
+        users = self.columns["user_id"].codes[rows]
+        slots = self.columns["video_id"].codes[rows] if self.per_video_host else 0
+        return (users >= 0) & (self.host_users[slots] == users)
+
+    def find_up_host(self):
+        # 确定Up主的user_id（假设第一个顶级评论来自Up主）
+        top_level = np.flatnonzero(self.parent_pos < 0)
+        if len(top_level):
+            return self.columns["user_id"][top_level[0]]
+        return None
+
+    def top_level(self, reverse=False, mask=None):
+        """顶级评论的行位置，按create_time排序（稳定，reverse 时时间相同的仍保持行顺序）。
+
+        mask 为搜索命中的行时，父评论未命中的命中行视为顶级评论。
+        """
+        if mask is None:
+            rows = np.flatnonzero(self.parent_pos < 0)
+        else:
+            has_parent = self.parent_pos >= 0
+            parent_matched = np.zeros(self.size, dtype=bool)
+            parent_matched[has_parent] = mask[self.parent_pos[has_parent]]
+            rows = np.flatnonzero(mask & ~parent_matched)
+        keys = self.create_time[rows]
+        return rows[np.argsort(-keys if reverse else keys, kind="stable")]
+
+    def build_children(self, order=None, mask=None):
+        # 按 order 的顺序（默认按时间）建立子评论表，给出 mask 时只含命中的行
+        if order is None:
+            # 已有的子评论表就是按时间排列的，直接筛选，无需重新排序
+            return self.children if mask is None else self.children.select(mask)
+        if mask is not None:
+            order = order[mask[order]]
+        return Children.build(self.parent_pos, order)
+
+    def value(self, field, pos):
+        if field == "create_time":
+            return int(self.create_time[pos])
+        if field == "time_str":
+            return format_timestamp(int(self.create_time[pos]), self.tz_name)
+        return self.columns[field][pos]
+
+    def take(self, field, positions):
+        if field == "create_time":
+            return self.create_time[positions]
+        if field == "time_str":
+            return format_timestamps(self.create_time[positions], self.tz_name)
+        return self.columns[field].take(positions)
+
+    def __getitem__(self, field):
+        # 整列，供排序、搜索等需要全部值的计算使用
+        return pd.Series(self.take(field, np.arange(self.size)))
+
+    def table(self, start=0, stop=None):
+        """第 start 到 stop 行的评论表，列与 COMMENT_FIELDS 一致（time_str 按当前时区生成）。"""
+        positions = np.arange(start, self.size if stop is None else min(stop, self.size))
+        return pd.DataFrame({field: self.take(field, positions) for field in COMMENT_FIELDS}, columns=COMMENT_FIELDS)
+
+    def apply_rows(self, chunk, low=10, high=100):
+        """应用刷新时新读到的行，返回变化情况。
+
+        已有的评论ID不会被改名为新评论：last_modify_ts 变化时原地更新原评论，
+        否则视为重复读取而忽略；同一ID在本块中出现多次时只取最后一行。
+        返回字典（评论均为行位置数组）：added（新增）、modified（有更新）、
+        moved（其中父评论或时间变化、需要重新放置的）、adopted（因父评论出现而
+        不再是顶级的）、rated（评级或回复数变化的其它评论）、rerated_all（Up主或阈值变化，全部重新评级）、
+        missing_video_id（新增评论中缺失video_id的评论ID）。
+        """
+        check_columns(chunk)
+        chunk = clean_create_time(chunk)
+        chunk = chunk[~chunk["comment_id"].astype(object).duplicated(keep="last")]
+        table, missing_video_id = make_table(chunk, chunk["comment_id"].astype(object).tolist(), self.tz_name)
+        positions = self.ids.lookup(table["comment_id"].to_numpy(dtype=object), self.columns["comment_id"])
+        is_new = positions < 0
+
+        # 已有评论中 last_modify_ts 变化的视为更新
+        rows = table[~is_new]
+        old_ts = self.columns["last_modify_ts"].take(positions[~is_new])
+        new_ts = rows["last_modify_ts"].to_numpy(dtype=object)
+        changed = ~((old_ts == new_ts) | (pd.isna(old_ts) & pd.isna(new_ts)))
+        rows = rows[changed]
+        modified = positions[~is_new][changed]
+        relocated = (
+            (self.columns["parent_comment_id"].take(modified) != rows["parent_comment_id"].to_numpy(dtype=object))
+            | (self.create_time[modified] != rows["create_time"].to_numpy(dtype=np.int64))
+        )
+        moved = modified[relocated]
+
+        old_size = self.size
+        old_children = self.children
+        old_rating = self.columns["rating"]
+        if len(modified):
+            self.update_rows(modified, rows, moved)
+        adopted = np.empty(0, dtype=np.int64)
+        if is_new.any():
+            adopted = self.append_table(table[is_new].reset_index(drop=True))
+        rerated, rerated_all = self.update_ratings(low, high)
+
+        # 原先是顶级、现在找到了父评论的评论（不含本身被移动的）
+        adopted = np.setdiff1d(adopted, moved)
+        # 重新评级的已有行中回复数或评级有变化的
+        old = rerated[rerated < old_size]
+        rated = old[
+            (np.diff(old_children.offsets)[old] != self.children.offsets[old + 1] - self.children.offsets[old])
+            | (old_rating.take(old) != self.columns["rating"].take(old))
+        ]
+        rated = np.setdiff1d(rated, np.concatenate((modified, adopted)))
+        new_ids = set(table["comment_id"][is_new].tolist())
+        return {
+            "added": np.arange(old_size, self.size),
+            "modified": modified,
+            "moved": moved,
+            "adopted": adopted,
+            "rated": rated,
+            "rerated_all": rerated_all,
+            "missing_video_id": [comment_id for comment_id in missing_video_id if comment_id in new_ids],
+        }
+
+    def update_rows(self, positions, table, moved):
+        """用 table 中的新值替换已有的行（评论ID不变）；moved 为其中父评论或时间变化的行，重新链接并放置。"""
+        for field in TEXT_FIELDS:
+            if field not in ("comment_id", "rating"):
+                self.columns[field] = self.columns[field].set(positions, table[field].to_numpy(dtype=object))
+        # 快照可能持有原数组，改写已有的行时复制
+        self.create_time = self.create_time.copy()
+        self.create_time[positions] = table["create_time"].to_numpy(dtype=np.int64)
+        self.growth["create_time"] = None
+        old_parents = self.parent_pos[moved]
+        if len(moved):
+            self.parent_pos = self.parent_pos.copy()
+            self.parent_pos[moved] = self.ids.lookup(self.columns["parent_comment_id"].take(moved), self.columns["comment_id"])
+            self.growth["parent_pos"] = None
+            self.children = self.children.regroup(self.parent_pos, self.create_time, moved)
+        # 原来的父评论少了回复，也要重新评级
+        self.unrated = self.unrated + [positions, old_parents[old_parents >= 0].astype(np.int64)]
+
+    @property
+    def nbytes(self):
+        return (sum(column.nbytes for column in self.columns.values()) + self.create_time.nbytes
+                + self.parent_pos.nbytes + self.children.nbytes + self.ids.nbytes)
+
+
+def build_store(df, tz_name=DISPLAY_TIMEZONE, low=10, high=100, per_video_host=False):
+    """由读取的原始数据构建评论存储并评级，返回 (CommentStore, 缺失video_id的评论ID列表)。"""
+    with stage("构建评论表", rows=len(df)):
+        _, table, missing_video_id = build_comment_table(df, tz_name)
+    store = CommentStore.from_table(table, tz_name)
+    del table
+    store.per_video_host = per_video_host
+    store.rate(low, high)
+    return store, missing_video_id
+
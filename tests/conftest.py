@@ -0,0 +1,51 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# 各模块是仓库根目录下的同级模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import generate_comments  # noqa: E402
+
+
+def make_messy(rows=3000, seed=0, duplicate_rate=0.02, videos=12):
+    """带各种脏数据的模拟评论（全部为文本列，与按文本读取的结果相同）。
+
+    含重复的comment_id、缺失的字段、无法解析或带小数的create_time、以自身为父评论的回复、
+    带空白或为空的video_id。video_id 不含缺失值：逐行的原始实现不能处理缺失的video_id。
+    """
+    df = generate_comments(rows, "wide", duplicate_rate=duplicate_rate, missing_video_rate=0.03, seed=seed)
+    rng = np.random.default_rng(seed + 1)
+    # 评论分属多个视频（生成器每十万行才有一个视频）
+    videos = np.array([f"BV1test{i:04d}" for i in range(videos)], dtype=object)
+    df["video_id"] = np.where(df["video_id"] == "", "", videos[rng.integers(0, len(videos), rows)])
+
+    def pick(share):
+        return rng.random(rows) < share
+
+    for field in ("content", "nickname", "user_id", "avatar", "sub_comment_count", "last_modify_ts",
+                  "parent_comment_id"):
+        df.loc[pick(0.01), field] = np.nan
+    df.loc[pick(0.01), "create_time"] = "abc"
+    df.loc[pick(0.005), "create_time"] = np.nan
+    df.loc[pick(0.005), "create_time"] = "1700000123.0"
+    df.loc[pick(0.01), "video_id"] = "  " + df["video_id"] + " "
+    df.loc[pick(0.01), "video_id"] = "   "
+    self_parent = pick(0.005)
+    df.loc[self_parent, "parent_comment_id"] = df.loc[self_parent, "comment_id"]
+    return df
+
+
+@pytest.fixture
+def messy_df():
+    return make_messy()
+
+
+@pytest.fixture
+def messy_csv(tmp_path):
+    # 写入CSV后缺失的video_id也变为缺失值
+    path = tmp_path / "comments.csv"
+    make_messy().to_csv(path, index=False)
+    return str(path)
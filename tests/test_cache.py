@@ -0,0 +1,119 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from benchmark import same_store
+from comment_cache import cache_dir, entry_dir, evict, file_signature, load_dataset, store_dataset
+from comment_core import LOAD_COLUMNS, read_comments_csv
+from comment_db import database_path, import_csv
+import comment_store
+from comment_store import DeferredColumn, build_store
+from conftest import make_messy
+from test_store import modify
+
+PARAMS = {"low": 10, "high": 100, "per_video_host": False}
+
+
+def test_round_trip(messy_csv):
+    store, _ = build_store(read_comments_csv(messy_csv)[0])
+    store_dataset(messy_csv, store, PARAMS, file_signature(messy_csv))
+    loaded = load_dataset(messy_csv, PARAMS)
+    assert same_store(loaded, store)
+    assert load_dataset(messy_csv, dict(PARAMS, low=5)) is None
+
+
+def test_refresh_after_hit(tmp_path):
+    # 命中时数组以只读方式映射，刷新改写已有的行时换上新数组，不写入缓存文件
+    df = make_messy(3000, duplicate_rate=0)
+    old, new = df.iloc[:2000], df.iloc[2000:]
+    path = str(tmp_path / "comments.csv")
+    old.to_csv(path, index=False)
+    store, _ = build_store(read_comments_csv(path)[0])
+    store_dataset(path, store, PARAMS, file_signature(path))
+    loaded = load_dataset(path, PARAMS)
+    valid = np.flatnonzero(pd.to_numeric(old["create_time"], errors="coerce").notna())
+    changed = modify(old, valid[::7])
+    loaded.apply_rows(pd.concat([changed, new]).astype(object))
+
+    final = pd.concat([old.drop(index=changed.index), changed]).sort_index()
+    expected, _ = build_store(pd.concat([final, new]).astype(object))
+    assert same_store(loaded, expected)
+    assert same_store(load_dataset(path, PARAMS), store)
+
+
+def append_row(file_path):
+    with open(file_path, "a", encoding="utf-8") as f:
+        f.write("1,0,1700000000,BV1,追加,1,u,,0,0\n")
+
+
+def test_changed_source_misses(messy_csv):
+    store, _ = build_store(read_comments_csv(messy_csv)[0])
+    store_dataset(messy_csv, store, PARAMS, file_signature(messy_csv))
+    append_row(messy_csv)
+    assert load_dataset(messy_csv, PARAMS) is None
+
+
+def test_append_during_load_misses(messy_csv):
+    # 读取期间追加的行不在存储中，缓存按读取前的签名写入，下次打开时不会命中
+    signature = file_signature(messy_csv)
+    store, _ = build_store(read_comments_csv(messy_csv)[0])
+    append_row(messy_csv)
+    store_dataset(messy_csv, store, PARAMS, signature)
+    assert load_dataset(messy_csv, PARAMS) is None
+
+
+def test_deferred_column_is_not_cached(messy_csv):
+    full, _ = build_store(read_comments_csv(messy_csv)[0])
+    store, _ = build_store(read_comments_csv(messy_csv, LOAD_COLUMNS)[0])
+    store.defer(messy_csv)
+    store_dataset(messy_csv, store, PARAMS, file_signature(messy_csv))
+    assert not any(name.startswith("avatar") for name in os.listdir(entry_dir(messy_csv)))
+    loaded = load_dataset(messy_csv, PARAMS)
+    assert isinstance(loaded.columns["avatar"], DeferredColumn)
+    assert same_store(loaded, full)
+    rows = np.arange(len(full))
+    assert np.array_equal(loaded.take("avatar", rows).astype(str), full.take("avatar", rows).astype(str))
+
+
+def test_refresh_keeps_deferred_column_unread(tmp_path, monkeypatch):
+    # 刷新追加、修改行时不读取源文件中略去的列，写入缓存后再打开也不读取
+    df = make_messy(3000, duplicate_rate=0)
+    old, new = df.iloc[:2000], df.iloc[2000:]
+    changed = old.iloc[::50].assign(content="（已编辑）", avatar="http://edited", last_modify_ts="99")
+    path = str(tmp_path / "comments.csv")
+    pd.concat([old, changed, new]).to_csv(path, index=False)
+    expected_path = str(tmp_path / "expected.csv")
+    pd.concat([old.drop(index=changed.index), changed]).sort_index().pipe(
+        lambda final: pd.concat([final, new])).to_csv(expected_path, index=False)
+    expected, _ = build_store(read_comments_csv(expected_path)[0])
+
+    rows = read_comments_csv(path, LOAD_COLUMNS)[0]
+    reads = []
+    read_column = comment_store.read_column
+    monkeypatch.setattr(comment_store, "read_column", lambda *args: reads.append(args) or read_column(*args))
+    store, _ = build_store(rows.iloc[:2000])
+    store.defer(path)
+    store.apply_rows(read_comments_csv(path)[0].iloc[2000:])
+    avatar = store.columns["avatar"]
+    edited = np.concatenate((avatar.patch_rows, np.arange(avatar.size, len(store))))
+    assert len(avatar.patch_rows)
+    assert np.array_equal(store.take("avatar", edited).astype(str), expected.take("avatar", edited).astype(str))
+    store_dataset(path, store, PARAMS, file_signature(path))
+    loaded = load_dataset(path, PARAMS)
+    assert not reads
+    assert same_store(loaded, expected)
+    assert len(reads) == 1
+
+
+def test_database_counts_toward_limit(messy_csv):
+    # 数据库文件与数据集缓存一同计入容量，按最近使用的先后淘汰
+    db, _ = import_csv(messy_csv)
+    db.close()
+    store, _ = build_store(read_comments_csv(messy_csv)[0])
+    store_dataset(messy_csv, store, PARAMS, file_signature(messy_csv))
+    path = database_path(messy_csv)
+    os.utime(path, (1, 1))
+    evict(cache_dir(messy_csv), max_bytes=os.path.getsize(path) // 2 + 1, keep=entry_dir(messy_csv))
+    assert not os.path.exists(path)
+    assert load_dataset(messy_csv, PARAMS) is not None
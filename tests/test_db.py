@@ -0,0 +1,121 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from comment_cache import cache_dir, evict
+from comment_core import read_comments_csv
+from comment_db import DbQueryEngine, import_csv, open_database
+from comment_query import Query, QueryEngine
+from comment_search import SearchIndex
+from comment_store import build_store
+from conftest import make_messy
+from test_store import modify
+
+
+def same_missing(table):
+    table = table.astype(object)
+    return table.where(table.notna(), None)
+
+
+@pytest.fixture
+def stores(messy_csv):
+    db, db_missing = import_csv(messy_csv, chunk_rows=700)
+    store, missing = build_store(read_comments_csv(messy_csv)[0])
+    assert db_missing == missing
+    yield db, store
+    db.close()
+
+
+def test_import_matches_store(stores):
+    db, store = stores
+    assert len(db) == len(store)
+    assert db.up_host_id == store.up_host_id
+    # 数据库中的缺失值读出为None，存储中为NaN，导出时两者相同
+    pd.testing.assert_frame_equal(same_missing(db.table()), same_missing(store.table()))
+    for pos in range(len(store)):
+        assert np.array_equal(db.children.of(pos), store.children.of(pos))
+        assert db.children.count(pos) == store.children.count(pos)
+
+
+def test_reopen_without_import(stores, messy_csv):
+    db, store = stores
+    reopened = open_database(messy_csv)
+    assert reopened is not None and len(reopened) == len(store)
+    reopened.close()
+
+
+def shown_rows(selection):
+    rows = selection.db.execute("SELECT row, matched FROM shown ORDER BY row")
+    return [row for row, _ in rows], [row for row, matched in rows if matched]
+
+
+def test_queries_match_memory(stores):
+    db, store = stores
+    memory = QueryEngine(store, SearchIndex(store.columns["nickname"], store.columns["content"]))
+    engine = DbQueryEngine(db)
+    text = store.value("content", 5)
+    middle = int(np.median(store.create_time))
+    queries = [
+        Query(text[:1]), Query(text[:2]), Query(text[:4]), Query(text[:4], ratings=["D"]),
+        Query(ratings=["C1", "B1"], end=middle), Query(min_replies=1, max_replies=3),
+        Query(user_id=store.value("user_id", 0)), Query("用户1"),
+    ]
+    for query in queries:
+        hits, mask = memory.run(query)
+        count, selection = engine.run(query)
+        shown, matched = shown_rows(selection)
+        assert count == len(hits)
+        assert matched == hits.tolist()
+        assert shown == np.flatnonzero(mask).tolist()
+
+
+def test_short_queries_fold_non_ascii(tmp_path):
+    # 不足三个字的查询逐行比较，非ASCII字母的大小写也与内存中的搜索一样忽略
+    df = make_messy(400)
+    df.loc[::40, "content"] = "ÄRGER Über"
+    df.loc[5::40, "nickname"] = "ÉCOLE"
+    file_path = tmp_path / "comments.csv"
+    df.to_csv(file_path, index=False)
+    db, _ = import_csv(str(file_path))
+    store, _ = build_store(read_comments_csv(str(file_path))[0])
+    memory = QueryEngine(store)
+    engine = DbQueryEngine(db)
+    for text in ("ä", "üb", "é"):
+        hits, _ = memory.run(Query(text))
+        count, selection = engine.run(Query(text))
+        assert len(hits) and count == len(hits)
+        assert shown_rows(selection)[1] == hits.tolist()
+    db.close()
+
+
+@pytest.mark.parametrize("per_video_host", [False, True])
+@pytest.mark.parametrize("edit", [False, True])
+def test_apply_rows_matches_rebuild(tmp_path, per_video_host, edit):
+    # 刷新只重新评级受影响的行，结果与对更新后的文件整体导入相同
+    df = make_messy(3000, duplicate_rate=0)
+    old, new = df.iloc[:2000], df.iloc[2000:]
+    valid = np.flatnonzero(pd.to_numeric(old["create_time"], errors="coerce").notna())
+    changed = modify(old, valid[::7] if edit else [])
+    old_path, final_path = tmp_path / "old.csv", tmp_path / "final.csv"
+    old.to_csv(old_path, index=False)
+    pd.concat([old.drop(index=changed.index), changed, new]).sort_index().to_csv(final_path, index=False)
+    db, _ = import_csv(str(old_path), per_video_host=per_video_host)
+    db.apply_rows(pd.concat([changed, new]).astype(object))
+
+    # 更新的行留在原位置，新评论追加在后面
+    expected, _ = build_store(read_comments_csv(str(final_path))[0], per_video_host=per_video_host)
+    pd.testing.assert_frame_equal(same_missing(db.table()), same_missing(expected.table()))
+    for pos in range(len(expected)):
+        assert db.children.count(pos) == expected.children.count(pos)
+    db.close()
+
+
+def test_evict_keeps_open_database(stores, messy_csv):
+    db, _ = stores
+    evict(cache_dir(messy_csv), 0)
+    assert os.path.exists(db.path)
+    db.close()
+    evict(cache_dir(messy_csv), 0)
+    assert not os.path.exists(db.path)
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark import same_store
+from comment_core import COMMENT_FIELDS, LOAD_COLUMNS, ingest_comments_rows, iter_csv_chunks, read_comments_csv
+from comment_store import CommentStore, build_store
+from conftest import make_messy
+
+
+def rate_rows(comments, replies, low=10, high=100):
+    # 原先逐条评级的规则（第一个顶级评论的用户为Up主）
+    top_level = [c for c in comments.values() if c["parent_comment_id"] not in comments]
+    up_host_id = top_level[0]["user_id"] if top_level else None
+    ratings = {}
+    for comment_id, comment in comments.items():
+        second = replies.get(comment_id, [])
+        count_second = len(second)
+        count_third = sum(len(replies.get(reply["comment_id"], [])) for reply in second)
+        if comment["user_id"] == up_host_id:
+            rating = "A1" if comment["parent_comment_id"] not in comments else "A2"
+        elif count_second == 0:
+            rating = "D"
+        elif count_second < low:
+            rating = "B1" if count_third > 0 else "C1"
+        elif count_second <= high:
+            rating = "B2" if count_third >= low else "C2"
+        else:
+            rating = "B3" if count_third >= high else "C3"
+        ratings[comment_id] = rating
+    return ratings
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_store_matches_row_by_row(seed):
+    df = make_messy(seed=seed)
+    _, rows_table, comments, replies, rows_missing = ingest_comments_rows(df)
+    store, missing = build_store(df)
+
+    assert len(store) == len(comments)
+    assert missing == rows_missing
+    table = store.table()
+    pd.testing.assert_frame_equal(
+        table.drop(columns="rating"), rows_table.drop(columns="rating"), check_dtype=False
+    )
+
+    # 各评论的回复及其顺序与按父评论ID分组、按时间稳定排序的结果相同
+    ids = table["comment_id"].tolist()
+    for pos, comment_id in enumerate(ids):
+        children = [ids[child] for child in store.children.of(pos)]
+        assert children == [reply["comment_id"] for reply in replies.get(comment_id, [])]
+
+    ratings = rate_rows(comments, replies)
+    assert table["rating"].tolist() == [ratings[comment_id] for comment_id in ids]
+
+
+def test_messy_input_is_messy(messy_df):
+    # 确认对照数据确实覆盖了各类脏数据
+    ids = messy_df["comment_id"]
+    assert ids.duplicated().any()
+    assert (messy_df["parent_comment_id"] == ids).any()
+    assert pd.to_numeric(messy_df["create_time"], errors="coerce").isna().any()
+    assert messy_df["video_id"].str.strip().eq("").any()
+    assert messy_df["content"].isna().any()
+
+
+def test_time_strings_follow_timezone(messy_df):
+    store, _ = build_store(messy_df, "UTC")
+    _, rows_table, _, _, _ = ingest_comments_rows(messy_df, "UTC")
+    assert np.array_equal(store.take("time_str", np.arange(len(store))), rows_table["time_str"].to_numpy())
+    assert list(store.table().columns) == COMMENT_FIELDS
+
+
+def test_non_integer_value_keeps_only_its_column_as_text(tmp_path, monkeypatch):
+    # 数值列中的非整数值只让该列按文本读取，其余整数列仍为可空整数，文件只读一遍
+    df = make_messy(500).assign(create_time=lambda df: pd.to_numeric(df["create_time"], errors="coerce").astype("Int64"))
+    df.loc[300, "sub_comment_count"] = "很多"
+    path = tmp_path / "comments.csv"
+    df.to_csv(path, index=False)
+    reads = []
+    read_csv = pd.read_csv
+    monkeypatch.setattr(pd, "read_csv", lambda *args, **kwargs: reads.append(kwargs.get("nrows")) or read_csv(*args, **kwargs))
+    read, _, _ = read_comments_csv(str(path))
+    assert reads.count(None) == 1
+    assert str(read["create_time"].dtype) == "Int64" and str(read["last_modify_ts"].dtype) == "Int64"
+    assert read["sub_comment_count"].iloc[300] == "很多"
+
+
+def test_streamed_chunks_parse_integers_per_column(messy_csv):
+    # 各块分别解析整数列，有的块中某列按文本保存，结果与整体读取相同
+    expected, _ = build_store(read_comments_csv(messy_csv, LOAD_COLUMNS)[0])
+    store = CommentStore()
+    for chunk, _ in iter_csv_chunks(messy_csv, "utf-8", 100, LOAD_COLUMNS, integers=True):
+        store.add_rows(chunk)
+    store.update_ratings()
+    assert same_store(store, expected)
+
+
+def test_pyarrow_engine_matches_default(messy_csv):
+    # 未安装pyarrow时退回默认解析器，安装时结果与默认解析器相同
+    expected, _ = build_store(read_comments_csv(messy_csv, LOAD_COLUMNS)[0])
+    store, _ = build_store(read_comments_csv(messy_csv, LOAD_COLUMNS, "pyarrow")[0])
+    assert same_store(store, expected)
+
+
+def test_pyarrow_parse_error_is_logged(tmp_path, caplog):
+    # pyarrow不接受字段数多于表头的行，记下原因后由默认解析器读取
+    pytest.importorskip("pyarrow")
+    df = make_messy(200)
+    path = tmp_path / "comments.csv"
+    df.to_csv(path, index=False)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("extra,0,1700000000,BV1,多一列,1,u,,0,0,0\n")
+    read, _, _ = read_comments_csv(str(path), engine="pyarrow")
+    assert len(read) == len(df) + 1
+    assert "pyarrow" in caplog.text
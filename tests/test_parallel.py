@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from benchmark import same_store
+import comment_parallel
+from comment_parallel import build_store_parallel, partition_rows
+from comment_store import Children, CommentStore, build_store
+from conftest import make_messy
+
+
+def thread_videos(df):
+    # 回复与父评论同属一个视频（父评论总在回复之前出现）
+    video_of = {}
+    videos = df["video_id"].tolist()
+    for i, (comment_id, parent_id) in enumerate(zip(df["comment_id"].tolist(), df["parent_comment_id"].tolist())):
+        videos[i] = video_of.get(parent_id, videos[i])
+        video_of.setdefault(comment_id, videos[i])
+    return df.assign(video_id=videos)
+
+
+@pytest.mark.parametrize("per_video_host", [False, True])
+@pytest.mark.parametrize("aligned", [False, True])
+def test_parallel_matches_serial(per_video_host, aligned):
+    df = make_messy(4000)
+    if aligned:
+        df = thread_videos(df)
+    expected, expected_missing = build_store(df, per_video_host=per_video_host)
+    store, missing = build_store_parallel(df, per_video_host=per_video_host, workers=2)
+    assert missing == expected_missing
+    assert same_store(store, expected)
+
+
+def test_single_video_falls_back(messy_df):
+    df = messy_df.assign(video_id="BV1only")
+    expected, _ = build_store(df)
+    store, _ = build_store_parallel(df, workers=2)
+    assert same_store(store, expected)
+
+
+def test_partitions_keep_videos_together():
+    videos = np.array(["a"] * 50 + ["b"] * 30 + ["c"] * 20 + ["d"] * 5, dtype=object)
+    np.random.default_rng(0).shuffle(videos)
+    parts = partition_rows(videos, 3)
+    assert sorted(np.concatenate(parts).tolist()) == list(range(len(videos)))
+    owner = {}
+    for part, rows in enumerate(parts):
+        assert np.all(np.diff(rows) > 0)
+        for video in set(videos[rows]):
+            assert owner.setdefault(video, part) == part
+
+
+def test_merge_keeps_partition_results(monkeypatch):
+    # 回复与父评论同属一个视频时，合并只搬动各分区的结果，不再整体链接或评级（子进程不受替换影响）
+    def fail(*args, **kwargs):
+        raise AssertionError("不应整体重建")
+
+    df = thread_videos(make_messy(4000))
+    expected, _ = build_store(df)
+    monkeypatch.setattr(CommentStore, "link", fail)
+    monkeypatch.setattr(CommentStore, "rate", fail)
+    monkeypatch.setattr(Children, "build", fail)
+    # 文本分多批搬动
+    monkeypatch.setattr(comment_parallel, "GATHER_BYTES", 64)
+    store, _ = build_store_parallel(df, workers=2)
+    monkeypatch.undo()
+    assert same_store(store, expected)
@@ -0,0 +1,24 @@
+import pytest
+
+from comment_query import parse_time
+
+
+def test_parse_time_uses_display_timezone():
+    assert parse_time("2024-01-01 08:00", "Asia/Shanghai") == parse_time("2024-01-01 00:00", "UTC")
+    assert parse_time("  ", "UTC") is None
+
+
+def test_parse_time_keeps_explicit_timezone():
+    # 自带时区的时间不再按显示时区解释，也不报错
+    expected = parse_time("2024-01-01 00:00", "UTC")
+    assert parse_time("2024-01-01T08:00+08:00", "UTC") == expected
+    assert parse_time("2024-01-01T00:00Z", "Asia/Shanghai") == expected
+
+
+def test_parse_time_end_date_includes_whole_day():
+    assert parse_time("2024-01-01", "UTC", end=True) - parse_time("2024-01-01", "UTC") == 86400
+
+
+def test_parse_time_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_time("明天", "UTC")
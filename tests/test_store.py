@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark import same_store
+from comment_store import CommentStore, build_store
+from conftest import make_messy
+
+
+@pytest.mark.parametrize("per_video_host", [False, True])
+@pytest.mark.parametrize("chunk_rows", [1, 97, 1000])
+def test_streamed_chunks_match_full_build(chunk_rows, per_video_host):
+    # 流式加载逐块加入并增量评级，与一次性构建的结果完全相同（含跨块重复ID的改名）
+    df = make_messy(600 if chunk_rows == 1 else 3000)
+    expected, expected_missing = build_store(df, per_video_host=per_video_host)
+    store = CommentStore()
+    store.per_video_host = per_video_host
+    missing = []
+    for start in range(0, len(df), chunk_rows):
+        missing += store.add_rows(df.iloc[start:start + chunk_rows])
+        store.update_ratings()
+    assert missing == expected_missing
+    assert same_store(store, expected)
+
+
+def test_appending_links_only_new_rows(monkeypatch):
+    # 第一块之后不再整体链接、整体评级或重排全部ID，快照不受之后追加的影响
+    df = make_messy(3000)
+    store = CommentStore()
+    store.add_rows(df.iloc[:1000])
+    store.update_ratings()
+    snapshot = store.snapshot()
+    expected_snapshot = snapshot.table()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("不应整体重建")
+
+    argsort = np.argsort
+
+    def argsort_chunk(values, *args, **kwargs):
+        # 只允许排序本块的数据
+        assert len(values) <= 250
+        return argsort(values, *args, **kwargs)
+
+    monkeypatch.setattr(CommentStore, "link", fail)
+    monkeypatch.setattr(CommentStore, "rate", fail)
+    monkeypatch.setattr(np, "argsort", argsort_chunk)
+    for start in range(1000, 3000, 250):
+        store.add_rows(df.iloc[start:start + 250])
+        rows, rerated_all = store.update_ratings()
+        assert not rerated_all and len(rows) < len(store)
+    monkeypatch.undo()
+    assert same_store(store, build_store(df)[0])
+    pd.testing.assert_frame_equal(snapshot.table(), expected_snapshot)
+
+
+def modify(df, rows, seed=0):
+    # 修改若干已有评论：内容与last_modify_ts变化，其中一部分改挂到别的评论下或改了时间
+    rng = np.random.default_rng(seed)
+    changed = df.iloc[rows].copy()
+    changed["content"] = changed["content"].fillna("") + "（已编辑）"
+    changed["last_modify_ts"] = "9" + changed["last_modify_ts"].fillna("0")
+    moved = rng.random(len(changed)) < 0.3
+    changed.loc[moved, "parent_comment_id"] = df["comment_id"].iloc[
+        rng.integers(0, len(df), moved.sum())].to_numpy()
+    retimed = rng.random(len(changed)) < 0.2
+    changed.loc[retimed, "create_time"] = "1600000000"
+    return changed
+
+
+def ratings(store):
+    return store.take("rating", np.arange(len(store)))
+
+
+@pytest.mark.parametrize("per_video_host", [False, True])
+@pytest.mark.parametrize("split", [500, 2500])
+def test_apply_rows_matches_rebuild(split, per_video_host):
+    df = make_messy(3000, duplicate_rate=0)
+    old, new = df.iloc[:split], df.iloc[split:]
+    store, _ = build_store(old, per_video_host=per_video_host)
+    before = ratings(store)
+    # 只修改已加载的行（create_time无效而被丢弃的行改好后会作为新评论追加）
+    valid = np.flatnonzero(pd.to_numeric(old["create_time"], errors="coerce").notna())
+    changed = modify(old, valid[::7])
+
+    changes = store.apply_rows(pd.concat([changed, new]))
+
+    final = pd.concat([old.drop(index=changed.index), changed]).sort_index()
+    expected, _ = build_store(pd.concat([final, new]), per_video_host=per_video_host)
+    assert same_store(store, expected)
+    # 界面只重绘返回的这些行，评级有变化的行都应在其中
+    touched = np.zeros(len(store), dtype=bool)
+    for key in ("added", "modified", "adopted", "rated"):
+        touched[changes[key]] = True
+    if not changes["rerated_all"]:
+        assert not ((before != ratings(store)[:len(before)]) & ~touched[:len(before)]).any()
+
+
+def test_apply_rows_ignores_repeated_rows():
+    df = make_messy(2000, duplicate_rate=0)
+    store, _ = build_store(df)
+    expected, _ = build_store(df)
+    changes = store.apply_rows(df.iloc[100:400])
+    assert same_store(store, expected)
+    assert not len(changes["added"]) and not len(changes["modified"]) and not len(changes["rated"])